@@ -0,0 +1,53 @@
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import fares
+
+def fake_quotes(n, seed=1):
+    rng = random.Random(seed)
+    names = list(fares.FARES)
+    distances = [rng.uniform(0.5, 40) for _ in range(n)]
+    durations = [d * rng.uniform(1.5, 4) for d in distances]
+    tariffs = [rng.choice(names) for _ in range(n)]
+    surges = [rng.choice((1.0, 1.0, 1.2, 1.5, 2.0)) for _ in range(n)]
+    return distances, durations, tariffs, surges
+
+def main():
+    sizes = [int(n) for n in sys.argv[1:]] or [1000, 10000, 100000, 1000000]
+    backend = "numpy " + fares.np.__version__ if fares.np is not None else "без numpy"
+    print(f"Пакетный расчёт: {backend}")
+
+    print(f"{'поездок':>10} {'поштучно, мс':>13} {'пакетом, мс':>12} {'по кодам, мс':>13} {'ускорение':>10}")
+    for n in sizes:
+        distances, durations, tariffs, surges = fake_quotes(n)
+        codes = [list(fares.FARES).index(name) for name in tariffs]
+
+        start = time.perf_counter()
+        scalar = [fares.quote(d, t, name, s) for d, t, name, s in zip(distances, durations, tariffs, surges)]
+        scalar_time = time.perf_counter() - start
+
+        args = (distances, durations, tariffs, surges)
+        coded = (distances, durations, codes, surges)
+        if fares.np is not None:
+            # массивы готовятся заранее, как у вызывающего кода с данными в numpy
+            args = [fares.np.array(a) for a in args]
+            coded = [fares.np.array(a) for a in coded]
+
+        start = time.perf_counter()
+        batch = fares.quote_batch(*args)
+        batch_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        by_codes = fares.quote_batch(*coded)
+        codes_time = time.perf_counter() - start
+
+        assert list(batch) == scalar and list(by_codes) == scalar
+        print(f"{n:>10} {scalar_time * 1000:>13.1f} {batch_time * 1000:>12.1f} {codes_time * 1000:>13.1f} "
+              f"{scalar_time / codes_time:>9.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+# смесь запросов: (доля, метод, путь, тело)
+READS = [
+    (4, 'GET', '/rides?limit=20', None),
+    (2, 'GET', '/passengers?limit=20', None),
+    (2, 'GET', '/stats/rides', None),
+    (1, 'GET', '/tickets?limit=20', None),
+    (1, 'GET', '/stats/tickets', None),
+]
+
+def pick(write_ratio, max_ride):
+    if random.random() < write_ratio:
+        status = random.choice(('pending', 'in_progress', 'completed'))
+        return 'PUT', f'/rides/{random.randint(1, max_ride)}/status', {"status": status}
+    weights = [weight for weight, *_ in READS]
+    _, method, path, body = random.choices(READS, weights)[0]
+    return method, path, body
+
+async def request(reader, writer, host, method, path, body):
+    data = json.dumps(body).encode() if body is not None else b''
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nContent-Length: {len(data)}\r\n\r\n".encode() + data
+    )
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+async def client(host, port, deadline, write_ratio, max_ride, latencies, statuses):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while time.perf_counter() < deadline:
+            method, path, body = pick(write_ratio, max_ride)
+            start = time.perf_counter()
+            status = await request(reader, writer, host, method, path, body)
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+    finally:
+        writer.close()
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+async def run(host, port, concurrency, duration, write_ratio, max_ride):
+    latencies = []
+    statuses = {}
+    deadline = time.perf_counter() + duration
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        client(host, port, deadline, write_ratio, max_ride, latencies, statuses) for _ in range(concurrency)
+    ))
+    elapsed = time.perf_counter() - start
+    print(f"{concurrency:>8} {len(latencies):>9} {len(latencies) / elapsed:>9.0f} "
+          f"{percentile(latencies, 0.5) * 1000:>9.2f} {percentile(latencies, 0.99) * 1000:>9.2f}  {statuses}")
+
+async def local_instance(db_path, db_workers):
+    import main as app
+    from service import TaxiService
+
+    app.set_verbose(False)
+    service = TaxiService(db_path, db_workers=db_workers)
+    server = await service.start('127.0.0.1', 0)
+    return service, server, server.sockets[0].getsockname()[1]
+
+async def bench(args):
+    service = server = None
+    if args.url:
+        url = urlsplit(args.url)
+        host, port = url.hostname, url.port or 80
+    else:
+        # локальный сервис на копии базы, чтобы записи не трогали рабочую
+        db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+        shutil.copy(args.db, db_path)
+        service, server, port = await local_instance(db_path, args.db_workers)
+        host = '127.0.0.1'
+
+    print(f"{'клиентов':>8} {'запросов':>9} {'RPS':>9} {'p50, мс':>9} {'p99, мс':>9}  статусы")
+    try:
+        for concurrency in args.concurrency:
+            await run(host, port, concurrency, args.duration, args.write_ratio, args.max_ride)
+    finally:
+        if server is not None:
+            server.close()
+            await server.wait_closed()
+            service.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест HTTP сервиса такси")
+    parser.add_argument('--url', help="адрес запущенного сервиса; без него поднимается локальный")
+    parser.add_argument('--db', default=os.environ.get('FAKETAXI_DB', 'database.db'))
+    parser.add_argument('--db-workers', type=int, default=8)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32, 64])
+    parser.add_argument('--duration', type=float, default=5.0, help="секунд на каждый уровень")
+    parser.add_argument('--write-ratio', type=float, default=0.1, help="доля PUT /rides/<id>/status")
+    parser.add_argument('--max-ride', type=int, default=1000)
+    asyncio.run(bench(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
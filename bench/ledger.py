@@ -0,0 +1,139 @@
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from db import ConnectionPool, connect, transaction
+import group_commit
+import ledger
+import main as app
+import ride_states
+
+def make_db(path, rides, drivers):
+    rng = random.Random(1)
+    conn = connect(path)
+    app.create_tables(conn)
+    with transaction(conn) as cursor:
+        cursor.executemany("INSERT INTO passengers (full_name, phone) VALUES (?, ?)",
+                           [(f"П{i}", f"+7{i:010d}") for i in range(1000)])
+        cursor.executemany("INSERT INTO drivers (full_name, phone) VALUES (?, ?)",
+                           [(f"В{i}", f"+8{i:010d}") for i in range(drivers)])
+        cursor.executemany(
+            "INSERT INTO rides (passenger_id, driver_id, pickup_location, dropoff_location, price, status) "
+            "VALUES (?, ?, 'A', 'B', ?, 'in_progress')",
+            [(rng.randint(1, 1000), rng.randint(1, drivers), round(rng.uniform(150, 3000), 2)) for _ in range(rides)],
+        )
+    conn.close()
+
+def run(path, threads, rides, drivers):
+    # потоки завершают поездки, параллельно идут выплаты водителям и снимки
+    # балансов; после - сверка журнала с поездками и снимков с журналом
+    pool = ConnectionPool(path, size=threads + 2)
+    done = threading.Event()
+    counts = {'completed': 0, 'busy': 0, 'paid': 0, 'refused': 0, 'snapshots': 0}
+    lock = threading.Lock()
+
+    def complete(i):
+        completed = busy = 0
+        with pool.connection() as conn:
+            for ride_id in range(1 + i, rides + 1, threads):
+                try:
+                    completed += ride_states.transition(conn, ride_id, 'completed')[0]
+                except sqlite3.OperationalError:
+                    busy += 1
+        with lock:
+            counts['completed'] += completed
+            counts['busy'] += busy
+
+    def pay():
+        rng = random.Random(2)
+        with pool.connection() as conn:
+            while not done.is_set():
+                try:
+                    ledger.withdraw(conn, rng.randint(1, drivers), 500)
+                    counts['paid'] += 1
+                except ValueError:
+                    counts['refused'] += 1
+                except sqlite3.OperationalError:
+                    counts['busy'] += 1
+
+    def snapshot():
+        with pool.connection() as conn:
+            while not done.is_set():
+                ledger.snapshot_balances(conn)
+                counts['snapshots'] += 1
+                time.sleep(0.05)
+
+    workers = [threading.Thread(target=complete, args=(i,)) for i in range(threads)]
+    helpers = [threading.Thread(target=pay), threading.Thread(target=snapshot)]
+    for thread in helpers:
+        thread.start()
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    done.set()
+    for thread in helpers:
+        thread.join()
+    pool.close()
+    return counts, elapsed
+
+def check(path, drivers):
+    conn = connect(path)
+    mismatched_drivers, mismatched_rides, mismatched_openings = ledger.check_ledger(conn)
+    negative = sum(ledger.balance(conn, driver_id) < 0 for driver_id in range(1, drivers + 1))
+    expected = conn.execute(
+        f"SELECT TOTAL(ROUND(price * 100) - ROUND(price * {ledger.COMMISSION_PERCENT})) / 100 FROM rides "
+        "WHERE status = 'completed'"
+    ).fetchone()[0]
+    paid = -conn.execute("SELECT TOTAL(amount) FROM driver_ledger WHERE kind = 'withdrawal'").fetchone()[0] / 100
+    total = sum(ledger.balance(conn, driver_id) for driver_id in range(1, drivers + 1))
+
+    # чтение баланса: снимок и хвост против полной суммы журнала водителя
+    start = time.perf_counter()
+    for driver_id in range(1, drivers + 1):
+        ledger.balance(conn, driver_id)
+    snapshot_read = (time.perf_counter() - start) / drivers
+    start = time.perf_counter()
+    for driver_id in range(1, drivers + 1):
+        conn.execute("SELECT SUM(amount) FROM driver_ledger WHERE driver_id = ?", (driver_id,)).fetchone()
+    full_read = (time.perf_counter() - start) / drivers
+    conn.close()
+    return {
+        'расхождений водителей': len(mismatched_drivers),
+        'расхождений поездок': len(mismatched_rides),
+        'расхождений с балансом до журнала': len(mismatched_openings),
+        'в минусе': negative,
+        'начислено - выплачено': round(expected - paid, 2),
+        'сумма балансов': round(total, 2),
+    }, snapshot_read, full_read
+
+def main():
+    rides = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    drivers = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    threads = 16
+    app.set_verbose(False)
+    for grouped in (False, True):
+        path = os.path.join(tempfile.mkdtemp(), 'rides.db')
+        make_db(path, rides, drivers)
+        if grouped:
+            group_commit.enable(path)
+        try:
+            counts, elapsed = run(path, threads, rides, drivers)
+        finally:
+            group_commit.disable()
+        result, snapshot_read, full_read = check(path, drivers)
+        print(f"{'group commit' if grouped else 'отдельные транзакции'}: "
+              f"{counts['completed'] / elapsed:.0f} завершений/с, {counts}")
+        print(f"  сверка: {result}")
+        print(f"  баланс: снимок + хвост {snapshot_read * 1e6:.0f} мкс, весь журнал {full_read * 1e6:.0f} мкс")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, ROOT)
+
+from db import connect, transaction
+import main as app
+import replica
+
+# выгрузка converttojsonxmlcsvyaml.py: все поездки с пассажиром и водителем
+EXPORT_SQL = '''
+SELECT r.*, p.full_name AS passenger_name, p.phone AS passenger_phone,
+       d.full_name AS driver_name, d.car_model, d.car_number
+FROM rides r
+LEFT JOIN passengers p ON r.passenger_id = p.passenger_id
+LEFT JOIN drivers d ON r.driver_id = d.driver_id
+ORDER BY r.ride_id
+'''
+
+def make_db(path, rides):
+    rng = random.Random(1)
+    conn = connect(path)
+    app.create_tables(conn)
+    with transaction(conn) as cursor:
+        cursor.executemany("INSERT INTO passengers (full_name, phone) VALUES (?, ?)",
+                           [(f"П{i}", f"+7{i:010d}") for i in range(10000)])
+        cursor.executemany("INSERT INTO drivers (full_name, phone) VALUES (?, ?)",
+                           [(f"В{i}", f"+8{i:010d}") for i in range(2000)])
+        cursor.executemany(
+            "INSERT INTO rides (passenger_id, driver_id, pickup_location, dropoff_location, price) "
+            "VALUES (?, ?, 'A', 'B', ?)",
+            [(rng.randint(1, 10000), rng.randint(1, 2000), round(rng.uniform(150, 3000), 2)) for _ in range(rides)],
+        )
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+
+def exporter(path, use_replica, seconds, result):
+    # отдельный процесс, как запуск converttojsonxmlcsvyaml.py
+    source = replica.ReadReplica(path, interval=2.0) if use_replica else None
+    deadline = time.time() + seconds
+    exports = 0
+    while time.time() < deadline:
+        if source is not None:
+            conn = connect(source.ensure_fresh().path, readonly=True)
+        else:
+            conn = connect(path, readonly=True)
+        for row in conn.execute(EXPORT_SQL):
+            dict(row)
+        conn.close()
+        exports += 1
+    result.put(exports)
+
+def writer(path, seconds):
+    # запись поездок с замером задержки и размера WAL
+    rng = random.Random(2)
+    conn = connect(path)
+    latencies = []
+    wal_peak = 0
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        start = time.perf_counter()
+        with transaction(conn) as cursor:
+            cursor.execute(
+                "INSERT INTO rides (passenger_id, driver_id, pickup_location, dropoff_location, price) "
+                "VALUES (?, ?, 'A', 'B', ?)", (rng.randint(1, 10000), rng.randint(1, 2000), 500))
+        latencies.append(time.perf_counter() - start)
+        if len(latencies) % 200 == 0:
+            wal_peak = max(wal_peak, os.path.getsize(path + '-wal'))
+    conn.close()
+    latencies.sort()
+    return latencies, wal_peak
+
+def main():
+    rides = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 20
+    app.set_verbose(False)
+    print(f"{'чтение отчётов':>18} {'вставок/с':>10} {'p50, мс':>8} {'p99, мс':>8} {'макс, мс':>9} "
+          f"{'WAL, МБ':>8} {'выгрузок':>9}")
+    for label, use_replica in (("без отчётов", None), ("рабочая база", False), ("копия базы", True)):
+        path = os.path.join(tempfile.mkdtemp(), 'rides.db')
+        make_db(path, rides)
+        result = multiprocessing.Queue()
+        process = None
+        if use_replica is not None:
+            process = multiprocessing.Process(target=exporter, args=(path, use_replica, seconds, result))
+            process.start()
+            time.sleep(0.5)
+        latencies, wal_peak = writer(path, seconds)
+        exports = 0
+        if process is not None:
+            exports = result.get()
+            process.join()
+        count = len(latencies)
+        print(f"{label:>18} {count / seconds:>10.0f} {latencies[count // 2] * 1000:>8.2f} "
+              f"{latencies[int(count * 0.99)] * 1000:>8.2f} {latencies[-1] * 1000:>9.1f} "
+              f"{wal_peak / 2 ** 20:>8.1f} {exports:>9}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import gc
+import importlib
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, ROOT)
+
+from db import connect, transaction
+import migrations
+
+# class - ключевое слово, модуль импортируется по имени
+model = importlib.import_module('class')
+
+COLUMNS = ('ride_id', 'passenger_id', 'driver_id', 'pickup_location', 'dropoff_location', 'price',
+           'created_at', 'completed_at', 'status', 'support_id', 'version')
+SQL = f"SELECT {', '.join(COLUMNS)} FROM rides"
+
+class DictRide:
+    # прежний Ride из class.py: атрибуты в __dict__
+    def __init__(self, ride_id, passenger_id, driver_id, pickup_location, dropoff_location, price, created_at,
+                 completed_at, status, support_id=None, version=0):
+        self.ride_id = ride_id
+        self.passenger_id = passenger_id
+        self.driver_id = driver_id
+        self.pickup_location = pickup_location
+        self.dropoff_location = dropoff_location
+        self.price = price
+        self.created_at = created_at
+        self.completed_at = completed_at
+        self.status = status
+        self.support_id = support_id
+        self.version = version
+
+def make_db(path, rides):
+    rng = random.Random(1)
+    places = [f"улица {i}, дом {rng.randint(1, 120)}" for i in range(2000)]
+    statuses = ('pending', 'in_progress', 'completed', 'completed', 'completed', 'cancelled')
+    conn = connect(path)
+    migrations.migrate(conn)
+    with transaction(conn) as cursor:
+        cursor.executemany("INSERT INTO passengers (full_name, phone) VALUES (?, ?)",
+                           [(f"П{i}", f"+7{i:010d}") for i in range(5000)])
+        cursor.executemany("INSERT INTO drivers (full_name, phone) VALUES (?, ?)",
+                           [(f"В{i}", f"+8{i:010d}") for i in range(1000)])
+        rows = []
+        for i in range(rides):
+            status = rng.choice(statuses)
+            created = f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00"
+            rows.append((rng.randint(1, 5000), rng.randint(1, 1000), rng.choice(places), rng.choice(places),
+                         round(rng.uniform(150, 3000), 2), created, created if status == 'completed' else None, status))
+        cursor.executemany(
+            "INSERT INTO rides (passenger_id, driver_id, pickup_location, dropoff_location, price, created_at, "
+            "completed_at, status) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    conn.close()
+
+# кэш диспетчера: ride_id -> поездка
+def load_tuples(conn):
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    return {row[0]: row for row in cursor.execute(SQL)}
+
+def load_rows(conn):
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    return {row[0]: row for row in cursor.execute(SQL)}
+
+def load_dict_objects(conn):
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    return {row[0]: DictRide(*row) for row in cursor.execute(SQL)}
+
+def load_slots(conn):
+    return {ride.ride_id: ride for ride in model.query(conn, model.Ride, SQL)}
+
+MODES = (
+    ('кортежи', load_tuples),
+    ('sqlite3.Row', load_rows),
+    ('объекты с __dict__', load_dict_objects),
+    ('Ride со __slots__', load_slots),
+)
+
+def measure(path, load):
+    conn = connect(path)
+    gc.collect()
+    start = time.perf_counter()
+    cache = load(conn)
+    elapsed = time.perf_counter() - start
+    one = next(iter(cache.values()))
+    size = sys.getsizeof(one) + (sys.getsizeof(one.__dict__) if hasattr(one, '__dict__') else 0)
+    del cache
+    gc.collect()
+
+    # память отдельным проходом: tracemalloc замедляет загрузку в разы
+    tracemalloc.start()
+    cache = load(conn)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    count = len(cache)
+    del cache
+    conn.close()
+    return count, elapsed, size, current
+
+def main():
+    rides = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    path = os.path.join(tempfile.mkdtemp(), 'rides.db')
+    make_db(path, rides)
+    print(f"{'представление':>20} {'загрузка, с':>12} {'объект, Б':>10} {'на поездку, Б':>14} {'всего, МБ':>10}")
+    for label, load in MODES:
+        count, elapsed, size, total = measure(path, load)
+        print(f"{label:>20} {elapsed:>12.2f} {size:>10} {total / count:>14.0f} {total / 2 ** 20:>10.1f}")
+
+if __name__ == "__main__":
+    main()
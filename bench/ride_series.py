@@ -0,0 +1,101 @@
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from db import connect, transaction
+import migrations
+import ride_series
+
+# почасовой ряд за месяц прямо по rides: индекс по created_at сужает
+# выборку до месяца, но группировать всё равно приходится каждую поездку
+HOURLY_SQL = '''
+SELECT strftime('%Y-%m-%d %H:00', created_at) AS bucket, COUNT(*),
+       SUM(status = 'completed'), SUM(status = 'cancelled'),
+       ROUND(TOTAL(CASE WHEN status = 'completed' THEN price END), 2)
+FROM rides
+WHERE created_at >= ? AND created_at < ?
+GROUP BY bucket
+'''
+
+def make_db(path, rides):
+    # поездки вставляются до триггеров, агрегаты считаются одним проходом
+    rng = random.Random(1)
+    statuses = ('pending', 'in_progress', 'completed', 'completed', 'completed', 'cancelled')
+    conn = connect(path)
+    migrations.migrate(conn)
+    with transaction(conn) as cursor:
+        cursor.executemany("INSERT INTO passengers (full_name, phone) VALUES (?, ?)",
+                           [(f"П{i}", f"+7{i:010d}") for i in range(10000)])
+        cursor.executemany("INSERT INTO drivers (full_name, phone) VALUES (?, ?)",
+                           [(f"В{i}", f"+8{i:010d}") for i in range(2000)])
+    rows = []
+    for _ in range(rides):
+        status = rng.choice(statuses)
+        minute = rng.randrange(365 * 24 * 60)
+        created = f"2025-{minute // 43200 % 12 + 1:02d}-{minute // 1440 % 28 + 1:02d} {minute // 60 % 24:02d}:{minute % 60:02d}:00"
+        completed = f"{created[:14]}{minute % 60:02d}:59" if status == 'completed' else None
+        rows.append((rng.randint(1, 10000), rng.randint(1, 2000), round(rng.uniform(150, 3000), 2), status,
+                     created, completed))
+        if len(rows) == 100000:
+            _insert(conn, rows)
+            rows = []
+    _insert(conn, rows)
+    return conn
+
+def _insert(conn, rows):
+    with transaction(conn) as cursor:
+        cursor.executemany(
+            "INSERT INTO rides (passenger_id, driver_id, pickup_location, dropoff_location, price, status, "
+            "created_at, completed_at) VALUES (?, ?, 'A', 'B', ?, ?, ?, ?)", rows)
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+def main():
+    rides = int(sys.argv[1]) if len(sys.argv) > 1 else 10000000
+    path = os.path.join(tempfile.mkdtemp(), 'rides.db')
+    conn, elapsed = timed(make_db, path, rides)
+    print(f"База {rides} поездок: {elapsed:.1f} с")
+    _, elapsed = timed(ride_series.ensure_series, conn)
+    print(f"Индекс по created_at и агрегаты minute/hour/day: {elapsed:.1f} с")
+
+    cursor = conn.cursor()
+    rows, sql_time = timed(lambda: cursor.execute(HOURLY_SQL, ('2025-03-01', '2025-04-01')).fetchall())
+    points, series_time = timed(ride_series.series, conn, 'hour', '2025-03-01', '2025-04-01')
+    expected = {row[0]: tuple(row[1:]) for row in rows}
+    for point in points:
+        assert expected.get(point['bucket'], (0, 0, 0, 0.0)) == (
+            point['rides'], point['completed'], point['cancelled'], point['revenue'])
+    print(f"Месяц по часам ({len(points)} точек): SQL по rides {sql_time * 1000:.0f} мс, "
+          f"ride_buckets {series_time * 1000:.1f} мс")
+
+    for label, args in (
+        ("месяц по дням", ('day', '2025-03-01', '2025-04-01')),
+        ("месяц по часам, окно 24 ч", ('hour', '2025-03-01', '2025-04-01', 24)),
+        ("сутки по минутам", ('minute', '2025-03-10', '2025-03-11')),
+        ("месяц по минутам", ('minute', '2025-03-01', '2025-04-01')),
+        ("год по дням, окно 7 дней", ('day', '2025-01-01', '2026-01-01', 7)),
+    ):
+        points, elapsed = timed(ride_series.series, conn, *args)
+        print(f"{label:>28}: {len(points):>6} точек, {elapsed * 1000:>7.1f} мс")
+
+    # запись: три лишних UPSERT на поездку в триггере
+    rng = random.Random(2)
+    start = time.perf_counter()
+    for _ in range(1000):
+        with transaction(conn) as cursor:
+            cursor.execute(
+                "INSERT INTO rides (passenger_id, driver_id, pickup_location, dropoff_location, price, created_at) "
+                "VALUES (?, ?, 'A', 'B', 500, '2025-03-15 12:00:00')", (rng.randint(1, 10000), rng.randint(1, 2000)))
+    # 1000 вставок за N с - это N мс на одну
+    print(f"Вставка поездки с агрегатами: {time.perf_counter() - start:.2f} мс")
+    conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from db import connect, transaction
+import main as app
+import ride_snapshot
+
+np = ride_snapshot.np
+
+def make_db(path, rides):
+    rng = random.Random(1)
+    conn = connect(path)
+    app.create_tables(conn)
+    statuses = ('pending', 'in_progress', 'completed', 'completed', 'completed', 'cancelled')
+    with transaction(conn) as cursor:
+        cursor.executemany("INSERT INTO passengers (full_name, phone) VALUES (?, ?)",
+                           [(f"П{i}", f"+7{i:010d}") for i in range(10000)])
+        cursor.executemany("INSERT INTO drivers (full_name, phone) VALUES (?, ?)",
+                           [(f"В{i}", f"+8{i:010d}") for i in range(2000)])
+        cursor.executemany(
+            "INSERT INTO rides (passenger_id, driver_id, pickup_location, dropoff_location, price, status, created_at) "
+            "VALUES (?, ?, 'A', 'B', ?, ?, ?)",
+            ((rng.randint(1, 10000), rng.randint(1, 2000), round(rng.uniform(150, 3000), 2), rng.choice(statuses),
+              f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:00:00")
+             for _ in range(rides)),
+        )
+    conn.close()
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+REVENUE_BY_DAY_SQL = '''
+SELECT date(created_at) AS day, COUNT(*), ROUND(SUM(price), 2)
+FROM rides
+WHERE status = 'completed' AND created_at >= ? AND created_at < ?
+GROUP BY day
+'''
+
+def database_part(rides):
+    # настоящая база: загрузка fetchmany, догрузка изменений, запрос против SQLite
+    path = os.path.join(tempfile.mkdtemp(), 'rides.db')
+    make_db(path, rides)
+    conn = connect(path)
+    app.set_verbose(False)
+    snapshot = ride_snapshot.RideSnapshot()
+    _, load = timed(snapshot.refresh, conn)
+    print(f"База {rides} поездок: загрузка снимка {load:.2f} с, {snapshot.nbytes() / 2 ** 20:.0f} МБ")
+
+    rng = random.Random(2)
+    for _ in range(1000):
+        app.add_ride(conn, rng.randint(1, 10000), rng.randint(1, 2000), 'A', 'B', 500)
+    for ride_id in rng.sample(range(1, rides + 1), 1000):
+        app.update_ride_status(conn, ride_id, 'cancelled')
+    added, refresh = timed(snapshot.refresh, conn)
+    print(f"Догрузка 1000 новых и 1000 изменённых поездок: {refresh * 1000:.1f} мс")
+
+    cursor = conn.cursor()
+    sql_rows, sql_time = timed(lambda: cursor.execute(REVENUE_BY_DAY_SQL, ('2025-03-01', '2025-09-01')).fetchall())
+    rows, snap_time = timed(snapshot.revenue, 'day', 'completed', '2025-03-01', '2025-09-01')
+    assert [tuple(row) for row in sql_rows] == rows
+    print(f"Выручка по дням за полгода: SQLite {sql_time * 1000:.0f} мс, снимок {snap_time * 1000:.1f} мс")
+    conn.close()
+
+def synthetic_part(rides):
+    # на десятках миллионов строк база строится слишком долго, поэтому
+    # запросы меряются на снимке из случайных массивов
+    rng = np.random.default_rng(1)
+    snapshot = ride_snapshot.RideSnapshot()
+    snapshot.extend({
+        'ride_id': np.arange(1, rides + 1),
+        'passenger_id': rng.integers(1, 1000000, rides, dtype=np.int32),
+        'driver_id': rng.integers(1, 50000, rides, dtype=np.int32),
+        'price': np.round(rng.uniform(150, 3000, rides), 2),
+        'status': rng.integers(0, len(ride_states_names()), rides, dtype=np.int8),
+        'created_at': rng.integers(1735689600, 1767225600, rides),
+    })
+    print(f"\nСнимок {rides} поездок, {snapshot.nbytes() / 2 ** 20:.0f} МБ")
+    queries = (
+        ("итоги (count/sum/min/max)", lambda: snapshot.totals()),
+        ("выручка завершённых", lambda: snapshot.by_status('completed')),
+        ("траты по пассажирам", lambda: snapshot.spend_by('passenger_id')),
+        ("тарифы", lambda: snapshot.tariffs()),
+        ("выручка по дням за квартал", lambda: snapshot.revenue('day', 'completed', '2025-04-01', '2025-07-01')),
+        ("выручка по водителям", lambda: snapshot.revenue('driver_id')),
+        ("выручка по часам", lambda: snapshot.revenue('hour', None)),
+    )
+    for label, query in queries:
+        _, elapsed = timed(query)
+        print(f"{label:>28}: {elapsed * 1000:>7.0f} мс")
+
+def ride_states_names():
+    return ride_snapshot.ride_states.STATUSES
+
+def main():
+    if np is None:
+        print("Для снимка поездок нужен numpy: pip install numpy")
+        sys.exit(1)
+    database_part(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
+    synthetic_part(int(sys.argv[2]) if len(sys.argv) > 2 else 50000000)
+
+if __name__ == "__main__":
+    main()
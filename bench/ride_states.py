@@ -0,0 +1,105 @@
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from db import ConnectionPool, connect, transaction
+import group_commit
+import main as app
+import ride_states
+
+def make_db(path, rides):
+    # разные пассажиры, водители и цены: иначе триггеры ride_rollups на каждом
+    # переходе пересчитывают min/max одной огромной группы
+    rng = random.Random(1)
+    conn = connect(path)
+    app.create_tables(conn)
+    with transaction(conn) as cursor:
+        cursor.executemany("INSERT INTO passengers (full_name, phone) VALUES (?, ?)",
+                           [(f"П{i}", f"+7{i:010d}") for i in range(1000)])
+        cursor.executemany("INSERT INTO drivers (full_name, phone) VALUES (?, ?)",
+                           [(f"В{i}", f"+8{i:010d}") for i in range(200)])
+        cursor.executemany(
+            "INSERT INTO rides (passenger_id, driver_id, pickup_location, dropoff_location, price) "
+            "VALUES (?, ?, 'A', 'B', ?)",
+            [(rng.randint(1, 1000), rng.randint(1, 200), round(rng.uniform(150, 3000), 2)) for _ in range(rides)],
+        )
+    conn.close()
+
+def run(path, threads, rides, race):
+    # без гонки каждый поток ведёт свои поездки pending -> in_progress -> completed;
+    # с гонкой два потока одновременно двигают одну поездку: старт против отмены
+    pool = ConnectionPool(path, size=threads)
+    counts = {'ok': 0, 'conflict': 0, 'busy': 0}
+    lock = threading.Lock()
+
+    def worker(i):
+        ok = conflict = busy = 0
+        with pool.connection() as conn:
+            if race:
+                ids = range(1 + i // 2, rides + 1, threads // 2)
+                statuses = ('in_progress', 'completed') if i % 2 else ('cancelled',)
+            else:
+                ids = range(1 + i, rides + 1, threads)
+                statuses = ('in_progress', 'completed')
+            for ride_id in ids:
+                for status in statuses:
+                    try:
+                        if ride_states.transition(conn, ride_id, status)[0]:
+                            ok += 1
+                        else:
+                            conflict += 1
+                    except sqlite3.OperationalError:
+                        # busy_timeout истёк в очереди за блокировкой записи
+                        busy += 1
+        with lock:
+            counts['ok'] += ok
+            counts['conflict'] += conflict
+            counts['busy'] += busy
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    pool.close()
+    return counts, elapsed
+
+def check(path):
+    conn = connect(path)
+    rows = conn.execute('''
+        SELECT status, version, completed_at IS NOT NULL AS done, COUNT(*) AS count
+        FROM rides GROUP BY 1, 2, 3
+    ''').fetchall()
+    conn.close()
+    return [tuple(row) for row in rows]
+
+def main():
+    rides = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    threads = 16
+    app.set_verbose(False)
+    print(f"{'режим':>24} {'переходов':>10} {'конфликтов':>11} {'занято':>7} {'в секунду':>10}")
+    for race in (False, True):
+        for grouped in (False, True):
+            path = os.path.join(tempfile.mkdtemp(), 'rides.db')
+            make_db(path, rides)
+            if grouped:
+                group_commit.enable(path)
+            try:
+                counts, elapsed = run(path, threads, rides, race)
+            finally:
+                group_commit.disable()
+            label = ("гонка" if race else "без гонки") + (", group commit" if grouped else "")
+            total = counts['ok'] + counts['conflict']
+            print(f"{label:>24} {counts['ok']:>10} {counts['conflict']:>11} {counts['busy']:>7} {total / elapsed:>10.0f}")
+            print(f"{'':>24} итог: {check(path)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from converttojsonxmlcsvyaml import iterrecords, savexml
+
+def fake_rows(n):
+    for i in range(1, n + 1):
+        yield {
+            "ride_id": i,
+            "passenger_id": i % 1000 + 1,
+            "passenger_name": "Иван Иванов",
+            "passenger_phone": "+79001231239",
+            "passenger_email": "ivan2007@gmail.com",
+            "passenger_rating": 5.0,
+            "driver_id": i % 200 + 1,
+            "driver_name": "Андрей Аллахов",
+            "driver_phone": "+78005343123",
+            "driver_email": "io123@mail.ru",
+            "driver_rating": 5.0,
+            "driver_balance": 0.0,
+            "car_model": "Lada Granta",
+            "car_number": "A666УЕ152",
+            "support_id": None,
+            "ticket": None,
+            "support_name": None,
+            "support_phone": None,
+            "support_email": None,
+            "support_status": None,
+            "support_balance": None,
+            "start_point": "Кащенко 5",
+            "end_point": "Проспект Ленина 68",
+            "price": 320.12,
+            "created_at": "2025-11-17 20:14:22",
+            "completed_at": None,
+            "ride_status": "pending",
+        }
+
+def main():
+    sizes = [int(n) for n in sys.argv[1:]] or [1000, 10000, 100000, 1000000]
+    path = os.path.join(tempfile.mkdtemp(), 'data.xml')
+
+    print(f"{'поездок':>10} {'pretty, с':>10} {'мкс/поездка':>12} {'compact, с':>11} {'мкс/поездка':>12}")
+    for n in sizes:
+        times = []
+        for pretty in (True, False):
+            start = time.perf_counter()
+            savexml(iterrecords(fake_rows(n)), path, pretty=pretty)
+            times.append(time.perf_counter() - start)
+        print(f"{n:>10} {times[0]:>10.2f} {times[0] / n * 1e6:>12.1f} {times[1]:>11.2f} {times[1] / n * 1e6:>12.1f}")
+    os.remove(path)
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,34 @@
-import sqlite3
+import os
+import sys
 
-conn = sqlite3.connect('database.db')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
 
-conn.row_factory = sqlite3.Row
+from db import connect, transaction
+from migrations import migrate
+import replica
 
-cursor1 = conn.cursor()
-cursor2 = conn.cursor()
-cursor3 = conn.cursor()
+conn = connect()
+migrate(conn)
 
-cursor1.execute("SELECT * FROM passengers")
-cursor2.execute("SELECT * FROM drivers")
-cursor3.execute("SELECT * FROM rides")
+# с FAKETAXI_REPLICA таблицы читаются из копии базы, не старше минуты
+if replica.REPLICA_PATH:
+    conn.close()
+    source = replica.ReadReplica().ensure_fresh()
+    print(f"Копия базы от {source.status()['taken_at']}")
+    conn = connect(source.path, readonly=True)
 
+# одна читающая транзакция: все три таблицы из одного снимка базы
+with transaction(conn, 'DEFERRED') as cursor:
+    cursor.execute("SELECT * FROM passengers")
+    passengers_row = cursor.fetchall()
 
-passengers_row = cursor1.fetchall()
-drivers_row = cursor2.fetchall()
-rides_row = cursor3.fetchall()
+    cursor.execute("SELECT * FROM drivers")
+    drivers_row = cursor.fetchall()
+
+    cursor.execute("SELECT * FROM rides")
+    rides_row = cursor.fetchall()
+
+conn.close()
 
 print("======Информация о пассажирах======")
 
@@ -30,6 +43,6 @@ for row2 in drivers_row:
 print("======Информация о поездках======")
 
 for row3 in rides_row:
-    print(f"Passenger ID: {row3['passenger_id']}, Driver ID: {row3['driver_id']}, Start Point: {row3['start_point']}, End Point: {row3['end_point']}, Price: {row3['price']}, Status: {row3['status']}")
+    print(f"Passenger ID: {row3['passenger_id']}, Driver ID: {row3['driver_id']}, Start Point: {row3['pickup_location']}, End Point: {row3['dropoff_location']}, Price: {row3['price']}, Status: {row3['status']}")
 
 
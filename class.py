@@ -1,4 +1,7 @@
+# __slots__ вместо __dict__: поля лежат в самом объекте, без словаря атрибутов
 class Passenger:
+    __slots__ = ('passenger_id', 'full_name', 'phone', 'email', 'rating')
+
     def __init__(self, passenger_id, full_name, phone, email, rating):
         self.passenger_id = passenger_id
         self.full_name = full_name
@@ -8,7 +11,7 @@ class Passenger:
 
     def __repr__(self):
         return f"Passenger(passenger_id = '{self.passenger_id}',full_name='{self.full_name}', phone='{self.phone}', email='{self.email}', rating={self.rating})"
-    
+
     def is_vip(self):
         if self.rating >= 4.8:
             return "Он вип"
@@ -22,7 +25,10 @@ class Passenger:
         return start+middle+end
 
 class Driver:
-    def __init__(self, driver_id, full_name, phone, email, rating, balance, car_model, car_number):
+    __slots__ = ('driver_id', 'full_name', 'phone', 'email', 'rating', 'balance', 'car_model', 'car_number', 'status')
+    SHARED = ('status', 'car_model')
+
+    def __init__(self, driver_id, full_name, phone, email, rating, balance, car_model, car_number, status='waiting'):
         self.driver_id = driver_id
         self.full_name = full_name
         self.phone = phone
@@ -31,17 +37,20 @@ class Driver:
         self.balance = balance
         self.car_model = car_model
         self.car_number = car_number
+        self.status = status
 
     def __repr__(self):
-        return f"Driver(driver_id = '{self.driver_id}', full_name='{self.full_name}', phone='{self.phone}', email='{self.email}', rating={self.rating}, balance='{self.balance}', car_model='{self.car_model}', car_number='{self.car_number}')"
+        return f"Driver(driver_id = '{self.driver_id}', full_name='{self.full_name}', phone='{self.phone}', email='{self.email}', rating={self.rating}, balance='{self.balance}', car_model='{self.car_model}', car_number='{self.car_number}', status='{self.status}')"
 
 class Support:
+    __slots__ = ('support_id', 'ticket', 'passenger_id', 'driver_id', 'full_name', 'phone', 'email', 'status', 'balance')
+    SHARED = ('status',)
+
     def __init__(self, support_id, ticket, passenger_id, driver_id, full_name, phone, email, status, balance):
         self.support_id = support_id
         self.full_name = full_name
         self.phone = phone
         self.email = email
-        self.rating = rating
         self.balance = balance
         self.status = status
         self.driver_id = driver_id
@@ -49,24 +58,69 @@ class Support:
         self.ticket = ticket
 
     def __repr__(self):
-        return f"Support(support_id = '{self.support_id}', full_name='{self.full_name}', phone='{self.phone}', email='{self.email}', rating={self.rating}, balance='{self.balance}', status='{self.status}', driver_id='{self.driver_id}', passenger_id='{passenger_id}', ticket='{self.ticket}')"
+        return f"Support(support_id = '{self.support_id}', full_name='{self.full_name}', phone='{self.phone}', email='{self.email}', balance='{self.balance}', status='{self.status}', driver_id='{self.driver_id}', passenger_id='{self.passenger_id}', ticket='{self.ticket}')"
 
 class Ride:
-    def __init__(self, ride_id, passenger_id, driver_id, start_point, end_point, price, created_at, completed_at, status):
+    __slots__ = ('ride_id', 'passenger_id', 'driver_id', 'pickup_location', 'dropoff_location', 'price',
+                 'created_at', 'completed_at', 'status', 'support_id', 'version')
+    SHARED = ('status', 'pickup_location', 'dropoff_location')
+
+    def __init__(self, ride_id, passenger_id, driver_id, pickup_location, dropoff_location, price, created_at,
+                 completed_at, status, support_id=None, version=0):
         self.ride_id = ride_id
         self.passenger_id = passenger_id
         self.driver_id = driver_id
-        self.start_point = start_point
-        self.end_point = end_point
+        self.pickup_location = pickup_location
+        self.dropoff_location = dropoff_location
         self.price = price
         self.created_at = created_at
         self.completed_at = completed_at
         self.status = status
+        self.support_id = support_id
+        self.version = version
 
     def __repr__(self):
-        return f"Ride(ride_id='{self.ride_id}', passenger_id='{self.passenger_id}', driver_id='{self.driver_id}', start_point='{self.start_point}', end_point='{self.end_point}', price='{self.price}', created_at='{self.created_at}', completed_at='{self.completed_at}', status='{self.status}')"
+        return f"Ride(ride_id='{self.ride_id}', passenger_id='{self.passenger_id}', driver_id='{self.driver_id}', pickup_location='{self.pickup_location}', dropoff_location='{self.dropoff_location}', price='{self.price}', created_at='{self.created_at}', completed_at='{self.completed_at}', status='{self.status}')"
+
+def make_mapper(cls, columns):
+    # по списку колонок запроса генерируется функция row -> cls(row[i], ...):
+    # поля берутся из кортежа по номеру, без sqlite3.Row и промежуточных dict;
+    # колонок, которых нет в запросе, передаётся None
+    args = []
+    for name in cls.__slots__:
+        if name in columns:
+            value = f"row[{columns.index(name)}]"
+            if name in getattr(cls, 'SHARED', ()):
+                # sqlite3 создаёт новую строку на каждую строку выборки, а статусов
+                # и адресов мало: одинаковые значения хранятся одним объектом
+                value = f"shared.setdefault({value}, {value})"
+            args.append(value)
+        else:
+            args.append("None")
+    namespace = {'cls': cls, 'shared': {}}
+    exec(f"def make(row):\n    return cls({', '.join(args)})", namespace)
+    return namespace['make']
+
+def row_factory(cls):
+    # для cursor.row_factory: функция пересобирается, только когда у курсора
+    # новый запрос (sqlite3 заводит новый cursor.description на каждый execute)
+    cache = [None, None]
+
+    def factory(cursor, row):
+        description = cursor.description
+        if description is not cache[0]:
+            cache[0] = description
+            cache[1] = make_mapper(cls, [column[0] for column in description])
+        return cache[1](row)
+    return factory
 
+def query(conn, cls, sql, params=()):
+    cursor = conn.cursor()
+    cursor.row_factory = row_factory(cls)
+    cursor.execute(sql, params)
+    return cursor
 
-passenger = Passenger(1, "Иван Иванов", "+79213402130", "deb1l@mail.ru", 4.9)
+if __name__ == "__main__":
+    passenger = Passenger(1, "Иван Иванов", "+79213402130", "deb1l@mail.ru", 4.9)
 
-print(f"{passenger}\n{passenger.is_vip()}\n{passenger.get_masked_phone()}")
\ No newline at end of file
+    print(f"{passenger}\n{passenger.is_vip()}\n{passenger.get_masked_phone()}")
@@ -0,0 +1,200 @@
+import json
+import mmap
+import os
+import struct
+import calendar
+from array import array
+from datetime import datetime, timezone
+
+# Простой колоночный формат без сторонних библиотек:
+#   MAGIC | группы строк (колонки по 8 байт с выравниванием) | footer JSON | длина footer | MAGIC
+# Числа лежат как есть (little-endian), поэтому при чтении через mmap
+# колонку можно получить как memoryview без копирования.
+
+MAGIC = b'FTCOL1\x00\x00'
+TYPES = ('int64', 'float64', 'timestamp', 'dict', 'string')
+
+def to_epoch(value):
+    if value is None:
+        return None
+    return calendar.timegm(datetime.fromisoformat(value).timetuple())
+
+def from_epoch(value):
+    if value is None:
+        return None
+    return datetime.fromtimestamp(value, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+def _pack_validity(values):
+    bits = bytearray((len(values) + 7) // 8)
+    for i, value in enumerate(values):
+        if value is not None:
+            bits[i >> 3] |= 1 << (i & 7)
+    return bytes(bits)
+
+class ColumnarWriter:
+    def __init__(self, path, schema, row_group_size=65536):
+        for name, kind in schema:
+            if kind not in TYPES:
+                raise ValueError(f"Неизвестный тип колонки {name}: {kind}")
+        self.schema = list(schema)
+        self.row_group_size = row_group_size
+        self.path = path
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC)
+        self.row_groups = []
+        self.num_rows = 0
+        self._reset()
+
+    def _reset(self):
+        self.buffer = {name: [] for name, _ in self.schema}
+        self.buffered = 0
+
+    def write(self, row):
+        for name, _ in self.schema:
+            self.buffer[name].append(row[name])
+        self.buffered += 1
+        if self.buffered >= self.row_group_size:
+            self.flush()
+
+    def _part(self, data):
+        offset = self.file.tell()
+        self.file.write(data)
+        self.file.write(b'\x00' * (-len(data) % 8))
+        return {"offset": offset, "length": len(data)}
+
+    def flush(self):
+        if not self.buffered:
+            return
+        group = {"num_rows": self.buffered, "columns": {}}
+        for name, kind in self.schema:
+            values = self.buffer[name]
+            column = {}
+            if kind == 'dict':
+                dictionary = {}
+                codes = array('i', (
+                    -1 if value is None else dictionary.setdefault(value, len(dictionary))
+                    for value in values
+                ))
+                column["dictionary"] = list(dictionary)
+                column["codes"] = self._part(codes.tobytes())
+            else:
+                if kind == 'timestamp':
+                    values = [to_epoch(value) for value in values]
+                if any(value is None for value in values):
+                    column["validity"] = self._part(_pack_validity(values))
+                if kind == 'string':
+                    offsets = array('q', [0])
+                    data = bytearray()
+                    for value in values:
+                        if value is not None:
+                            data += str(value).encode('utf-8')
+                        offsets.append(len(data))
+                    column["offsets"] = self._part(offsets.tobytes())
+                    column["data"] = self._part(bytes(data))
+                elif kind == 'float64':
+                    column["values"] = self._part(array('d', (
+                        0.0 if value is None else value for value in values
+                    )).tobytes())
+                else:
+                    column["values"] = self._part(array('q', (
+                        0 if value is None else value for value in values
+                    )).tobytes())
+            group["columns"][name] = column
+        self.row_groups.append(group)
+        self.num_rows += self.buffered
+        self._reset()
+
+    def close(self):
+        self.flush()
+        footer = json.dumps({
+            "version": 1,
+            "num_rows": self.num_rows,
+            "schema": [[name, kind] for name, kind in self.schema],
+            "row_groups": self.row_groups,
+        }, ensure_ascii=False).encode('utf-8')
+        self.file.write(footer)
+        self.file.write(struct.pack('<Q', len(footer)))
+        self.file.write(MAGIC)
+        self.file.close()
+
+    def abort(self):
+        # без footer файл выглядел бы целым, но с частью строк: удаляем его,
+        # чтобы читатель получил ошибку, а не неполные данные
+        self.file.close()
+        os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+class ColumnarReader:
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+        if self.map[:8] != MAGIC or self.map[-8:] != MAGIC:
+            self.close()
+            raise ValueError(f"{path}: не колоночный файл")
+        (footer_len,) = struct.unpack('<Q', self.map[-16:-8])
+        footer = json.loads(bytes(self.map[-16 - footer_len:-16]).decode('utf-8'))
+        self.num_rows = footer["num_rows"]
+        self.schema = [tuple(item) for item in footer["schema"]]
+        self.types = dict(self.schema)
+        self.row_groups = footer["row_groups"]
+
+    def _slice(self, part):
+        return self.view[part["offset"]:part["offset"] + part["length"]]
+
+    def raw(self, name, group):
+        # числовые колонки без копирования: memoryview поверх mmap
+        column = self.row_groups[group]["columns"][name]
+        if self.types[name] == 'dict':
+            return self._slice(column["codes"]).cast('i'), column["dictionary"]
+        if self.types[name] == 'float64':
+            return self._slice(column["values"]).cast('d')
+        return self._slice(column["values"]).cast('q')
+
+    def column(self, name, group):
+        kind = self.types[name]
+        column = self.row_groups[group]["columns"][name]
+        count = self.row_groups[group]["num_rows"]
+        if kind == 'dict':
+            codes, dictionary = self.raw(name, group)
+            return [None if code < 0 else dictionary[code] for code in codes]
+
+        validity = self._slice(column["validity"]) if "validity" in column else None
+        if kind == 'string':
+            offsets = self._slice(column["offsets"]).cast('q')
+            data = self._slice(column["data"])
+            values = [bytes(data[offsets[i]:offsets[i + 1]]).decode('utf-8') for i in range(count)]
+        else:
+            values = self.raw(name, group).tolist()
+            if kind == 'timestamp':
+                values = [from_epoch(value) for value in values]
+        if validity is not None:
+            values = [value if validity[i >> 3] >> (i & 7) & 1 else None
+                      for i, value in enumerate(values)]
+        return values
+
+    def iter_rows(self, columns=None):
+        names = columns or [name for name, _ in self.schema]
+        for group in range(len(self.row_groups)):
+            data = [self.column(name, group) for name in names]
+            for values in zip(*data):
+                yield dict(zip(names, values))
+
+    def close(self):
+        self.view.release()
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
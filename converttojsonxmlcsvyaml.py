@@ -3,13 +3,27 @@ import json
 import csv
 import yaml
 import xml.etree.ElementTree as ET
-from xml.dom import minidom
 import os
+import sys
+import queue
+import itertools
+import functools
+import argparse
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-def retrievedatafromdb(db_path='database.db'):
-        conn = sqlite3.connect(db_path)
-        conn.row_factory = sqlite3.Row
+from columnar import ColumnarReader, ColumnarWriter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+from db import connect, transaction
+from migrations import migrate
+import replica
+
+def iterdatafromdb(db_path=None, batch_size=1000, where='', params=(), readonly=False):
+        conn = connect(db_path, readonly=readonly)
         cursor = conn.cursor()
 
 
@@ -36,8 +50,8 @@ def retrievedatafromdb(db_path='database.db'):
                 s.email as support_email,
                 s.status as support_status,
                 s.balance as support_balance,
-                r.start_point,
-                r.end_point,
+                r.pickup_location as start_point,
+                r.dropoff_location as end_point,
                 r.price,
                 r.created_at,
                 r.completed_at,
@@ -46,203 +60,503 @@ def retrievedatafromdb(db_path='database.db'):
         LEFT JOIN passengers p ON r.passenger_id = p.passenger_id
         LEFT JOIN drivers d ON r.driver_id = d.driver_id
         LEFT JOIN support s ON r.support_id = s.support_id
+        {where}
         ORDER BY r.ride_id
-        """
-        
-        cursor.execute(query)
-        rows = cursor.fetchall()
-        data = [dict(row) for row in rows]
-        conn.close()
-        return data
-
-
-
-
-def savejson(data):
-    formatted_data = []
-    for item in data:
-        ride = {
-                "passenger": {
-                        "id": item["passenger_id"],
-                        "passenger_full_name": item["passenger_name"],
-                        "passenger_phone": item["passenger_phone"],
-                        "passenger_email": item["passenger_email"],
-                        "passenger_rating": item["passenger_rating"]
-                } if item["passenger_id"] else None,
-                "driver": {
-                        "id": item["driver_id"],
-                        "driver_full_name": item["driver_name"],
-                        "driver_phone": item["driver_phone"],
-                        "driver_email": item["driver_email"],
-                        "driver_rating": item["driver_rating"],
-                        "balance": item["driver_balance"],
-                        "car": {
-                                "car_model": item["car_model"],
-                                "car_number": item["car_number"]
-                        }
-                } if item["driver_id"] else None,
-                "support": {
-                        "id": item["support_id"],
-                        "ticket": {
-                                "passenger_id": item["passenger_id"],
-                                "driver_id": item["driver_id"]
-                        },
-                        "support_full_name": item["support_name"],
-                        "support_phone": item["support_phone"],
-                        "support_email": item["support_email"],
-                        "support_status": item["support_status"],
-                        "balance": item["support_balance"]
-                } if item["support_id"] or (item["passenger_id"] and item["driver_id"]) else None,
-                "route": {
-                        "start": item["start_point"],
-                        "end": item["end_point"]
-                },
-                "price": item["price"],
-                "time": {
-                        "created_at": item["created_at"],
-                        "completed_at": item["completed_at"]
-                },
-                "status": item["ride_status"]
-        }
-        formatted_data.append(ride)
-
-    os.makedirs('out', exist_ok=True)
-    with open('out/data.json', 'w', encoding='utf-8') as f:
-        json.dump(formatted_data, f, ensure_ascii=False, indent=2)
-
-def savecsv(data):
-        if not data:
-                return
-        with open('out/data.csv', 'w', newline='', encoding='utf-8') as f:
-                fieldnames = data[0].keys()
-                writer = csv.DictWriter(f, fieldnames=fieldnames)
+        """.format(where=where)
+
+        cursor.execute(query, params)
+        try:
+                yield from iterrows(cursor, batch_size)
+        finally:
+                conn.close()
+
+def iterrows(cursor, batch_size=1000):
+        while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                        break
+                for row in rows:
+                        yield dict(row)
+
+def retrievedatafromdb(db_path=None):
+        return list(iterdatafromdb(db_path))
+
 
+def build_ride(item):
+    return {
+            "passenger": {
+                    "id": item["passenger_id"],
+                    "passenger_full_name": item["passenger_name"],
+                    "passenger_phone": item["passenger_phone"],
+                    "passenger_email": item["passenger_email"],
+                    "passenger_rating": item["passenger_rating"]
+            } if item["passenger_id"] else None,
+            "driver": {
+                    "id": item["driver_id"],
+                    "driver_full_name": item["driver_name"],
+                    "driver_phone": item["driver_phone"],
+                    "driver_email": item["driver_email"],
+                    "driver_rating": item["driver_rating"],
+                    "balance": item["driver_balance"],
+                    "car": {
+                            "car_model": item["car_model"],
+                            "car_number": item["car_number"]
+                    }
+            } if item["driver_id"] else None,
+            "support": {
+                    "id": item["support_id"],
+                    "ticket": {
+                            "passenger_id": item["passenger_id"],
+                            "driver_id": item["driver_id"]
+                    },
+                    "support_full_name": item["support_name"],
+                    "support_phone": item["support_phone"],
+                    "support_email": item["support_email"],
+                    "support_status": item["support_status"],
+                    "balance": item["support_balance"]
+            } if item["support_id"] or (item["passenger_id"] and item["driver_id"]) else None,
+            "route": {
+                    "start": item["start_point"],
+                    "end": item["end_point"]
+            },
+            "price": item["price"],
+            "time": {
+                    "created_at": item["created_at"],
+                    "completed_at": item["completed_at"]
+            },
+            "status": item["ride_status"]
+    }
+
+def iterrecords(rows):
+    for item in rows:
+        yield item, build_ride(item)
+
+def savejson(records, path='out/data.json'):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        first = True
+        for item, ride in records:
+            # каждый элемент пишется сразу, массив не собирается в памяти
+            chunk = json.dumps(ride, ensure_ascii=False, indent=2).replace('\n', '\n  ')
+            f.write(('[\n  ' if first else ',\n  ') + chunk)
+            first = False
+        f.write('[]' if first else '\n]')
+
+def savecsv(records, path='out/data.csv'):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = None
+        for item, ride in records:
+            if writer is None:
+                writer = csv.DictWriter(f, fieldnames=list(item.keys()))
                 writer.writeheader()
-                writer.writerows(data)
-
-def savexml(data):
-        root = ET.Element("rides")
-
-        for item in data:
-                ride = ET.SubElement(root, "ride")
-
-                ET.SubElement(ride, "ride_id").text = str(item["ride_id"])
-
-                if item["passenger_id"]:
-                        passenger = ET.SubElement(ride, "passenger")
-                        ET.SubElement(passenger, "passenger_id").text = str(item["passenger_id"])
-                        ET.SubElement(passenger, "full_name").text = item["passenger_name"]
-                        ET.SubElement(passenger, "phone").text = item["passenger_phone"]
-                        ET.SubElement(passenger, "email").text = item["passenger_email"]
-                        ET.SubElement(passenger, "rating").text = str(item["passenger_rating"])
-
-                if item["driver_id"]:
-                        driver = ET.SubElement(ride, "driver")
-                        ET.SubElement(driver, "driver_id").text = str(item["driver_id"])
-                        ET.SubElement(driver, "full_name").text = item["driver_name"]
-                        ET.SubElement(driver, "phone").text = item["driver_phone"]
-                        ET.SubElement(driver, "email").text = item["driver_email"]
-                        ET.SubElement(driver, "rating").text = str(item["driver_rating"])
-                        ET.SubElement(driver, "balance").text = str(item["driver_balance"])
-                        ET.SubElement(driver, "car_model").text = item["car_model"]
-                        ET.SubElement(driver, "car_number").text = item["car_number"]
-
-                if item["support_id"]:
-                        support = ET.SubElement(ride, "support")
-                        ET.SubElement(support, "support_id").text = str(item["support_id"])
-                        ET.SubElement(support, "ticket").text = item["ticket"]
-                        ET.SubElement(support, "passenger_id").text = str(item["passenger_id"])
-                        ET.SubElement(support, "driver_id").text = str(item["driver_id"])
-                        ET.SubElement(support, "full_name").text = item["support_name"]
-                        ET.SubElement(support, "phone").text = item["support_phone"]
-                        ET.SubElement(support, "email").text = item["support_email"]
-                        ET.SubElement(support, "status").text = item["support_status"]
-                        ET.SubElement(support, "balance").text = str(item["support_balance"])
-                
-                route = ET.SubElement(ride, "route")
-                ET.SubElement(route, "start_point").text = item["start_point"]
-                ET.SubElement(route, "end_point").text = item["end_point"]
-
-                ET.SubElement(ride, "price").text = str(item["price"])
-                ET.SubElement(ride, "created_at").text = item["created_at"]
-                if item["completed_at"]:
-                        ET.SubElement(ride, "completed_at").text = item["completed_at"]
-                ET.SubElement(ride, "status").text = item["ride_status"]
-
-                xml_str = minidom.parseString(ET.tostring(root)).toprettyxml(indent="  ")
-
-        with open('out/data.xml', 'w', encoding='utf-8') as f:
-                f.write(xml_str)
-
-def saveyaml(data):
-        formatted_data = []
-        for item in data:
-                ride = {
-                "passenger": {
-                        "id": item["passenger_id"],
-                        "passenger_full_name": item["passenger_name"],
-                        "passenger_phone": item["passenger_phone"],
-                        "passenger_email": item["passenger_email"],
-                        "passenger_rating": item["passenger_rating"]
-                } if item["passenger_id"] else None,
-                "driver": {
-                        "id": item["driver_id"],
-                        "driver_full_name": item["driver_name"],
-                        "driver_phone": item["driver_phone"],
-                        "driver_email": item["driver_email"],
-                        "driver_rating": item["driver_rating"],
-                        "balance": item["driver_balance"],
-                        "car": {
-                                "car_model": item["car_model"],
-                                "car_number": item["car_number"]
-                        }
-                } if item["driver_id"] else None,
-                "support": {
-                        "id": item["support_id"],
-                        "ticket": {
-                                "passenger_id": item["passenger_id"],
-                                "driver_id": item["driver_id"]
-                        },
-                        "support_full_name": item["support_name"],
-                        "support_phone": item["support_phone"],
-                        "support_email": item["support_email"],
-                        "support_status": item["support_status"],
-                        "balance": item["support_balance"]
-                } if item["support_id"] or (item["passenger_id"] and item["driver_id"]) else None,
-                "route": {
-                        "start": item["start_point"],
-                        "end": item["end_point"]
-                },
-                "price": item["price"],
-                "time": {
-                        "created_at": item["created_at"],
-                        "completed_at": item["completed_at"]
-                },
-                "status": item["ride_status"]
-                }
-                formatted_data.append(ride)
-        with open('out/data.yaml', 'w', encoding='utf-8') as f:
-                yaml.dump(formatted_data, f,
-                          allow_unicode=True,
-                          default_flow_style=False,
-                          sort_keys=False)
+            writer.writerow(item)
+
+def savexml(records, path='out/data.xml', pretty=True):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" ?>\n<rides>' + ('\n' if pretty else ''))
+
+        for item, _ in records:
+            ride = ET.Element("ride")
+
+            ET.SubElement(ride, "ride_id").text = str(item["ride_id"])
+
+            if item["passenger_id"]:
+                passenger = ET.SubElement(ride, "passenger")
+                ET.SubElement(passenger, "passenger_id").text = str(item["passenger_id"])
+                ET.SubElement(passenger, "full_name").text = item["passenger_name"]
+                ET.SubElement(passenger, "phone").text = item["passenger_phone"]
+                ET.SubElement(passenger, "email").text = item["passenger_email"]
+                ET.SubElement(passenger, "rating").text = str(item["passenger_rating"])
+
+            if item["driver_id"]:
+                driver = ET.SubElement(ride, "driver")
+                ET.SubElement(driver, "driver_id").text = str(item["driver_id"])
+                ET.SubElement(driver, "full_name").text = item["driver_name"]
+                ET.SubElement(driver, "phone").text = item["driver_phone"]
+                ET.SubElement(driver, "email").text = item["driver_email"]
+                ET.SubElement(driver, "rating").text = str(item["driver_rating"])
+                ET.SubElement(driver, "balance").text = str(item["driver_balance"])
+                ET.SubElement(driver, "car_model").text = item["car_model"]
+                ET.SubElement(driver, "car_number").text = item["car_number"]
+
+            if item["support_id"]:
+                support = ET.SubElement(ride, "support")
+                ET.SubElement(support, "support_id").text = str(item["support_id"])
+                ET.SubElement(support, "ticket").text = item["ticket"]
+                ET.SubElement(support, "passenger_id").text = str(item["passenger_id"])
+                ET.SubElement(support, "driver_id").text = str(item["driver_id"])
+                ET.SubElement(support, "full_name").text = item["support_name"]
+                ET.SubElement(support, "phone").text = item["support_phone"]
+                ET.SubElement(support, "email").text = item["support_email"]
+                ET.SubElement(support, "status").text = item["support_status"]
+                ET.SubElement(support, "balance").text = str(item["support_balance"])
+
+            route = ET.SubElement(ride, "route")
+            ET.SubElement(route, "start_point").text = item["start_point"]
+            ET.SubElement(route, "end_point").text = item["end_point"]
+
+            ET.SubElement(ride, "price").text = str(item["price"])
+            ET.SubElement(ride, "created_at").text = item["created_at"]
+            if item["completed_at"]:
+                ET.SubElement(ride, "completed_at").text = item["completed_at"]
+            ET.SubElement(ride, "status").text = item["ride_status"]
+
+            # в файл уходит только текущая поездка, общее дерево не строится,
+            # поэтому время записи растёт линейно от числа поездок
+            if pretty:
+                ET.indent(ride, space="  ", level=1)
+                f.write("  " + ET.tostring(ride, encoding="unicode") + "\n")
+            else:
+                f.write(ET.tostring(ride, encoding="unicode"))
+
+        f.write('</rides>\n')
+
+def saveyaml(records, path='out/data.yaml'):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        for item, ride in records:
+            # список из одного элемента даёт тот же текст, что и общий список
+            yaml.dump([ride], f,
+                      allow_unicode=True,
+                      default_flow_style=False,
+                      sort_keys=False)
+
+
+
+
+
+# типы колонок плоской записи поездки для колоночного формата
+RIDE_COLUMNS = [
+    ('ride_id', 'int64'),
+    ('passenger_id', 'int64'),
+    ('passenger_name', 'string'),
+    ('passenger_phone', 'string'),
+    ('passenger_email', 'string'),
+    ('passenger_rating', 'float64'),
+    ('driver_id', 'int64'),
+    ('driver_name', 'string'),
+    ('driver_phone', 'string'),
+    ('driver_email', 'string'),
+    ('driver_rating', 'float64'),
+    ('driver_balance', 'float64'),
+    ('car_model', 'dict'),
+    ('car_number', 'string'),
+    ('support_id', 'int64'),
+    ('ticket', 'string'),
+    ('support_name', 'string'),
+    ('support_phone', 'string'),
+    ('support_email', 'string'),
+    ('support_status', 'dict'),
+    ('support_balance', 'float64'),
+    ('start_point', 'string'),
+    ('end_point', 'string'),
+    ('price', 'float64'),
+    ('created_at', 'timestamp'),
+    ('completed_at', 'timestamp'),
+    ('ride_status', 'dict'),
+]
+
+def savecolumnar(records, path='out/data.ftcol', row_group_size=65536):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with ColumnarWriter(path, RIDE_COLUMNS, row_group_size) as writer:
+        for item, _ in records:
+            writer.write(item)
+
+SINKS = {
+    'json': savejson,
+    'csv': savecsv,
+    'xml': savexml,
+    'yaml': saveyaml,
+    'ftcol': savecolumnar,
+}
+
+_DONE = object()
 
+def _drain(q):
+    while True:
+        batch = q.get()
+        if batch is _DONE:
+            return
+        yield from batch
 
+def _put(q, future, batch):
+    # если форматтер упал, не ждём вечно на заполненной очереди
+    while not future.done():
+        try:
+            q.put(batch, timeout=0.1)
+            return
+        except queue.Full:
+            pass
+    future.result()
 
+def export(rows, sinks=None, queue_size=64, batch_size=256):
+    sinks = SINKS if sinks is None else sinks
+    count = 0
+    with ThreadPoolExecutor(max_workers=len(sinks)) as pool:
+        queues = []
+        for name, sink in sinks.items():
+            q = queue.Queue(maxsize=queue_size)
+            queues.append((q, pool.submit(sink, _drain(q))))
 
+        try:
+            batch = []
+            for record in iterrecords(rows):
+                batch.append(record)
+                count += 1
+                if len(batch) >= batch_size:
+                    for q, future in queues:
+                        _put(q, future, batch)
+                    batch = []
+            if batch:
+                for q, future in queues:
+                    _put(q, future, batch)
+        finally:
+            # остальные форматтеры должны завершиться и при ошибке
+            for q, future in queues:
+                try:
+                    _put(q, future, _DONE)
+                except Exception:
+                    pass
+        for q, future in queues:
+            future.result()
+    return count
+
+DELTA_DIR = 'out/delta'
+
+# тип колонок плоской выгрузки, чтобы при сборке из CSV вернуть числа
+FLAT_COLUMN_TYPES = {
+    'ride_id': 'INTEGER PRIMARY KEY',
+    'passenger_id': 'INTEGER',
+    'passenger_rating': 'REAL',
+    'driver_id': 'INTEGER',
+    'driver_rating': 'REAL',
+    'driver_balance': 'REAL',
+    'support_id': 'INTEGER',
+    'support_balance': 'REAL',
+    'price': 'REAL',
+}
+
+def chunk_sinks(directory, sinks=None):
+    sinks = SINKS if sinks is None else sinks
+    return {
+        name: functools.partial(sink, path=os.path.join(directory, f'data.{name}'))
+        for name, sink in sinks.items()
+    }
+
+def prepare_delta(conn):
+    # журнал изменений статуса/завершения и удалений, его читает только выгрузка
+    with transaction(conn) as cursor:
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ride_changes (
+            change_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ride_id INTEGER NOT NULL,
+            deleted INTEGER NOT NULL DEFAULT 0
+        )
+        """)
+        cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS ride_changes_update
+        AFTER UPDATE OF status, completed_at ON rides
+        BEGIN
+            INSERT INTO ride_changes (ride_id) VALUES (NEW.ride_id);
+        END
+        """)
+        cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS ride_changes_delete
+        AFTER DELETE ON rides
+        BEGIN
+            INSERT INTO ride_changes (ride_id, deleted) VALUES (OLD.ride_id, 1);
+        END
+        """)
+
+def load_delta_state(delta_dir=DELTA_DIR):
+    path = os.path.join(delta_dir, 'state.json')
+    if not os.path.exists(path):
+        return {"last_ride_id": 0, "last_change_id": 0, "next_chunk": 1}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def save_delta_state(state, delta_dir=DELTA_DIR):
+    path = os.path.join(delta_dir, 'state.json')
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(path + '.tmp', path)
+
+def delta_export(db_path=None, delta_dir=DELTA_DIR, sinks=None):
+    conn = connect(db_path)
+    prepare_delta(conn)
+    state = load_delta_state(delta_dir)
+
+    with transaction(conn, 'DEFERRED') as cursor:
+        cursor.execute("SELECT COALESCE(MAX(ride_id), 0) FROM rides")
+        last_ride_id = cursor.fetchone()[0]
+        cursor.execute("SELECT COALESCE(MAX(change_id), 0) FROM ride_changes")
+        last_change_id = cursor.fetchone()[0]
+        cursor.execute('''
+        SELECT DISTINCT ride_id
+        FROM ride_changes
+        WHERE deleted = 1 AND change_id > ? AND change_id <= ?
+        ORDER BY ride_id
+        ''', (state["last_change_id"], last_change_id))
+        deleted = [row[0] for row in cursor.fetchall()]
+
+    where = """
+    WHERE (r.ride_id > ? AND r.ride_id <= ?)
+       OR r.ride_id IN (
+           SELECT ride_id FROM ride_changes
+           WHERE deleted = 0 AND change_id > ? AND change_id <= ?
+       )
+    """
+    params = (state["last_ride_id"], last_ride_id, state["last_change_id"], last_change_id)
+    rows = iterdatafromdb(db_path, where=where, params=params)
+
+    first = next(rows, None)
+    if first is None and not deleted:
+        conn.close()
+        print("Нет изменений с прошлой выгрузки")
+        return 0
+
+    chunk_dir = os.path.join(delta_dir, f'{state["next_chunk"]:06d}')
+    os.makedirs(chunk_dir, exist_ok=True)
+    count = 0
+    if first is not None:
+        count = export(itertools.chain([first], rows), chunk_sinks(chunk_dir, sinks))
+    if deleted:
+        with open(os.path.join(chunk_dir, 'deleted.csv'), 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['ride_id'])
+            writer.writerows([ride_id] for ride_id in deleted)
+
+    state.update(last_ride_id=last_ride_id, last_change_id=last_change_id,
+                 next_chunk=state["next_chunk"] + 1)
+    save_delta_state(state, delta_dir)
+
+    # уже выгруженные изменения больше не нужны
+    with transaction(conn) as cursor:
+        cursor.execute("DELETE FROM ride_changes WHERE change_id <= ?", (last_change_id,))
+    conn.close()
+
+    print(f"Выгружено поездок: {count}, удалено: {len(deleted)} -> {chunk_dir}")
+    return count
+
+def _insert_flat(conn, names, rows, columns):
+    if not columns:
+        columns.extend(names)
+        conn.execute("CREATE TABLE rides ({})".format(
+            ", ".join(f"{name} {FLAT_COLUMN_TYPES.get(name, 'TEXT')}" for name in columns)))
+    insert = "INSERT OR REPLACE INTO rides ({}) VALUES ({})".format(
+        ", ".join(columns), ", ".join("?" for _ in columns))
+    while True:
+        batch = list(itertools.islice(rows, 1000))
+        if not batch:
+            break
+        conn.executemany(insert, [[row.get(name) for name in columns] for row in batch])
+
+def _load_flat_csv(conn, path, columns):
+    # в CSV пустая строка и NULL записаны одинаково, поэтому пустое поле - NULL
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        if reader.fieldnames is None:
+            return
+        rows = ({name: (value if value != '' else None) for name, value in row.items()} for row in reader)
+        _insert_flat(conn, reader.fieldnames, rows, columns)
+
+def _load_flat(conn, directory, columns):
+    # колоночная часть хранит NULL отдельно от '' (битовая маска), и сборка
+    # совпадает с сырой выгрузкой; CSV - для выгрузок, сделанных без неё
+    path = os.path.join(directory, 'data.ftcol')
+    if os.path.exists(path):
+        with ColumnarReader(path) as reader:
+            _insert_flat(conn, [name for name, _ in reader.schema], reader.iter_rows(), columns)
+    elif os.path.exists(os.path.join(directory, 'data.csv')):
+        _load_flat_csv(conn, os.path.join(directory, 'data.csv'), columns)
+
+def compact(out_dir='out', delta_dir=DELTA_DIR, sinks=None):
+    chunks = sorted(
+        name for name in os.listdir(delta_dir)
+        if os.path.isdir(os.path.join(delta_dir, name))
+    ) if os.path.isdir(delta_dir) else []
+    if not chunks:
+        print("Нет частей для сборки")
+        return 0
+
+    # собираем во временной базе: последняя версия поездки вытесняет прежние
+    tmp_dir = tempfile.mkdtemp()
+    conn = sqlite3.connect(os.path.join(tmp_dir, 'compact.db'))
+    conn.row_factory = sqlite3.Row
+    columns = []
+    try:
+        _load_flat(conn, out_dir, columns)
+        for name in chunks:
+            chunk_dir = os.path.join(delta_dir, name)
+            _load_flat(conn, chunk_dir, columns)
+            deleted = os.path.join(chunk_dir, 'deleted.csv')
+            if columns and os.path.exists(deleted):
+                with open(deleted, newline='', encoding='utf-8') as f:
+                    conn.executemany("DELETE FROM rides WHERE ride_id = ?",
+                                     [(row['ride_id'],) for row in csv.DictReader(f)])
+        conn.commit()
+
+        count = 0
+        if columns:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM rides ORDER BY ride_id")
+            count = export(iterrows(cursor), chunk_sinks(out_dir, sinks))
+    finally:
+        conn.close()
+        shutil.rmtree(tmp_dir)
+
+    for name in chunks:
+        shutil.rmtree(os.path.join(delta_dir, name))
+    print(f"Собрано поездок: {count} из {len(chunks)} частей -> {out_dir}")
+    return count
 
 def main():
+    parser = argparse.ArgumentParser(description="Выгрузка поездок в JSON/CSV/XML/YAML и колоночный формат")
+    parser.add_argument('--compact-xml', action='store_true',
+                        help="писать XML без отступов (для машинной обработки)")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--delta', action='store_true',
+                      help=f"выгрузить только новые и изменённые поездки в {DELTA_DIR}")
+    mode.add_argument('--compact', action='store_true',
+                      help="собрать части из delta в полную выгрузку out/")
+    parser.add_argument('--snapshot', type=float, metavar='SECONDS', nargs='?', const=0,
+                        help="выгружать из копии базы (replica.py), если она старше SECONDS - обновить; "
+                             "по умолчанию копия снимается заново")
+    args = parser.parse_args()
+
+    sinks = dict(SINKS)
+    if args.compact_xml:
+        sinks['xml'] = functools.partial(savexml, pretty=False)
+
+    if args.compact:
+        compact(sinks=sinks)
+        return
+
+    # базы со старыми именами колонок поднимаются до общей схемы
+    conn = connect()
+    migrate(conn)
+    conn.close()
+
+    if args.delta:
+        delta_export(sinks=sinks)
+        return
+
+    if args.snapshot is not None:
+        # полная выгрузка по копии: рабочая база занята только на время backup
+        source = replica.ReadReplica().ensure_fresh(args.snapshot)
+        print(f"Выгрузка по копии базы от {source.status()['taken_at']}")
+        data = iterdatafromdb(source.path, readonly=True)
+    else:
+        data = iterdatafromdb()
 
-    data = importdatafromdb()
-    
-    if not data:
+    first = next(data, None)
+    if first is None:
         print("В базе данных нет записей")
         return
 
-    savejson(data)
-    savecsv(data)
-    savexml(data)
-    saveyaml(data)
+    export(itertools.chain([first], data), sinks)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
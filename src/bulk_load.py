@@ -0,0 +1,297 @@
+import argparse
+import csv
+import itertools
+import json
+import sys
+import time
+
+from db import connect, transaction
+import rollups
+import ride_series
+import ride_states
+
+# колонка -> (тип, обязательная); имена маршрута встречаются в обеих схемах
+SPECS = {
+    'passengers': {
+        'full_name': (str, True),
+        'phone': (str, True),
+        'email': (str, False),
+        'rating': (float, False),
+    },
+    'drivers': {
+        'full_name': (str, True),
+        'phone': (str, True),
+        'email': (str, False),
+        'rating': (float, False),
+        'balance': (float, False),
+        'status': (str, False),
+        'car_model': (str, False),
+        'car_number': (str, False),
+    },
+    'rides': {
+        'passenger_id': (int, True),
+        'driver_id': (int, True),
+        'pickup_location': (str, False),
+        'dropoff_location': (str, False),
+        'price': (float, True),
+        'status': (str, False),
+        'created_at': (str, False),
+        'completed_at': (str, False),
+    },
+}
+
+# допустимые значения из CHECK схемы (migrations.py)
+CHOICES = {
+    'drivers': {'status': ('working', 'waiting', 'pending')},
+    'rides': {'status': ride_states.STATUSES},
+}
+
+# UNIQUE-колонки: повтор упал бы IntegrityError посреди загрузки,
+# когда первые пачки уже записаны
+UNIQUE = {
+    'passengers': ('phone', 'email'),
+    'drivers': ('phone', 'email'),
+}
+
+# старые имена полей поездки (до миграции 2) -> общие; работают и на ещё не поднятой базе
+ALIASES = {
+    'rides': {
+        'start_point': 'pickup_location',
+        'end_point': 'dropoff_location',
+        'ride_date': 'created_at',
+    },
+}
+
+def read_rows(path, fmt=None):
+    fmt = fmt or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+    with open(path, newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            for row in csv.DictReader(f):
+                yield {key: (value if value != '' else None) for key, value in row.items()}
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+def validate_row(table, row, required=()):
+    spec = SPECS[table]
+    aliases = ALIASES.get(table, {})
+    clean = {}
+    for key, value in row.items():
+        key = aliases.get(key, key)
+        if key not in spec:
+            raise ValueError(f"неизвестная колонка {key}")
+        kind, _ = spec[key]
+        if value is not None:
+            try:
+                value = kind(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"{key}: ожидался {kind.__name__}, получено {value!r}") from None
+            choices = CHOICES.get(table, {}).get(key)
+            if choices and value not in choices:
+                raise ValueError(f"{key}: недопустимое значение {value!r} (можно {', '.join(choices)})")
+        clean[key] = value
+    for key, (_, needed) in spec.items():
+        if (needed or key in required) and clean.get(key) is None:
+            raise ValueError(f"не заполнено обязательное поле {key}")
+    return clean
+
+# внешние ключи поездок: поле -> (таблица, колонка)
+REFERENCES = {
+    'rides': {
+        'passenger_id': ('passengers', 'passenger_id'),
+        'driver_id': ('drivers', 'driver_id'),
+    },
+}
+
+def _existing(conn, table, key, values, chunk=500):
+    values = sorted(values)
+    found = set()
+    cursor = conn.cursor()
+    for i in range(0, len(values), chunk):
+        part = values[i:i + chunk]
+        cursor.execute(f"SELECT {key} FROM {table} WHERE {key} IN ({', '.join('?' for _ in part)})", part)
+        found.update(row[0] for row in cursor.fetchall())
+    return found
+
+def _missing_ids(conn, table, key, ids):
+    return set(ids) - _existing(conn, table, key, ids)
+
+def validate_file(table, path, fmt=None, conn=None, max_errors=20):
+    errors = []
+    count = 0
+    references = REFERENCES.get(table, {})
+    seen = {field: set() for field in references}
+    unique = {field: set() for field in UNIQUE.get(table, ())}
+    required = required_fields(conn, table) if conn is not None else ()
+    for count, row in enumerate(read_rows(path, fmt), start=1):
+        try:
+            clean = validate_row(table, row, required)
+        except ValueError as error:
+            errors.append((count, str(error)))
+            if len(errors) >= max_errors:
+                break
+            continue
+        for field in references:
+            seen[field].add(clean[field])
+        for field, values in unique.items():
+            value = clean.get(field)
+            if value is None:
+                continue
+            if value in values:
+                errors.append((count, f"{field}: повтор значения {value!r} в файле"))
+                if len(errors) >= max_errors:
+                    break
+            values.add(value)
+        if len(errors) >= max_errors:
+            break
+    if conn is not None and not errors:
+        # ссылки и уникальность проверяются по множествам значений, а не построчно
+        for field, (ref_table, key) in references.items():
+            missing = _missing_ids(conn, ref_table, key, seen[field])
+            if missing:
+                errors.append((None, f"{field}: нет записей в {ref_table} с id {sorted(missing)[:10]}"))
+        mapping = _target_columns(conn, table)
+        for field, values in unique.items():
+            if field not in mapping:
+                continue
+            taken = _existing(conn, table, mapping[field], values)
+            if taken:
+                errors.append((None, f"{field}: уже есть в {table}: {sorted(taken)[:10]}"))
+    return count, errors
+
+def _table_columns(conn, table):
+    cursor = conn.cursor()
+    cursor.execute(f"PRAGMA table_info({table})")
+    return [row[1] for row in cursor.fetchall()]
+
+def required_fields(conn, table):
+    # NOT NULL без значения по умолчанию в конкретной схеме базы
+    mapping = _target_columns(conn, table)
+    cursor = conn.cursor()
+    cursor.execute(f"PRAGMA table_info({table})")
+    strict = {row[1] for row in cursor.fetchall() if row[3] and row[4] is None and not row[5]}
+    return {field for field, column in mapping.items() if column in strict}
+
+def _target_columns(conn, table):
+    # поле спецификации -> колонка, которая реально есть в таблице
+    existing = set(_table_columns(conn, table))
+    reverse = {field: column for column, field in ALIASES.get(table, {}).items()}
+    mapping = {}
+    for field in SPECS[table]:
+        if field in existing:
+            mapping[field] = field
+        elif reverse.get(field) in existing:
+            mapping[field] = reverse[field]
+    return mapping
+
+def _drop_indexes(conn, table):
+    with transaction(conn) as cursor:
+        cursor.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+            (table,),
+        )
+        indexes = cursor.fetchall()
+        for name, _ in indexes:
+            cursor.execute(f"DROP INDEX {name}")
+    return [sql for _, sql in indexes]
+
+def _restore_indexes(conn, statements):
+    with transaction(conn) as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+        cursor.execute("ANALYZE")
+
+def bulk_load(conn, table, rows, batch_size=10000, defer_indexes=False, progress=True):
+    if table not in SPECS:
+        raise ValueError(f"Таблица {table} не поддерживается")
+    mapping = _target_columns(conn, table)
+    fields = list(mapping)
+    required = required_fields(conn, table)
+    statements = {}
+
+    def insert_sql(present):
+        # в INSERT только заполненные поля: у пропущенных колонок срабатывает
+        # DEFAULT схемы (created_at, rating, status), явный NULL его бы обошёл
+        if present not in statements:
+            statements[present] = "INSERT INTO {} ({}) VALUES ({})".format(
+                table, ", ".join(mapping[field] for field in present), ", ".join("?" for _ in present)
+            )
+        return statements[present]
+
+    deferred = []
+    had_rollups = False
+    had_series = False
+    if defer_indexes:
+        deferred = _drop_indexes(conn, table)
+        # агрегаты поездок тоже пересчитываются один раз после загрузки
+        if table == 'rides' and rollups.rollups_enabled(conn):
+            had_rollups = True
+            rollups.drop_rollups(conn)
+        if table == 'rides' and ride_series.series_enabled(conn):
+            had_series = True
+            ride_series.drop_series(conn)
+
+    total = 0
+    start = time.perf_counter()
+    rows = iter(rows)
+    try:
+        while True:
+            batch = list(itertools.islice(rows, batch_size))
+            if not batch:
+                break
+            cleaned = []
+            for row in batch:
+                clean = validate_row(table, row, required)
+                cleaned.append((tuple(field for field in fields if clean.get(field) is not None), clean))
+            # подряд идущие строки с одним набором полей - один executemany,
+            # порядок строк файла сохраняется; в CSV набор обычно один на пачку
+            with transaction(conn) as cursor:
+                for present, group in itertools.groupby(cleaned, key=lambda item: item[0]):
+                    cursor.executemany(insert_sql(present), ([clean[field] for field in present] for _, clean in group))
+            total += len(batch)
+            if progress:
+                elapsed = time.perf_counter() - start
+                print(f"\rЗагружено {total} строк, {total / elapsed:,.0f} строк/с", end="", flush=True)
+    finally:
+        if deferred:
+            _restore_indexes(conn, deferred)
+        if had_rollups:
+            rollups.ensure_rollups(conn)
+        if had_series:
+            ride_series.ensure_series(conn)
+
+    elapsed = time.perf_counter() - start
+    rate = total / elapsed if elapsed else 0
+    if progress:
+        print(f"\rЗагружено {total} строк в {table} за {elapsed:.2f} с ({rate:,.0f} строк/с)")
+    return total, rate
+
+def main():
+    parser = argparse.ArgumentParser(description="Массовая загрузка пассажиров, водителей и поездок")
+    parser.add_argument('table', choices=sorted(SPECS))
+    parser.add_argument('path', help="файл CSV или JSONL")
+    parser.add_argument('--format', choices=('csv', 'jsonl'))
+    parser.add_argument('--batch-size', type=int, default=10000)
+    parser.add_argument('--defer-indexes', action='store_true',
+                        help="удалить индексы таблицы на время загрузки и построить заново")
+    parser.add_argument('--skip-validation', action='store_true',
+                        help="не проверять файл целиком перед загрузкой")
+    args = parser.parse_args()
+
+    conn = connect()
+    if not args.skip_validation:
+        count, errors = validate_file(args.table, args.path, args.format, conn)
+        if errors:
+            for line, error in errors:
+                print(f"Строка {line}: {error}" if line else error)
+            print("Загрузка отменена")
+            sys.exit(1)
+        print(f"Проверено строк: {count}")
+
+    bulk_load(conn, args.table, read_rows(args.path, args.format),
+              batch_size=args.batch_size, defer_indexes=args.defer_indexes)
+    conn.close()
+
+if __name__ == "__main__":
+    main()
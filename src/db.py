@@ -0,0 +1,142 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from urllib.request import pathname2url
+
+DB_PATH = os.environ.get('FAKETAXI_DB', 'database.db')
+
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA foreign_keys = ON",
+)
+
+# журнал WAL включает писатель: у копии базы для отчётов (replica.py) режим
+# DELETE, и PRAGMA journal_mode = WAL на соединении только для чтения упала бы
+READONLY_PRAGMAS = (
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA query_only = ON",
+)
+
+# sqlite3 держит кэш подготовленных запросов на каждое соединение,
+# поэтому соединения живут в пуле и переиспользуются
+STATEMENT_CACHE_SIZE = 256
+
+def connect(path=None, readonly=False):
+    path = path or DB_PATH
+    if readonly:
+        path = f"file:{pathname2url(os.path.abspath(path))}?mode=ro"
+    conn = sqlite3.connect(
+        path,
+        isolation_level=None,
+        check_same_thread=False,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        uri=readonly,
+    )
+    conn.row_factory = sqlite3.Row
+    for pragma in READONLY_PRAGMAS if readonly else PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+@contextmanager
+def transaction(conn, mode='IMMEDIATE'):
+    cursor = conn.cursor()
+    if conn.in_transaction:
+        # вложенный вызов: откатываем только свою часть
+        conn.execute("SAVEPOINT nested")
+        try:
+            yield cursor
+        except BaseException:
+            conn.execute("ROLLBACK TO nested")
+            conn.execute("RELEASE nested")
+            raise
+        conn.execute("RELEASE nested")
+        return
+
+    conn.execute(f"BEGIN {mode}")
+    try:
+        yield cursor
+    except BaseException:
+        conn.rollback()
+        raise
+    try:
+        conn.commit()
+    except BaseException:
+        # COMMIT не прошёл (например, SQLITE_BUSY): транзакция осталась
+        # открытой, и соединение не должно вернуться в пул в таком виде
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+
+class ConnectionPool:
+    def __init__(self, path=None, size=8, timeout=30):
+        self.path = path or DB_PATH
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._closed = False
+
+    def acquire(self):
+        if self._closed:
+            raise RuntimeError("Пул соединений закрыт")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return connect(self.path)
+                except Exception:
+                    self._created -= 1
+                    raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(f"Нет свободных соединений за {self.timeout} с") from None
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        if self._closed:
+            conn.close()
+            return
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    @contextmanager
+    def transaction(self, mode='IMMEDIATE'):
+        with self.connection() as conn:
+            with transaction(conn, mode) as cursor:
+                yield cursor
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool()
+        return _pool
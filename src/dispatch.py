@@ -0,0 +1,230 @@
+import argparse
+import heapq
+import math
+import random
+import threading
+import time
+from collections import defaultdict
+
+import group_commit
+
+# Нижний Новгород: сюда попадают случайные точки симулятора
+CITY = (56.22, 43.75, 56.40, 44.10)
+
+class DriverIndex:
+    # равномерная сетка в километрах (как geohash, но с ячейкой нужного размера):
+    # координаты проецируются на плоскость вокруг origin_lat, для города
+    # погрешность такой проекции меньше точности GPS
+    def __init__(self, cell_km=0.5, origin_lat=56.3):
+        self.cell_km = cell_km
+        self._kx = 111.32 * math.cos(math.radians(origin_lat))
+        self._ky = 110.57
+        self._cells = defaultdict(set)
+        self._where = {}
+
+    def _point(self, lat, lon):
+        return lon * self._kx, lat * self._ky
+
+    def _cell(self, x, y):
+        return int(x // self.cell_km), int(y // self.cell_km)
+
+    def __len__(self):
+        return len(self._where)
+
+    def __contains__(self, driver_id):
+        return driver_id in self._where
+
+    def add(self, driver_id, lat, lon):
+        self.remove(driver_id)
+        x, y = self._point(lat, lon)
+        cell = self._cell(x, y)
+        self._cells[cell].add(driver_id)
+        self._where[driver_id] = (x, y, cell)
+
+    def remove(self, driver_id):
+        entry = self._where.pop(driver_id, None)
+        if entry is not None:
+            drivers = self._cells[entry[2]]
+            drivers.discard(driver_id)
+            if not drivers:
+                del self._cells[entry[2]]
+
+    def nearest(self, lat, lon, k=1, max_km=20):
+        if not self._where:
+            return []
+        x, y = self._point(lat, lon)
+        cx, cy = self._cell(x, y)
+        best = []
+        # кольца ячеек вокруг точки; водители в кольце r не ближе (r - 1) * cell_km
+        for r in range(int(max_km // self.cell_km) + 2):
+            if len(best) >= k and -best[0][0] <= (r - 1) * self.cell_km:
+                break
+            for cell in self._ring(cx, cy, r):
+                for driver_id in self._cells.get(cell, ()):
+                    px, py, _ = self._where[driver_id]
+                    distance = math.hypot(px - x, py - y)
+                    if distance > max_km:
+                        continue
+                    if len(best) < k:
+                        heapq.heappush(best, (-distance, driver_id))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, driver_id))
+        return sorted((-distance, driver_id) for distance, driver_id in best)
+
+    @staticmethod
+    def _ring(cx, cy, r):
+        if r == 0:
+            yield cx, cy
+            return
+        for dx in range(-r, r + 1):
+            yield cx + dx, cy - r
+            yield cx + dx, cy + r
+        for dy in range(-r + 1, r):
+            yield cx - r, cy + dy
+            yield cx + r, cy + dy
+
+class Dispatcher:
+    # в индексе только свободные водители; резерв снимает водителя из индекса
+    # под блокировкой, поэтому два заказа не получат одного и того же водителя
+    def __init__(self, index=None):
+        self.index = index or DriverIndex()
+        self.busy = {}
+        self._lock = threading.Lock()
+
+    def set_available(self, driver_id, lat, lon):
+        with self._lock:
+            self.busy.pop(driver_id, None)
+            self.index.add(driver_id, lat, lon)
+
+    def set_offline(self, driver_id):
+        with self._lock:
+            self.busy.pop(driver_id, None)
+            self.index.remove(driver_id)
+
+    def nearest(self, lat, lon, k=5, max_km=20):
+        with self._lock:
+            return self.index.nearest(lat, lon, k, max_km)
+
+    def reserve(self, lat, lon, max_km=20):
+        with self._lock:
+            found = self.index.nearest(lat, lon, 1, max_km)
+            if not found:
+                return None
+            distance, driver_id = found[0]
+            self.index.remove(driver_id)
+            self.busy[driver_id] = (lat, lon)
+            return driver_id, distance
+
+    def release(self, driver_id, lat=None, lon=None):
+        # без координат водитель возвращается в точку подачи
+        with self._lock:
+            position = self.busy.pop(driver_id, None)
+            if lat is None:
+                if position is None:
+                    return
+                lat, lon = position
+            self.index.add(driver_id, lat, lon)
+
+def _book(cursor, passenger_id, driver_id, pickup_location, dropoff_location, price):
+    # поездка и занятость водителя - одна транзакция: иначе при сбое второй
+    # записи водитель вернётся в индекс, а поездка на него останется
+    cursor.execute('''
+        INSERT INTO rides (passenger_id, driver_id, pickup_location, dropoff_location, price)
+        VALUES (?, ?, ?, ?, ?)
+        ''', (passenger_id, driver_id, pickup_location, dropoff_location, price))
+    ride_id = cursor.lastrowid
+    cursor.execute("UPDATE drivers SET status = 'working' WHERE driver_id = ?", (driver_id,))
+    return ride_id
+
+def create_ride(conn, dispatcher, passenger_id, lat, lon, pickup_location, dropoff_location, price, max_km=20):
+    import main as app
+
+    reserved = dispatcher.reserve(lat, lon, max_km)
+    if reserved is None:
+        return None
+    driver_id, distance = reserved
+    try:
+        ride_id = group_commit.run(conn, _book, passenger_id, driver_id, pickup_location, dropoff_location, price)
+    except Exception:
+        dispatcher.release(driver_id)
+        raise
+    app.report("Поездка добавлена")
+    return ride_id, driver_id, distance
+
+def finish_ride(conn, dispatcher, driver_id, lat, lon):
+    import main as app
+
+    app.execute_write(conn, "UPDATE drivers SET status = 'waiting' WHERE driver_id = ?", (driver_id,))
+    dispatcher.release(driver_id, lat, lon)
+
+def random_point(rng):
+    lat_min, lon_min, lat_max, lon_max = CITY
+    return rng.uniform(lat_min, lat_max), rng.uniform(lon_min, lon_max)
+
+def brute_nearest(index, lat, lon):
+    x, y = index._point(lat, lon)
+    return min((math.hypot(px - x, py - y), driver_id) for driver_id, (px, py, _) in index._where.items())
+
+def simulate(drivers=5000, requests=100000, rate=3, trip_minutes=(5, 40), cell_km=0.5, check=False, seed=1):
+    # заказы идут с частотой rate в секунду модельного времени; поездка
+    # освобождает водителя в точке высадки через trip_minutes
+    rng = random.Random(seed)
+    dispatcher = Dispatcher(DriverIndex(cell_km))
+    for driver_id in range(1, drivers + 1):
+        dispatcher.set_available(driver_id, *random_point(rng))
+
+    trips = []
+    latencies = []
+    missed = 0
+    wrong = 0
+    start = time.perf_counter()
+    for i in range(requests):
+        now = i / rate
+        while trips and trips[0][0] <= now:
+            _, driver_id, lat, lon = heapq.heappop(trips)
+            dispatcher.release(driver_id, lat, lon)
+
+        lat, lon = random_point(rng)
+        if check and len(dispatcher.index):
+            expected = brute_nearest(dispatcher.index, lat, lon)
+        t = time.perf_counter()
+        reserved = dispatcher.reserve(lat, lon)
+        latencies.append(time.perf_counter() - t)
+        if reserved is None:
+            missed += 1
+            continue
+        if check and abs(reserved[1] - expected[0]) > 1e-9:
+            wrong += 1
+        duration = rng.uniform(*trip_minutes) * 60
+        heapq.heappush(trips, (now + duration, reserved[0], *random_point(rng)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "per_second": requests / elapsed,
+        "p50_us": latencies[len(latencies) // 2] * 1e6,
+        "p99_us": latencies[int(len(latencies) * 0.99)] * 1e6,
+        "missed": missed,
+        "wrong": wrong,
+        "busy": len(dispatcher.busy),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Симулятор подбора ближайшего свободного водителя")
+    parser.add_argument('--drivers', type=int, default=5000)
+    parser.add_argument('--requests', type=int, default=100000)
+    parser.add_argument('--rate', type=float, default=3, help="заказов в секунду модельного времени")
+    parser.add_argument('--cell-km', type=float, default=0.5)
+    parser.add_argument('--check', action='store_true', help="сверять каждый подбор с полным перебором")
+    args = parser.parse_args()
+
+    stats = simulate(args.drivers, args.requests, args.rate, cell_km=args.cell_km, check=args.check)
+    print(f"Заказов: {stats['requests']}, {stats['per_second']:,.0f} в секунду")
+    print(f"Подбор водителя: p50 {stats['p50_us']:.1f} мкс, p99 {stats['p99_us']:.1f} мкс")
+    print(f"Без водителя: {stats['missed']}, заняты сейчас: {stats['busy']}")
+    if args.check:
+        print(f"Не ближайший водитель: {stats['wrong']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import argparse
+import json
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# тариф -> подача, руб/км, руб/мин, минимальная стоимость
+FARES = {
+    'Эконом': {'base': 99.0, 'per_km': 12.0, 'per_min': 4.0, 'minimum': 150.0},
+    'Комфорт': {'base': 149.0, 'per_km': 18.0, 'per_min': 6.0, 'minimum': 250.0},
+    'Премиум': {'base': 299.0, 'per_km': 32.0, 'per_min': 10.0, 'minimum': 600.0},
+}
+
+FARE_FIELDS = ('base', 'per_km', 'per_min', 'minimum')
+
+def load_fares(path):
+    # файл JSON переопределяет поля тарифов по умолчанию и может добавлять новые
+    with open(path, encoding='utf-8') as f:
+        custom = json.load(f)
+    fares = {name: dict(fare) for name, fare in FARES.items()}
+    for name, fare in custom.items():
+        fares.setdefault(name, dict(FARES['Эконом'])).update(fare)
+    return fares
+
+def surge_multiplier(demand, supply, cap=3.0):
+    # заказов на свободного водителя, с шагом 0.1 и потолком cap
+    if supply <= 0:
+        return cap
+    return min(cap, max(1.0, round(demand / supply, 1)))
+
+def _round(price):
+    # так же, как np.round(x, 2): иначе пакетный и поштучный расчёт расходятся в копейках
+    return round(price * 100) / 100
+
+def quote(distance_km, duration_min, tariff='Эконом', surge=1.0, fares=FARES):
+    try:
+        fare = fares[tariff]
+    except KeyError:
+        raise ValueError(f"Неизвестный тариф: {tariff}") from None
+    price = fare['base'] + fare['per_km'] * distance_km + fare['per_min'] * duration_min
+    return _round(max(price, fare['minimum']) * surge)
+
+def quote_batch(distances, durations, tariffs, surge=1.0, fares=FARES):
+    # tariffs - названия или номера тарифов в порядке fares; surge - число или массив
+    names = list(fares)
+    if np is None:
+        return _quote_batch_python(distances, durations, tariffs, surge, fares, names)
+
+    table = np.array([[fares[name][field] for field in FARE_FIELDS] for name in names])
+    tariffs = np.asarray(tariffs)
+    if tariffs.dtype.kind in 'iu':
+        codes = tariffs
+    else:
+        unique, inverse = np.unique(tariffs, return_inverse=True)
+        unknown = [str(name) for name in unique if name not in fares]
+        if unknown:
+            raise ValueError(f"Неизвестный тариф: {', '.join(unknown)}")
+        codes = np.array([names.index(name) for name in unique])[inverse]
+    base, per_km, per_min, minimum = table[codes].T
+    price = base + per_km * np.asarray(distances, dtype=float) + per_min * np.asarray(durations, dtype=float)
+    return np.round(np.maximum(price, minimum) * surge, 2)
+
+def _quote_batch_python(distances, durations, tariffs, surge, fares, names):
+    rows = [tuple(fares[name][field] for field in FARE_FIELDS) for name in names]
+    params = {name: row for name, row in zip(names, rows)}
+    params.update(enumerate(rows))
+    if not isinstance(surge, (int, float)):
+        surges = surge
+    else:
+        surges = [surge] * len(distances)
+    result = []
+    for distance, duration, tariff, factor in zip(distances, durations, tariffs, surges):
+        try:
+            base, per_km, per_min, minimum = params[tariff]
+        except KeyError:
+            raise ValueError(f"Неизвестный тариф: {tariff}") from None
+        result.append(_round(max(base + per_km * distance + per_min * duration, minimum) * factor))
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Предварительный расчёт стоимости поездки")
+    parser.add_argument('distance', type=float, help="расстояние, км")
+    parser.add_argument('duration', type=float, help="время в пути, мин")
+    parser.add_argument('--surge', type=float, default=1.0)
+    parser.add_argument('--fares', help="JSON с тарифами")
+    args = parser.parse_args()
+
+    fares = load_fares(args.fares) if args.fares else FARES
+    for name in fares:
+        print(f"{name}: {quote(args.distance, args.duration, name, args.surge, fares)} руб.")
+
+if __name__ == "__main__":
+    main()
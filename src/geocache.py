@@ -0,0 +1,245 @@
+import hashlib
+import math
+import os
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from db import connect, transaction
+from dispatch import CITY
+
+CACHE_PATH = os.environ.get('FAKETAXI_GEOCACHE', 'geocache.db')
+TTL = 30 * 24 * 3600
+
+# сокращения -> полная форма; ключ кэша строится по нормализованному адресу
+ABBREVIATIONS = {
+    'ул': 'улица',
+    'пр': 'проспект',
+    'пр-т': 'проспект',
+    'просп': 'проспект',
+    'пл': 'площадь',
+    'пер': 'переулок',
+    'наб': 'набережная',
+    'ш': 'шоссе',
+    'б-р': 'бульвар',
+    'бул': 'бульвар',
+    'д': 'дом',
+    'м': 'метро',
+    'ст': 'станция',
+}
+
+def normalize_address(address):
+    text = address.lower().replace('ё', 'е')
+    text = re.sub(r'^(г|город)\.?\s+нижний новгород,?\s*', '', text.strip())
+    words = re.findall(r'[\w-]+', text)
+    return ' '.join(ABBREVIATIONS.get(word, word) for word in words)
+
+def haversine_km(a, b):
+    lat1, lon1, lat2, lon2 = map(math.radians, (*a, *b))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0 * math.asin(math.sqrt(h))
+
+class LocalResolver:
+    # заглушка вместо внешнего геокодера: известные точки города, остальные
+    # адреса получают стабильные координаты из хеша; маршрут - расстояние
+    # по прямой с коэффициентом извилистости дорог и средней скоростью
+    PLACES = {
+        'парк культуры': (56.2594, 43.8669),
+        'метро горьковская': (56.3139, 43.9946),
+        'проспект ленина 68': (56.2748, 43.9193),
+        'кащенко 5': (56.2974, 43.9816),
+        'площадь минина': (56.3269, 44.0065),
+        'московский вокзал': (56.3216, 43.9460),
+        'аэропорт стригино': (56.2301, 43.7840),
+    }
+
+    def __init__(self, road_factor=1.35, speed_kmh=25.0):
+        self.road_factor = road_factor
+        self.speed_kmh = speed_kmh
+        self.calls = 0
+
+    def geocode(self, address):
+        self.calls += 1
+        if address in self.PLACES:
+            return self.PLACES[address]
+        digest = hashlib.sha1(address.encode('utf-8')).digest()
+        lat_min, lon_min, lat_max, lon_max = CITY
+        lat = lat_min + (lat_max - lat_min) * int.from_bytes(digest[:4], 'big') / 2 ** 32
+        lon = lon_min + (lon_max - lon_min) * int.from_bytes(digest[4:8], 'big') / 2 ** 32
+        return round(lat, 6), round(lon, 6)
+
+    def route(self, origin, destination):
+        self.calls += 1
+        distance = haversine_km(origin, destination) * self.road_factor
+        return round(distance, 2), round(distance / self.speed_kmh * 60, 1)
+
+class LRUCache:
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, now=None):
+        now = now or time.time()
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            if item[1] <= now:
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return item[0]
+
+    def put(self, key, value, expires_at):
+        with self._lock:
+            self._items[key] = (value, expires_at)
+            self._items.move_to_end(key)
+            if len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def __len__(self):
+        return len(self._items)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+CACHE_DDL = (
+    '''
+    CREATE TABLE IF NOT EXISTS geocode_cache (
+        address TEXT PRIMARY KEY,
+        lat REAL NOT NULL,
+        lon REAL NOT NULL,
+        expires_at REAL NOT NULL
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS route_cache (
+        origin TEXT NOT NULL,
+        destination TEXT NOT NULL,
+        distance_km REAL NOT NULL,
+        duration_min REAL NOT NULL,
+        expires_at REAL NOT NULL,
+        PRIMARY KEY (origin, destination)
+    ) WITHOUT ROWID
+    ''',
+)
+
+class GeoCache:
+    # три уровня: LRU в памяти -> файл SQLite -> resolver; у записей общий TTL
+    def __init__(self, resolver=None, path=None, maxsize=10000, ttl=TTL):
+        self.resolver = resolver or LocalResolver()
+        self.ttl = ttl
+        self.memory = LRUCache(maxsize)
+        self.conn = connect(path or CACHE_PATH)
+        self._lock = threading.Lock()
+        with transaction(self.conn) as cursor:
+            for ddl in CACHE_DDL:
+                cursor.execute(ddl)
+        # кэш общий для потоков сервиса: += над счётчиком не атомарен
+        self._counters_lock = threading.Lock()
+        self.counters = {
+            'geocode': {'memory': 0, 'disk': 0, 'resolver': 0},
+            'route': {'memory': 0, 'disk': 0, 'resolver': 0},
+        }
+
+    def _count(self, kind, source):
+        with self._counters_lock:
+            self.counters[kind][source] += 1
+
+    def _lookup(self, kind, key, select, params, compute, store):
+        now = time.time()
+        value = self.memory.get((kind, key), now)
+        if value is not None:
+            self._count(kind, 'memory')
+            return value
+        with self._lock:
+            row = self.conn.execute(select, params + (now,)).fetchone()
+        if row is not None:
+            self._count(kind, 'disk')
+            value = tuple(row)[:-1]
+            self.memory.put((kind, key), value, row[-1])
+            return value
+        self._count(kind, 'resolver')
+        value = compute()
+        expires_at = now + self.ttl
+        with self._lock, transaction(self.conn) as cursor:
+            cursor.execute(store, params + tuple(value) + (expires_at,))
+        self.memory.put((kind, key), value, expires_at)
+        return value
+
+    def coordinates(self, address):
+        key = normalize_address(address)
+        return self._lookup(
+            'geocode', key,
+            "SELECT lat, lon, expires_at FROM geocode_cache WHERE address = ? AND expires_at > ?",
+            (key,),
+            lambda: self.resolver.geocode(key),
+            "INSERT OR REPLACE INTO geocode_cache (address, lat, lon, expires_at) VALUES (?, ?, ?, ?)",
+        )
+
+    def route(self, origin, destination):
+        key = (normalize_address(origin), normalize_address(destination))
+        return self._lookup(
+            'route', key,
+            "SELECT distance_km, duration_min, expires_at FROM route_cache "
+            "WHERE origin = ? AND destination = ? AND expires_at > ?",
+            key,
+            lambda: self.resolver.route(self.coordinates(origin), self.coordinates(destination)),
+            "INSERT OR REPLACE INTO route_cache (origin, destination, distance_km, duration_min, expires_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+        )
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock, transaction(self.conn) as cursor:
+            cursor.execute("DELETE FROM geocode_cache WHERE expires_at <= ?", (now,))
+            removed = cursor.rowcount
+            cursor.execute("DELETE FROM route_cache WHERE expires_at <= ?", (now,))
+            return removed + cursor.rowcount
+
+    def stats(self):
+        with self._counters_lock:
+            counters = {kind: dict(counts) for kind, counts in self.counters.items()}
+        result = {}
+        for kind, counts in counters.items():
+            total = sum(counts.values())
+            result[kind] = dict(counts, total=total,
+                                hit_rate=(counts['memory'] + counts['disk']) / total if total else 0.0)
+        result['memory_size'] = len(self.memory)
+        return result
+
+    def close(self):
+        self.conn.close()
+
+_cache = None
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        _cache = GeoCache()
+    return _cache
+
+def print_stats(stats):
+    for kind in ('geocode', 'route'):
+        counts = stats[kind]
+        print(f"{kind}: запросов {counts['total']}, из памяти {counts['memory']}, с диска {counts['disk']}, "
+              f"вычислено {counts['resolver']}, попаданий {counts['hit_rate']:.1%}")
+
+def main():
+    if len(sys.argv) == 4 and sys.argv[1] == "route":
+        cache = get_cache()
+        distance, duration = cache.route(sys.argv[2], sys.argv[3])
+        print(f"{distance} км, {duration} мин")
+        print_stats(cache.stats())
+    elif len(sys.argv) == 2 and sys.argv[1] == "purge":
+        print(f"Удалено устаревших записей: {get_cache().purge_expired()}")
+    else:
+        print(f"Использование: python {sys.argv[0]} route <откуда> <куда> | purge")
+        sys.exit(2)
+
+if __name__ == "__main__":
+    main()
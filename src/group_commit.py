@@ -0,0 +1,153 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from db import DB_PATH, connect, transaction
+
+_STOP = object()
+
+class GroupCommitWriter:
+    # все записи идут через один поток и одно соединение: операции копятся
+    # в общую транзакцию, которая фиксируется каждые max_ops операций
+    # или через max_delay_ms после первой операции группы. При max_delay_ms=0
+    # группа - всё, что накопилось в очереди, пока шёл предыдущий COMMIT
+    def __init__(self, path=None, max_ops=64, max_delay_ms=0):
+        self.path = path or DB_PATH
+        self.max_ops = max_ops
+        self.max_delay = max_delay_ms / 1000
+        self._queue = queue.Queue()
+        self._closed = False
+        self.groups = 0
+        self.ops = 0
+        self._thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args, durable=False):
+        # fn(cursor, *args) выполняется в потоке записи; future получает её результат
+        # после COMMIT. durable=True - отдельная транзакция с synchronous = FULL
+        if self._closed:
+            raise RuntimeError("Поток записи остановлен")
+        future = Future()
+        self._queue.put((fn, args, durable, future))
+        return future
+
+    def execute(self, sql, params=(), durable=False):
+        return self.submit(_execute, sql, params, durable=durable)
+
+    def flush(self):
+        return self.submit(_noop)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _run(self):
+        conn = connect(self.path)
+        carry = None
+        while True:
+            item = carry or self._queue.get()
+            carry = None
+            if item is _STOP:
+                break
+            if item[2]:
+                self._commit(conn, [item], durable=True)
+                continue
+            group = [item]
+            deadline = time.monotonic() + self.max_delay
+            while len(group) < self.max_ops:
+                # после дедлайна добираем только то, что уже стоит в очереди
+                timeout = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP or item[2]:
+                    # строгая запись не смешивается с группой
+                    carry = item
+                    break
+                group.append(item)
+            self._commit(conn, group)
+        conn.close()
+
+    def _commit(self, conn, group, durable=False):
+        results = []
+        if durable:
+            conn.execute("PRAGMA synchronous = FULL")
+        try:
+            with transaction(conn):
+                for fn, args, _, future in group:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    # ошибка одной операции откатывает только её savepoint
+                    try:
+                        with transaction(conn) as cursor:
+                            results.append((future, fn(cursor, *args), None))
+                    except Exception as error:
+                        results.append((future, None, error))
+        except Exception as error:
+            for _, _, _, future in group:
+                if future.running():
+                    future.set_exception(error)
+            return
+        finally:
+            if durable:
+                conn.execute("PRAGMA synchronous = NORMAL")
+        self.groups += 1
+        self.ops += len(results)
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+def _execute(cursor, sql, params):
+    cursor.execute(sql, params)
+    return cursor.rowcount, cursor.lastrowid
+
+def _noop(cursor):
+    return None
+
+_writer = None
+
+def enable(path=None, max_ops=64, max_delay_ms=0):
+    global _writer
+    disable()
+    _writer = GroupCommitWriter(path, max_ops, max_delay_ms)
+    return _writer
+
+def disable():
+    global _writer
+    if _writer is not None:
+        _writer.close()
+        _writer = None
+
+def get_writer():
+    return _writer
+
+@contextmanager
+def durable_transaction(conn, durable=True):
+    # synchronous = FULL на время одной транзакции, как в GroupCommitWriter._commit:
+    # при NORMAL в WAL последний COMMIT может пропасть при отключении питания.
+    # Внутри открытой транзакции режим не меняется (SQLite это запрещает):
+    # надёжность тогда определяет внешний COMMIT
+    durable = durable and not conn.in_transaction
+    if durable:
+        conn.execute("PRAGMA synchronous = FULL")
+    try:
+        with transaction(conn) as cursor:
+            yield cursor
+    finally:
+        if durable:
+            conn.execute("PRAGMA synchronous = NORMAL")
+
+def run(conn, fn, *args, durable=False):
+    # fn(cursor, *args) через поток записи, если он включён, иначе в транзакции на conn
+    if _writer is not None:
+        return _writer.submit(fn, *args, durable=durable).result()
+    with durable_transaction(conn, durable) as cursor:
+        return fn(cursor, *args)
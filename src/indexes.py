@@ -0,0 +1,87 @@
+import sqlite3
+import sys
+
+from db import connect, transaction
+
+INDEXES = (
+    ('idx_rides_status_price', 'rides', '(status, price)'),
+    ('idx_rides_passenger_price', 'rides', '(passenger_id, price)'),
+    ('idx_rides_driver', 'rides', '(driver_id)'),
+    ('idx_support_tickets_status_id', 'support_tickets', '(status, ticket_id DESC)'),
+    ('idx_support_tickets_category', 'support_tickets', '(category)'),
+)
+
+# запросы, план которых проверяет audit(); регистрирует их сам main.py
+QUERIES = {}
+
+def register_query(name, sql, params=(), allow_scan=()):
+    QUERIES[name] = (sql, params, set(allow_scan))
+    return sql
+
+def create_indexes(conn):
+    with transaction(conn) as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        tables = {row[0] for row in cursor.fetchall()}
+        for name, table, columns in INDEXES:
+            # таблицы support_tickets нет в схеме init_database.py
+            if table in tables:
+                cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} {columns}")
+        cursor.execute("ANALYZE")
+
+def full_scans(conn, sql, params=(), allow_scan=()):
+    cursor = conn.cursor()
+    cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+    scans = []
+    for row in cursor.fetchall():
+        detail = row['detail']
+        # "SCAN t USING COVERING INDEX ..." читает только индекс, это допустимо
+        if detail.startswith('SCAN ') and ' INDEX ' not in detail:
+            table = detail.split()[1]
+            if table not in allow_scan:
+                scans.append(detail)
+    return scans
+
+def schema_copy(conn):
+    # та же схема без данных и без статистики ANALYZE: на маленькой таблице
+    # sqlite_stat1 склоняет планировщик к SCAN, и проверка зависела бы от
+    # содержимого базы, а не от индексов
+    copy = sqlite3.connect(':memory:')
+    copy.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT sql FROM sqlite_master WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite%' "
+        "ORDER BY CASE type WHEN 'table' THEN 0 WHEN 'index' THEN 1 WHEN 'view' THEN 2 ELSE 3 END, rowid"
+    )
+    for row in cursor.fetchall():
+        copy.execute(row[0])
+    return copy
+
+def audit(conn):
+    failed = {}
+    copy = schema_copy(conn)
+    for name, (sql, params, allow_scan) in QUERIES.items():
+        scans = full_scans(copy, sql, params, allow_scan)
+        if scans:
+            failed[name] = scans
+            print(f"FAIL {name}: {'; '.join(scans)}")
+        else:
+            print(f"ok   {name}")
+    copy.close()
+    return failed
+
+def main():
+    # запросы регистрируются при импорте main.py в модуле indexes,
+    # а не в __main__, поэтому обращаемся к нему по имени
+    import main as app
+    import indexes
+
+    conn = connect()
+    app.create_tables(conn)
+    failed = indexes.audit(conn)
+    conn.close()
+    if failed:
+        print(f"\nПолный просмотр таблицы в {len(failed)} запросах")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
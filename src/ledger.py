@@ -0,0 +1,348 @@
+import argparse
+import sys
+import time
+
+from db import connect, transaction
+import group_commit
+
+# комиссия сервиса с завершённой поездки, процентов
+COMMISSION_PERCENT = 20
+
+SNAPSHOT_BATCH = 1000
+SNAPSHOT_PAUSE = 0.005
+
+TRIGGER_NAMES = (
+    'driver_ledger_no_update', 'driver_ledger_no_delete',
+    'driver_ledger_ride_insert', 'driver_ledger_ride_update', 'driver_ledger_ride_delete',
+    'driver_ledger_driver_insert',
+)
+
+# суммы в копейках INTEGER: сумма REAL по миллионам проводок копит погрешность
+def _gross(r):
+    return f"CAST(ROUND({r}.price * 100) AS INTEGER)"
+
+def _gross_balance(d):
+    return f"CAST(ROUND(IFNULL({d}.balance, 0) * 100) AS INTEGER)"
+
+def _commission(r):
+    return f"CAST(ROUND({r}.price * {COMMISSION_PERCENT}) AS INTEGER)"
+
+def _post_sql(r):
+    # начисление за завершённую поездку: выплата водителю и комиссия сервиса
+    return f'''
+        INSERT INTO driver_ledger (driver_id, ride_id, kind, amount)
+        SELECT {r}.driver_id, {r}.ride_id, 'payout', {_gross(r)}
+        WHERE {r}.status = 'completed' AND {r}.driver_id IS NOT NULL AND {r}.price IS NOT NULL
+        UNION ALL
+        SELECT {r}.driver_id, {r}.ride_id, 'commission', -{_commission(r)}
+        WHERE {r}.status = 'completed' AND {r}.driver_id IS NOT NULL AND {r}.price IS NOT NULL;'''
+
+def _reverse_sql(r):
+    # журнал не правится: отмена начисления - встречная проводка
+    return f'''
+        INSERT INTO driver_ledger (driver_id, ride_id, kind, amount)
+        SELECT {r}.driver_id, {r}.ride_id, 'reversal', {_commission(r)} - {_gross(r)}
+        WHERE {r}.status = 'completed' AND {r}.driver_id IS NOT NULL AND {r}.price IS NOT NULL;'''
+
+LEDGER_DDL = (
+    '''
+    CREATE TABLE IF NOT EXISTS driver_ledger (
+        entry_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        driver_id INTEGER NOT NULL,
+        ride_id INTEGER,
+        kind TEXT NOT NULL CHECK(kind IN ('payout', 'commission', 'reversal', 'withdrawal', 'adjustment')),
+        amount INTEGER NOT NULL,
+        created_at TEXT DEFAULT (datetime('now','localtime'))
+    )
+    ''',
+    # хвост журнала водителя после снимка
+    "CREATE INDEX IF NOT EXISTS idx_driver_ledger_driver ON driver_ledger (driver_id, entry_id)",
+    # баланс водителя на момент записи entry_id включительно
+    '''
+    CREATE TABLE IF NOT EXISTS driver_balance_snapshots (
+        driver_id INTEGER PRIMARY KEY,
+        entry_id INTEGER NOT NULL,
+        balance INTEGER NOT NULL,
+        taken_at TEXT DEFAULT (datetime('now','localtime'))
+    )
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS driver_ledger_no_update BEFORE UPDATE ON driver_ledger
+    BEGIN
+        SELECT RAISE(ABORT, 'Журнал баланса только дополняется');
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS driver_ledger_no_delete BEFORE DELETE ON driver_ledger
+    BEGIN
+        SELECT RAISE(ABORT, 'Журнал баланса только дополняется');
+    END
+    ''',
+    # проводки пишутся в той же транзакции, что и завершение поездки: переход
+    # в ride_states идёт compare-and-set, поэтому начисление ровно одно
+    f'''
+    CREATE TRIGGER IF NOT EXISTS driver_ledger_ride_insert AFTER INSERT ON rides
+    WHEN NEW.status = 'completed'
+    BEGIN{_post_sql('NEW')}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS driver_ledger_ride_update
+    AFTER UPDATE OF status, price, driver_id ON rides
+    WHEN (OLD.status = 'completed' OR NEW.status = 'completed')
+      AND (OLD.status IS NOT NEW.status OR OLD.price IS NOT NEW.price OR OLD.driver_id IS NOT NEW.driver_id)
+    BEGIN{_reverse_sql('OLD')}{_post_sql('NEW')}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS driver_ledger_ride_delete AFTER DELETE ON rides
+    WHEN OLD.status = 'completed'
+    BEGIN{_reverse_sql('OLD')}
+    END
+    ''',
+)
+
+# drivers.balance до журнала поездками не пополнялся (его меняли только
+# вручную), поэтому при создании журнала он переносится целиком начальной
+# корректировкой, а поездки, завершённые до журнала, начисляются сверху.
+# Таблица хранит прежний баланс, заработок по этим поездкам и entry_id, до
+# которого включительно журнал водителя должен давать balance + earned
+OPENING_DDL = (
+    '''
+    CREATE TABLE IF NOT EXISTS driver_opening_balances (
+        driver_id INTEGER PRIMARY KEY,
+        balance INTEGER NOT NULL,
+        earned INTEGER NOT NULL DEFAULT 0,
+        entry_id INTEGER NOT NULL
+    )
+    ''',
+    # водитель, добавленный с ненулевым balance (bulk_load, старые скрипты),
+    # получает такой же начальный остаток
+    f'''
+    CREATE TRIGGER IF NOT EXISTS driver_ledger_driver_insert AFTER INSERT ON drivers
+    WHEN NEW.balance <> 0
+    BEGIN
+        INSERT INTO driver_ledger (driver_id, kind, amount)
+        VALUES (NEW.driver_id, 'adjustment', {_gross_balance('NEW')});
+        INSERT OR REPLACE INTO driver_opening_balances (driver_id, balance, entry_id)
+        VALUES (NEW.driver_id, {_gross_balance('NEW')}, (SELECT MAX(entry_id) FROM driver_ledger));
+    END
+    ''',
+)
+
+# заработок по поездкам до журнала считается по rides, а не по проводкам:
+# check_ledger сверяет с ним то, что журнал реально начислил
+OPENING_SQL = f'''
+INSERT INTO driver_opening_balances (driver_id, balance, earned, entry_id)
+SELECT d.driver_id, {_gross_balance('d')}, IFNULL(r.earned, 0), ?
+FROM drivers d
+LEFT JOIN (
+    SELECT driver_id, SUM({_gross('rides')} - {_commission('rides')}) AS earned
+    FROM rides
+    WHERE status = 'completed' AND driver_id IS NOT NULL AND price IS NOT NULL
+    GROUP BY driver_id
+) r ON r.driver_id = d.driver_id
+WHERE {_gross_balance('d')} <> 0 OR r.earned IS NOT NULL
+'''
+
+def _table_exists(conn, name):
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,))
+    return cursor.fetchone() is not None
+
+def ledger_enabled(conn):
+    return _table_exists(conn, 'driver_ledger')
+
+def ensure_ledger(conn):
+    # начальный остаток - прежний drivers.balance, поездки до журнала
+    # проводятся один раз при создании как обычные начисления
+    if ledger_enabled(conn):
+        if not _table_exists(conn, 'driver_opening_balances'):
+            # журнал создан без начальных остатков: их уже не восстановить,
+            # снимки могли переписать drivers.balance
+            with transaction(conn) as cursor:
+                for ddl in OPENING_DDL:
+                    cursor.execute(ddl)
+        return
+    with transaction(conn) as cursor:
+        for ddl in LEDGER_DDL + OPENING_DDL:
+            cursor.execute(ddl)
+        cursor.execute(
+            "INSERT INTO driver_ledger (driver_id, kind, amount) "
+            f"SELECT driver_id, 'adjustment', {_gross_balance('drivers')} FROM drivers "
+            f"WHERE {_gross_balance('drivers')} <> 0 ORDER BY driver_id"
+        )
+        cursor.execute(
+            "INSERT INTO driver_ledger (driver_id, ride_id, kind, amount) "
+            f"SELECT driver_id, ride_id, 'payout', {_gross('rides')} FROM rides "
+            "WHERE status = 'completed' AND driver_id IS NOT NULL AND price IS NOT NULL ORDER BY ride_id"
+        )
+        cursor.execute(
+            "INSERT INTO driver_ledger (driver_id, ride_id, kind, amount) "
+            f"SELECT driver_id, ride_id, 'commission', -{_commission('rides')} FROM rides "
+            "WHERE status = 'completed' AND driver_id IS NOT NULL AND price IS NOT NULL ORDER BY ride_id"
+        )
+        cursor.execute("SELECT IFNULL(MAX(entry_id), 0) FROM driver_ledger")
+        cursor.execute(OPENING_SQL, (cursor.fetchone()[0],))
+
+# снимок плюс хвост журнала после него: одна выборка по первичному ключу и
+# короткий диапазон индекса (driver_id, entry_id), сколько бы ни было проводок
+BALANCE_SQL = '''
+SELECT IFNULL(s.balance, 0) + IFNULL((
+    SELECT SUM(amount) FROM driver_ledger
+    WHERE driver_id = d.driver_id AND entry_id > IFNULL(s.entry_id, 0)
+), 0)
+FROM (SELECT ? AS driver_id) d
+LEFT JOIN driver_balance_snapshots s ON s.driver_id = d.driver_id
+'''
+
+def _balance(cursor, driver_id):
+    cursor.execute(BALANCE_SQL, (driver_id,))
+    return cursor.fetchone()[0]
+
+def balance(conn, driver_id):
+    return _balance(conn.cursor(), driver_id) / 100
+
+def _withdraw(cursor, driver_id, amount):
+    # проверка баланса и списание в одной транзакции записи: два списания
+    # одновременно не уведут баланс в минус
+    available = _balance(cursor, driver_id)
+    if amount > available:
+        raise ValueError(f"Недостаточно средств: на балансе {available / 100} руб.")
+    cursor.execute(
+        "INSERT INTO driver_ledger (driver_id, kind, amount) VALUES (?, 'withdrawal', ?)", (driver_id, -amount)
+    )
+    return (available - amount) / 100
+
+def withdraw(conn, driver_id, amount):
+    # выплата водителю; durable: деньги ушли - запись переживёт сбой питания
+    amount = round(float(amount) * 100)
+    if amount <= 0:
+        raise ValueError("Сумма выплаты должна быть больше нуля")
+    return group_commit.run(conn, _withdraw, driver_id, amount, durable=True)
+
+def adjust(conn, driver_id, amount):
+    # ручная корректировка баланса (штраф, бонус)
+    return group_commit.run(conn, _adjust, driver_id, round(float(amount) * 100), durable=True)
+
+def _adjust(cursor, driver_id, amount):
+    cursor.execute(
+        "INSERT INTO driver_ledger (driver_id, kind, amount) VALUES (?, 'adjustment', ?)", (driver_id, amount)
+    )
+    return cursor.lastrowid
+
+SNAPSHOT_SQL = '''
+INSERT INTO driver_balance_snapshots (driver_id, entry_id, balance, taken_at)
+SELECT l.driver_id, ?, IFNULL(s.balance, 0) + SUM(l.amount), datetime('now','localtime')
+FROM driver_ledger l
+LEFT JOIN driver_balance_snapshots s ON s.driver_id = l.driver_id
+WHERE l.driver_id > ? AND l.driver_id <= ? AND l.entry_id > IFNULL(s.entry_id, 0) AND l.entry_id <= ?
+GROUP BY l.driver_id
+ON CONFLICT (driver_id) DO UPDATE SET
+    entry_id = excluded.entry_id,
+    balance = excluded.balance,
+    taken_at = excluded.taken_at
+'''
+
+# drivers.balance - копия баланса на момент снимка для списков и выгрузок
+DRIVERS_BALANCE_SQL = '''
+UPDATE drivers
+SET balance = (SELECT balance / 100.0 FROM driver_balance_snapshots s WHERE s.driver_id = drivers.driver_id)
+WHERE driver_id IN (SELECT driver_id FROM driver_balance_snapshots WHERE driver_id > ? AND driver_id <= ? AND entry_id = ?)
+'''
+
+def snapshot_balances(conn, batch_size=SNAPSHOT_BATCH, pause=SNAPSHOT_PAUSE):
+    # сворачивает хвосты журнала в снимки по диапазонам driver_id, каждая пачка
+    # - своя короткая транзакция. Граница upto берётся один раз: entry_id
+    # выдаются при записи, а писатель в SQLite один, поэтому проводки с
+    # номером не больше upto уже зафиксированы и новых таких не появится
+    cursor = conn.cursor()
+    cursor.execute("SELECT IFNULL(MAX(entry_id), 0), IFNULL(MAX(driver_id), 0) FROM driver_ledger")
+    upto, last_driver = cursor.fetchone()
+    position = 0
+    updated = 0
+    while position < last_driver:
+        upper = min(position + batch_size, last_driver)
+        with transaction(conn) as cursor:
+            cursor.execute(SNAPSHOT_SQL, (upto, position, upper, upto))
+            updated += cursor.rowcount
+            cursor.execute(DRIVERS_BALANCE_SQL, (position, upper, upto))
+        position = upper
+        if pause:
+            time.sleep(pause)
+    return updated
+
+def check_ledger(conn):
+    # -> водители, у которых снимок с хвостом не сходится с полной суммой
+    # журнала, поездки, чьи проводки не сходятся с ценой, и водители, у
+    # которых журнал на момент создания не равен прежнему drivers.balance
+    # плюс заработку по поездкам, завершённым до журнала
+    with transaction(conn, 'DEFERRED') as cursor:
+        cursor.execute('''
+            SELECT driver_id, SUM(amount) FROM driver_ledger GROUP BY driver_id
+        ''')
+        totals = dict(cursor.fetchall())
+        drivers = {driver_id: _balance(cursor, driver_id) for driver_id in totals}
+        cursor.execute(f'''
+            SELECT r.ride_id, IFNULL(SUM(l.amount), 0) AS posted,
+                   CASE WHEN r.status = 'completed' AND r.driver_id IS NOT NULL AND r.price IS NOT NULL
+                        THEN {_gross('r')} - {_commission('r')} ELSE 0 END AS expected
+            FROM rides r
+            LEFT JOIN driver_ledger l ON l.ride_id = r.ride_id AND l.driver_id = r.driver_id
+            GROUP BY r.ride_id
+            HAVING posted <> expected
+        ''')
+        rides = cursor.fetchall()
+        cursor.execute('''
+            SELECT o.driver_id, o.balance + o.earned, (
+                SELECT IFNULL(SUM(amount), 0) FROM driver_ledger l
+                WHERE l.driver_id = o.driver_id AND l.entry_id <= o.entry_id
+            ) AS posted
+            FROM driver_opening_balances o
+            WHERE posted <> o.balance + o.earned
+        ''')
+        openings = cursor.fetchall()
+    return {driver_id: (drivers[driver_id], total) for driver_id, total in totals.items()
+            if drivers[driver_id] != total}, rides, openings
+
+def main():
+    parser = argparse.ArgumentParser(description="Журнал баланса водителей")
+    parser.add_argument('command', choices=('balance', 'snapshot', 'check', 'withdraw'))
+    parser.add_argument('driver_id', type=int, nargs='?')
+    parser.add_argument('amount', type=float, nargs='?')
+    args = parser.parse_args()
+
+    conn = connect()
+    ensure_ledger(conn)
+    if args.command == 'snapshot':
+        start = time.perf_counter()
+        updated = snapshot_balances(conn)
+        print(f"Снимков балансов обновлено: {updated} за {time.perf_counter() - start:.2f} с")
+    elif args.command == 'check':
+        drivers, rides, openings = check_ledger(conn)
+        for driver_id, (stored, actual) in sorted(drivers.items()):
+            print(f"Водитель {driver_id}: снимок с хвостом {stored / 100}, по журналу {actual / 100}")
+        for ride_id, posted, expected in rides:
+            print(f"Поездка {ride_id}: проведено {posted / 100}, должно быть {expected / 100}")
+        for driver_id, opening, posted in openings:
+            print(f"Водитель {driver_id}: баланс до журнала с поездками {opening / 100}, "
+                  f"в журнале на тот момент {posted / 100}")
+        if drivers or rides or openings:
+            sys.exit(1)
+        print("Журнал сходится со снимками, поездками и балансами до журнала")
+    elif args.driver_id is None:
+        print("Укажите ID водителя")
+        sys.exit(2)
+    elif args.command == 'balance':
+        print(f"Баланс водителя {args.driver_id}: {balance(conn, args.driver_id)} руб.")
+    else:
+        try:
+            left = withdraw(conn, args.driver_id, args.amount or 0)
+        except ValueError as error:
+            print(error)
+            sys.exit(1)
+        print(f"Выплачено {args.amount} руб., остаток {left} руб.")
+    conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,166 +1,268 @@
 import sqlite3
-import re
+from contextlib import contextmanager
+
+from db import get_pool
+from indexes import create_indexes, register_query
+import name_cache
+import ticket_stats
+import rollups
+import group_commit
+import fares
+import geocache
+import ride_states
+import ride_events
+import migrations
+import ride_snapshot
+import ride_series
+import ledger
+import replica
+
+# верхняя граница для постраничной выборки по убыванию id
+MAX_ID = 2 ** 63 - 1
 
 def create_connection():
-    conn = sqlite3.connect('database.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    return get_pool().acquire()
+
+def release_connection(conn):
+    get_pool().release(conn)
+
+# сообщения о записи для меню; сервис отключает их через set_verbose(False)
+VERBOSE = True
+
+def set_verbose(enabled):
+    global VERBOSE
+    VERBOSE = enabled
+
+def report(message):
+    if VERBOSE:
+        print(message)
+
+@contextmanager
+def report_connection(conn):
+    # статистика и отчёты читают копию базы (replica.enable или FAKETAXI_REPLICA),
+    # если она включена, иначе рабочее соединение
+    source = replica.get_replica()
+    if source is None:
+        yield conn
+        return
+    with source.connection() as reader:
+        report(f"(по копии базы от {source.status()['taken_at']}, отстаёт на {source.staleness():.0f} с)")
+        yield reader
+
+def execute_write(conn, sql, params=(), durable=False):
+    # при включённом group_commit запись уходит в общий поток и ждёт его COMMIT
+    writer = group_commit.get_writer()
+    if writer is not None:
+        return writer.execute(sql, params, durable).result()
+    with group_commit.durable_transaction(conn, durable) as cursor:
+        cursor.execute(sql, params)
+    return cursor.rowcount, cursor.lastrowid
 
 def create_tables(conn):
+    # схема общая с init_database.py и описана шагами в migrations.py
+    migrations.migrate(conn)
+    create_indexes(conn)
+    ride_events.ensure_events(conn)
+    rollups.ensure_rollups(conn)
+    ride_series.ensure_series(conn)
+    ledger.ensure_ledger(conn)
+
+# списки читаются страницами по первичному ключу (WHERE id > последний
+# id страницы), а не SELECT * целиком; печать отделена от выборки
+PAGE_SIZE = 50
+
+PASSENGER_COLUMNS = ('passenger_id', 'full_name', 'phone', 'email', 'rating')
+DRIVER_COLUMNS = ('driver_id', 'full_name', 'phone', 'email', 'rating', 'car_model', 'car_number')
+RIDE_COLUMNS = ('ride_id', 'passenger_id', 'driver_id', 'price', 'status')
+
+def page_sql(table, key, columns, filters=()):
+    where = " AND ".join((f"{key} > ?",) + tuple(filters))
+    return f"SELECT {', '.join(columns)} FROM {table} WHERE {where} ORDER BY {key} LIMIT ?"
+
+register_query('passengers_page', page_sql('passengers', 'passenger_id', PASSENGER_COLUMNS), (0, 50))
+register_query('drivers_page', page_sql('drivers', 'driver_id', DRIVER_COLUMNS), (0, 50))
+register_query('rides_page', page_sql('rides', 'ride_id', RIDE_COLUMNS), (0, 50))
+register_query('rides_by_driver_page', page_sql('rides', 'ride_id', RIDE_COLUMNS, ("driver_id = ?",)), (0, 1, 50))
+
+def iter_pages(conn, table, key, columns, filters=(), params=(), after_id=0, page_size=200):
     cursor = conn.cursor()
-    
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS passengers (
-        passenger_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        full_name TEXT NOT NULL,
-        phone TEXT NOT NULL,
-        email TEXT,
-        rating REAL DEFAULT 5.0
-    )
-    ''')
-    
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS drivers (
-        driver_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        full_name TEXT NOT NULL,
-        phone TEXT NOT NULL,
-        email TEXT,
-        rating REAL DEFAULT 5.0,
-        car_model TEXT,
-        car_number TEXT
-    )
-    ''')
-    
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS rides (
-        ride_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        passenger_id INTEGER,
-        driver_id INTEGER,
-        pickup_location TEXT,
-        dropoff_location TEXT,
-        price REAL,
-        status TEXT DEFAULT 'pending',
-        ride_date DATETIME DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (passenger_id) REFERENCES passengers (passenger_id),
-        FOREIGN KEY (driver_id) REFERENCES drivers (driver_id)
-    )
-    ''')
-    
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS support_tickets (
-        ticket_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        passenger_id INTEGER,
-        driver_id INTEGER,
-        ride_id INTEGER,
-        category TEXT NOT NULL,
-        description TEXT NOT NULL,
-        status TEXT DEFAULT 'open',
-        priority TEXT DEFAULT 'normal',
-        created_date DATETIME DEFAULT CURRENT_TIMESTAMP,
-        resolved_date DATETIME,
-        response TEXT,
-        FOREIGN KEY (passenger_id) REFERENCES passengers (passenger_id),
-        FOREIGN KEY (driver_id) REFERENCES drivers (driver_id),
-        FOREIGN KEY (ride_id) REFERENCES rides (ride_id)
-    )
-    ''')
-    
-    conn.commit()
+    cursor.execute(f"PRAGMA table_info({table})")
+    existing = {row[1] for row in cursor.fetchall()}
+    unknown = [column for column in columns if column not in existing]
+    if unknown:
+        raise ValueError(f"В таблице {table} нет колонок: {', '.join(unknown)}")
+    if key not in columns:
+        columns = (key,) + tuple(columns)
+    sql = page_sql(table, key, columns, filters)
+
+    while True:
+        cursor.execute(sql, (after_id, *params, page_size))
+        page = [dict(row) for row in cursor.fetchall()]
+        if not page:
+            return
+        yield page
+        if len(page) < page_size:
+            return
+        after_id = page[-1][key]
+
+def print_pages(pages, render, title, empty_message, ask=True):
+    shown = 0
+    page = next(pages, None)
+    if page:
+        print(f"\n{title}")
+    while page:
+        for row in page:
+            print(render(row))
+        shown += len(page)
+        page = next(pages, None)
+        # следующая страница печатается только по запросу
+        if page and ask and input(f"Показано {shown}. Enter - дальше, q - хватит: ").strip().lower() == 'q':
+            pages.close()
+            break
+    if not shown:
+        print(f"\n{empty_message}")
+    return shown
 
 def add_passenger(conn, full_name, phone, email):
-    cursor = conn.cursor()
-    cursor.execute('''
-    INSERT INTO passengers (full_name, phone, email)
-    VALUES (?, ?, ?)
-    ''', (full_name, phone, email))
-    conn.commit()
-    print(f"Пассажир '{full_name}' добавлен")
-
-def get_passengers(conn):
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM passengers")
-    passengers = cursor.fetchall()
-    
-    if not passengers:
-        print("\nНет пассажиров в базе")
-        return passengers
-    
-    print("\n========== ПАССАЖИРЫ ==========")
-    for row in passengers:
-        print(f"ID: {row['passenger_id']}, Имя: {row['full_name']}, Телефон: {row['phone']}, Email: {row['email']}, Рейтинг: {row['rating']}")
-    return passengers
+    _, new_id = execute_write(conn, '''
+        INSERT INTO passengers (full_name, phone, email)
+        VALUES (?, ?, ?)
+        ''', (full_name, phone, email))
+    report(f"Пассажир '{full_name}' добавлен")
+    return new_id
+
+def iter_passenger_pages(conn, columns=PASSENGER_COLUMNS, after_id=0, page_size=200):
+    return iter_pages(conn, 'passengers', 'passenger_id', columns, after_id=after_id, page_size=page_size)
+
+def render_passenger(row):
+    return f"ID: {row['passenger_id']}, Имя: {row['full_name']}, Телефон: {row['phone']}, Email: {row['email']}, Рейтинг: {row['rating']}"
+
+def get_passengers(conn, page_size=PAGE_SIZE):
+    return print_pages(
+        iter_passenger_pages(conn, page_size=page_size), render_passenger,
+        "========== ПАССАЖИРЫ ==========", "Нет пассажиров в базе",
+    )
 
 def update_passenger(conn, passenger_id, full_name, phone, email, rating):
-    cursor = conn.cursor()
-    cursor.execute('''
-    UPDATE passengers
-    SET full_name = ?, phone = ?, email = ?, rating = ?
-    WHERE passenger_id = ?
-    ''', (full_name, phone, email, rating, passenger_id))
-    conn.commit()
-    print(f"Пассажир с ID {passenger_id} обновлен")
+    rowcount, _ = execute_write(conn, '''
+        UPDATE passengers
+        SET full_name = ?, phone = ?, email = ?, rating = COALESCE(?, rating)
+        WHERE passenger_id = ?
+        ''', (full_name, phone, email, rating, passenger_id))
+    name_cache.invalidate('passengers', passenger_id)
+    report(f"Пассажир с ID {passenger_id} обновлен")
+    return rowcount
 
 def delete_passenger(conn, passenger_id):
-    cursor = conn.cursor()
-    cursor.execute('''
-    DELETE FROM passengers
-    WHERE passenger_id = ?
-    ''', (passenger_id,))
-    conn.commit()
-    print(f"Пассажир с ID {passenger_id} удален")
+    rowcount, _ = execute_write(conn, '''
+        DELETE FROM passengers
+        WHERE passenger_id = ?
+        ''', (passenger_id,))
+    name_cache.invalidate('passengers', passenger_id)
+    report(f"Пассажир с ID {passenger_id} удален")
+    return rowcount
 
 def add_driver(conn, full_name, phone, email, car_model, car_number):
-    cursor = conn.cursor()
-    cursor.execute('''
-    INSERT INTO drivers (full_name, phone, email, car_model, car_number)
-    VALUES (?, ?, ?, ?, ?)
-    ''', (full_name, phone, email, car_model, car_number))
-    conn.commit()
-    print(f"Водитель '{full_name}' добавлен")
-
-def get_drivers(conn):
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM drivers")
-    drivers = cursor.fetchall()
-    
-    if not drivers:
-        print("\nНет водителей в базе")
-        return drivers
-    
-    print("\n========== ВОДИТЕЛИ ==========")
-    for row in drivers:
-        print(f"ID: {row['driver_id']}, Имя: {row['full_name']}, Телефон: {row['phone']}, Автомобиль: {row['car_model']}, Номер: {row['car_number']}")
-    return drivers
+    # в базах из init_database.py у balance нет значения по умолчанию
+    _, new_id = execute_write(conn, '''
+        INSERT INTO drivers (full_name, phone, email, balance, car_model, car_number)
+        VALUES (?, ?, ?, 0, ?, ?)
+        ''', (full_name, phone, email, car_model, car_number))
+    report(f"Водитель '{full_name}' добавлен")
+    return new_id
+
+def iter_driver_pages(conn, columns=DRIVER_COLUMNS, after_id=0, page_size=200):
+    return iter_pages(conn, 'drivers', 'driver_id', columns, after_id=after_id, page_size=page_size)
+
+def render_driver(row):
+    return f"ID: {row['driver_id']}, Имя: {row['full_name']}, Телефон: {row['phone']}, Автомобиль: {row['car_model']}, Номер: {row['car_number']}"
+
+def get_drivers(conn, page_size=PAGE_SIZE):
+    return print_pages(
+        iter_driver_pages(conn, page_size=page_size), render_driver,
+        "========== ВОДИТЕЛИ ==========", "Нет водителей в базе",
+    )
 
 def update_driver(conn, driver_id, full_name, phone, email, rating, car_model, car_number):
-    cursor = conn.cursor()
-    cursor.execute('''
-    UPDATE drivers
-    SET full_name = ?, phone = ?, email = ?, rating = ?, car_model = ?, car_number = ?
-    WHERE driver_id = ?
-    ''', (full_name, phone, email, rating, car_model, car_number, driver_id))
-    conn.commit()
-    print(f"Водитель с ID {driver_id} обновлен")
+    rowcount, _ = execute_write(conn, '''
+        UPDATE drivers
+        SET full_name = ?, phone = ?, email = ?, rating = COALESCE(?, rating), car_model = ?, car_number = ?
+        WHERE driver_id = ?
+        ''', (full_name, phone, email, rating, car_model, car_number, driver_id))
+    name_cache.invalidate('drivers', driver_id)
+    report(f"Водитель с ID {driver_id} обновлен")
+    return rowcount
 
 def delete_driver(conn, driver_id):
-    cursor = conn.cursor()
-    cursor.execute('''
-    DELETE FROM drivers
-    WHERE driver_id = ?
-    ''', (driver_id,))
-    conn.commit()
-    print(f"Водитель с ID {driver_id} удален")
-
-def add_ride(conn, passenger_id, driver_id, pickup_location, dropoff_location, price, status='pending'):
-    cursor = conn.cursor()
-    cursor.execute('''
-    INSERT INTO rides (passenger_id, driver_id, pickup_location, dropoff_location, price, status)
-    VALUES (?, ?, ?, ?, ?, ?)
-    ''', (passenger_id, driver_id, pickup_location, dropoff_location, price, status))
-    conn.commit()
-    print("Поездка добавлена")
-
-def get_rides(conn, ride_id=None):
+    rowcount, _ = execute_write(conn, '''
+        DELETE FROM drivers
+        WHERE driver_id = ?
+        ''', (driver_id,))
+    name_cache.invalidate('drivers', driver_id)
+    report(f"Водитель с ID {driver_id} удален")
+    return rowcount
+
+# баланс считается по журналу driver_ledger (см. ledger.py); drivers.balance -
+# его копия на момент последнего снимка
+def driver_balance(conn, driver_id):
+    result = ledger.balance(conn, driver_id)
+    print(f"\nБаланс водителя {driver_id}: {result} руб.")
+    return result
+
+def pay_driver(conn, driver_id, amount):
+    left = ledger.withdraw(conn, driver_id, amount)
+    report(f"Водителю {driver_id} выплачено {amount} руб., остаток {left} руб.")
+    return left
+
+def add_ride(conn, passenger_id, driver_id, pickup_location, dropoff_location, price, status=ride_states.INITIAL):
+    # другой начальный статус обошёл бы проверку переходов: completed без
+    # completed_at и без начисления водителю через завершение
+    if status != ride_states.INITIAL:
+        raise ValueError(f"Новая поездка создаётся в статусе {ride_states.INITIAL}, "
+                         "дальше статус меняется по правилам переходов")
+    _, new_id = execute_write(conn, '''
+        INSERT INTO rides (passenger_id, driver_id, pickup_location, dropoff_location, price, status)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ''', (passenger_id, driver_id, pickup_location, dropoff_location, price, status))
+    report("Поездка добавлена")
+    return new_id
+
+def iter_ride_pages(conn, columns=RIDE_COLUMNS, status=None, driver_id=None, date_from=None, date_to=None,
+                    with_names=True, after_id=0, page_size=200):
+    filters = []
+    params = []
+    if status:
+        filters.append("status = ?")
+        params.append(status)
+    if driver_id is not None:
+        filters.append("driver_id = ?")
+        params.append(driver_id)
+    if date_from or date_to:
+        time_column = rollups.ride_time_column(conn)
+        if date_from:
+            filters.append(f"{time_column} >= ?")
+            params.append(date_from)
+        if date_to:
+            # дата окончания включительно
+            filters.append(f"{time_column} < date(?, '+1 day')")
+            params.append(date_to)
+    if with_names:
+        columns = tuple(columns) + tuple(c for c in ('passenger_id', 'driver_id') if c not in columns)
+
+    for page in iter_pages(conn, 'rides', 'ride_id', columns, filters, params, after_id, page_size):
+        if with_names:
+            # имена одним запросом на страницу, через name_cache, если он включён
+            passengers = name_cache.lookup(conn, 'passengers', [r['passenger_id'] for r in page if r['passenger_id']])
+            drivers = name_cache.lookup(conn, 'drivers', [r['driver_id'] for r in page if r['driver_id']])
+            for ride in page:
+                ride['passenger_name'] = passengers.get(ride['passenger_id'])
+                ride['driver_name'] = drivers.get(ride['driver_id'])
+        yield page
+
+def render_ride(row):
+    return f"ID: {row['ride_id']}, Пассажир: {row['passenger_name']}, Водитель: {row['driver_name']}, Цена: {row['price']} руб., Статус: {row['status']}"
+
+def get_rides(conn, ride_id=None, page_size=PAGE_SIZE):
     cursor = conn.cursor()
     
     if ride_id:
@@ -187,50 +289,31 @@ def get_rides(conn, ride_id=None):
         else:
             print(f"Поездка с ID {ride_id} не найдена")
         return result
-    else:
-        cursor.execute('''
-        SELECT
-            rides.*,
-            passengers.full_name AS passenger_name,
-            drivers.full_name AS driver_name
-        FROM rides
-        LEFT JOIN passengers ON rides.passenger_id = passengers.passenger_id
-        LEFT JOIN drivers ON rides.driver_id = drivers.driver_id
-        ''')
-        
-        rides = cursor.fetchall()
-        
-        if not rides:
-            print("\nНет поездок в базе")
-            return rides
-        
-        print("\n========== ПОЕЗДКИ ==========")
-        for row in rides:
-            print(f"ID: {row['ride_id']}, Пассажир: {row['passenger_name']}, Водитель: {row['driver_name']}, Цена: {row['price']} руб., Статус: {row['status']}")
-        return rides
+    return print_pages(
+        iter_ride_pages(conn, page_size=page_size), render_ride,
+        "========== ПОЕЗДКИ ==========", "Нет поездок в базе",
+    )
 
-def update_ride_status(conn, ride_id, status):
-    cursor = conn.cursor()
-    cursor.execute('''
-    UPDATE rides
-    SET status = ?
-    WHERE ride_id = ?
-    ''', (status, ride_id))
-    conn.commit()
-    print(f"Статус поездки {ride_id} изменен на {status}")
+def update_ride_status(conn, ride_id, status, expected_version=None):
+    # переходы проверяет ride_states: compare-and-set по статусу и версии
+    ok, current, version = ride_states.transition(conn, ride_id, status, expected_version)
+    if ok:
+        report(f"Статус поездки {ride_id} изменен на {status}")
+    elif current is None:
+        report(f"Поездка с ID {ride_id} не найдена")
+    else:
+        report(f"Поездку {ride_id} нельзя перевести в {status}: сейчас {current}, версия {version}")
+    return ok, current, version
 
 def delete_ride(conn, ride_id):
-    cursor = conn.cursor()
-    cursor.execute('''
-    DELETE FROM rides
-    WHERE ride_id = ?
-    ''', (ride_id,))
-    conn.commit()
-    print(f"Поездка {ride_id} удалена")
+    rowcount, _ = execute_write(conn, '''
+        DELETE FROM rides
+        WHERE ride_id = ?
+        ''', (ride_id,))
+    report(f"Поездка {ride_id} удалена")
+    return rowcount
 
 def create_support_ticket(conn, passenger_id, driver_id, ride_id, category, description, priority='normal'):
-    cursor = conn.cursor()
-    
     if passenger_id == '':
         passenger_id = None
     if driver_id == '':
@@ -238,202 +321,224 @@ def create_support_ticket(conn, passenger_id, driver_id, ride_id, category, desc
     if ride_id == '':
         ride_id = None
         
-    cursor.execute('''
-    INSERT INTO support_tickets (passenger_id, driver_id, ride_id, category, description, priority, status)
-    VALUES (?, ?, ?, ?, ?, ?, 'open')
-    ''', (passenger_id, driver_id, ride_id, category, description, priority))
-    conn.commit()
+    _, ticket_id = execute_write(conn, '''
+        INSERT INTO support_tickets (passenger_id, driver_id, ride_id, category, description, priority, status)
+        VALUES (?, ?, ?, ?, ?, ?, 'open')
+        ''', (passenger_id, driver_id, ride_id, category, description, priority))
     
-    ticket_id = cursor.lastrowid
-    print(f"\nОбращение создано. Номер тикета: {ticket_id}")
+    report(f"\nОбращение создано. Номер тикета: {ticket_id}")
     return ticket_id
 
-def get_support_tickets(conn, status_filter=None):
+TICKET_COLUMNS = '''
+    t.ticket_id,
+    t.category,
+    t.priority,
+    t.status,
+    t.passenger_id,
+    t.driver_id,
+    t.ride_id,
+    t.description,
+    t.response,
+    t.created_date'''
+
+# имена подтягиваются тем же запросом, а не отдельным SELECT на каждый тикет
+TICKET_NAMES_JOIN = '''
+    p.full_name AS passenger_name,
+    d.full_name AS driver_name
+FROM support_tickets t
+LEFT JOIN passengers p ON p.passenger_id = t.passenger_id
+LEFT JOIN drivers d ON d.driver_id = t.driver_id'''
+
+TICKETS_PAGE_SQL = register_query('get_support_tickets', f'''
+SELECT {TICKET_COLUMNS},{TICKET_NAMES_JOIN}
+WHERE t.ticket_id < ?
+ORDER BY t.ticket_id DESC
+LIMIT ?
+''', (MAX_ID, 50))
+
+TICKETS_BY_STATUS_PAGE_SQL = register_query('get_support_tickets_by_status', f'''
+SELECT {TICKET_COLUMNS},{TICKET_NAMES_JOIN}
+WHERE t.status = ? AND t.ticket_id < ?
+ORDER BY t.ticket_id DESC
+LIMIT ?
+''', ('open', MAX_ID, 50))
+
+# вариант без JOIN для name_cache: имена берутся из кэша
+TICKETS_PAGE_NO_NAMES_SQL = f'''
+SELECT {TICKET_COLUMNS}
+FROM support_tickets t
+WHERE t.ticket_id < ?
+ORDER BY t.ticket_id DESC
+LIMIT ?
+'''
+
+TICKETS_BY_STATUS_PAGE_NO_NAMES_SQL = f'''
+SELECT {TICKET_COLUMNS}
+FROM support_tickets t
+WHERE t.status = ? AND t.ticket_id < ?
+ORDER BY t.ticket_id DESC
+LIMIT ?
+'''
+
+def iter_ticket_pages(conn, status_filter=None, before_id=None, page_size=200):
     cursor = conn.cursor()
-    
-    if status_filter:
-        cursor.execute('''
-        SELECT 
-            ticket_id,
-            category,
-            priority,
-            status,
-            passenger_id,
-            driver_id,
-            ride_id,
-            description,
-            response,
-            created_date
-        FROM support_tickets
-        WHERE status = ?
-        ORDER BY ticket_id DESC
-        ''', (status_filter,))
-    else:
-        cursor.execute('''
-        SELECT 
-            ticket_id,
-            category,
-            priority,
-            status,
-            passenger_id,
-            driver_id,
-            ride_id,
-            description,
-            response,
-            created_date
-        FROM support_tickets
-        ORDER BY ticket_id DESC
-        ''')
-    
-    tickets = cursor.fetchall()
-    
-    if not tickets:
-        print("\n========== ОБРАЩЕНИЯ В ПОДДЕРЖКУ ==========")
-        if status_filter:
-            print(f"Нет обращений со статусом '{status_filter}'")
+    cache = name_cache.get_cache()
+    before_id = MAX_ID if before_id is None else before_id
+
+    while True:
+        if cache is None:
+            sql = TICKETS_BY_STATUS_PAGE_SQL if status_filter else TICKETS_PAGE_SQL
         else:
-            print("Нет обращений")
-        return tickets
-    
-    print("\n========== ОБРАЩЕНИЯ В ПОДДЕРЖКУ ==========")
-    for ticket in tickets:
-        print(f"\nТикет #{ticket['ticket_id']}")
-        print(f"Категория: {ticket['category']}")
-        print(f"Приоритет: {ticket['priority']}")
-        print(f"Статус: {ticket['status']}")
-        
-        if ticket['passenger_id']:
-            cursor.execute('SELECT full_name FROM passengers WHERE passenger_id = ?', (ticket['passenger_id'],))
-            passenger = cursor.fetchone()
-            if passenger:
-                print(f"Пассажир: {passenger['full_name']}")
-                
-        if ticket['driver_id']:
-            cursor.execute('SELECT full_name FROM drivers WHERE driver_id = ?', (ticket['driver_id'],))
-            driver = cursor.fetchone()
-            if driver:
-                print(f"Водитель: {driver['full_name']}")
-                
-        if ticket['ride_id']:
-            print(f"Поездка: #{ticket['ride_id']}")
-            
-        print(f"Описание: {ticket['description']}")
-        
-        if ticket['response']:
-            print(f"Ответ поддержки: {ticket['response']}")
-            
-        print(f"Дата создания: {ticket['created_date']}")
-        print("-" * 40)
-    
-    return tickets
+            sql = TICKETS_BY_STATUS_PAGE_NO_NAMES_SQL if status_filter else TICKETS_PAGE_NO_NAMES_SQL
+        params = (status_filter, before_id, page_size) if status_filter else (before_id, page_size)
+        cursor.execute(sql, params)
+        page = [dict(row) for row in cursor.fetchall()]
+        if not page:
+            return
+
+        if cache is not None:
+            passengers = cache.get_many(conn, 'passengers', [t['passenger_id'] for t in page if t['passenger_id']])
+            drivers = cache.get_many(conn, 'drivers', [t['driver_id'] for t in page if t['driver_id']])
+            for ticket in page:
+                ticket['passenger_name'] = passengers.get(ticket['passenger_id'])
+                ticket['driver_name'] = drivers.get(ticket['driver_id'])
+
+        yield page
+        if len(page) < page_size:
+            return
+        before_id = page[-1]['ticket_id']
+
+def render_ticket(ticket):
+    lines = [
+        f"\nТикет #{ticket['ticket_id']}",
+        f"Категория: {ticket['category']}",
+        f"Приоритет: {ticket['priority']}",
+        f"Статус: {ticket['status']}",
+    ]
+    if ticket['passenger_name']:
+        lines.append(f"Пассажир: {ticket['passenger_name']}")
+    if ticket['driver_name']:
+        lines.append(f"Водитель: {ticket['driver_name']}")
+    if ticket['ride_id']:
+        lines.append(f"Поездка: #{ticket['ride_id']}")
+    lines.append(f"Описание: {ticket['description']}")
+    if ticket['response']:
+        lines.append(f"Ответ поддержки: {ticket['response']}")
+    lines.append(f"Дата создания: {ticket['created_date']}")
+    lines.append("-" * 40)
+    return "\n".join(lines)
+
+def get_support_tickets(conn, status_filter=None, page_size=PAGE_SIZE):
+    # страница за страницей, как остальные списки: в памяти только текущая
+    return print_pages(
+        iter_ticket_pages(conn, status_filter, page_size=page_size), render_ticket,
+        "========== ОБРАЩЕНИЯ В ПОДДЕРЖКУ ==========",
+        f"Нет обращений со статусом '{status_filter}'" if status_filter else "Нет обращений",
+    )
 
 def respond_to_ticket(conn, ticket_id, response):
-    cursor = conn.cursor()
-    cursor.execute('''
-    UPDATE support_tickets
-    SET response = ?, status = 'in_progress'
-    WHERE ticket_id = ?
-    ''', (response, ticket_id))
-    conn.commit()
-    
-    if cursor.rowcount > 0:
-        print(f"Ответ на тикет #{ticket_id} добавлен")
+    rowcount, _ = execute_write(conn, '''
+        UPDATE support_tickets
+        SET response = ?, status = 'in_progress'
+        WHERE ticket_id = ?
+        ''', (response, ticket_id))
+    
+    if rowcount > 0:
+        report(f"Ответ на тикет #{ticket_id} добавлен")
     else:
-        print(f"Тикет #{ticket_id} не найден")
+        report(f"Тикет #{ticket_id} не найден")
+    return rowcount
 
 def close_ticket(conn, ticket_id):
-    cursor = conn.cursor()
-    cursor.execute('''
-    UPDATE support_tickets
-    SET status = 'closed', resolved_date = CURRENT_TIMESTAMP
-    WHERE ticket_id = ?
-    ''', (ticket_id,))
-    conn.commit()
-    
-    if cursor.rowcount > 0:
-        print(f"Тикет #{ticket_id} закрыт")
+    rowcount, _ = execute_write(conn, '''
+        UPDATE support_tickets
+        SET status = 'closed', resolved_date = CURRENT_TIMESTAMP
+        WHERE ticket_id = ?
+        ''', (ticket_id,))
+    
+    if rowcount > 0:
+        report(f"Тикет #{ticket_id} закрыт")
     else:
-        print(f"Тикет #{ticket_id} не найден")
+        report(f"Тикет #{ticket_id} не найден")
+    return rowcount
 
 def get_ticket_statistics(conn):
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT COUNT(*) FROM support_tickets")
-    total = cursor.fetchone()[0]
-    
-    cursor.execute("SELECT COUNT(*) FROM support_tickets WHERE status = 'open'")
-    open_tickets = cursor.fetchone()[0]
-    
-    cursor.execute("SELECT COUNT(*) FROM support_tickets WHERE status = 'in_progress'")
-    in_progress = cursor.fetchone()[0]
-    
-    cursor.execute("SELECT COUNT(*) FROM support_tickets WHERE status = 'closed'")
-    closed = cursor.fetchone()[0]
-    
-    cursor.execute('''
-    SELECT category, COUNT(*) as count
-    FROM support_tickets
-    GROUP BY category
-    ORDER BY count DESC
-    ''')
-    categories = cursor.fetchall()
+    stats = ticket_stats.get_stats(conn)
     
     print("\n========== СТАТИСТИКА ПОДДЕРЖКИ ==========")
-    print(f"Всего обращений: {total}")
-    print(f"Открытых: {open_tickets}")
-    print(f"В работе: {in_progress}")
-    print(f"Закрытых: {closed}")
+    print(f"Всего обращений: {stats['total']}")
+    print(f"Открытых: {stats['open']}")
+    print(f"В работе: {stats['in_progress']}")
+    print(f"Закрытых: {stats['closed']}")
     
-    if categories:
+    if stats['categories']:
         print("\nПо категориям:")
-        for cat in categories:
-            print(f"  {cat['category']}: {cat['count']}")
+        for category, count in stats['categories']:
+            print(f"  {category}: {count}")
+    return stats
 
-def get_count_of_rides(conn):
+# статистика читается из ride_rollups (см. rollups.py): несколько строк по
+# первичному ключу вместо прохода по rides; суммы REAL округляются до копеек
+RIDES_TOTALS_SQL = register_query('rides_totals', '''
+SELECT
+    SUM(count) AS count,
+    SUM(priced) AS priced,
+    ROUND(SUM(sum), 2) AS sum,
+    MIN(min) AS min_price,
+    MAX(max) AS max_price
+FROM ride_rollups
+WHERE dimension = 'all'
+''')
+
+RIDES_BY_STATUS_SQL = register_query('rides_by_status', '''
+SELECT count, ROUND(sum, 2) AS sum
+FROM ride_rollups
+WHERE dimension = 'all' AND key = '' AND status = ?
+''', ('completed',))
+
+# статистика берётся из снимка поездок в памяти, если он включён
+# (ride_snapshot.enable), иначе из ride_rollups; ключи результатов одинаковые
+def rides_totals(conn):
+    snapshot = ride_snapshot.current(conn)
+    if snapshot is not None:
+        return snapshot.totals()
     cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM rides")
-    result = cursor.fetchone()[0]
+    cursor.execute(RIDES_TOTALS_SQL)
+    return cursor.fetchone()
+
+def rides_by_status(conn, status):
+    snapshot = ride_snapshot.current(conn)
+    if snapshot is not None:
+        return snapshot.by_status(status)
+    cursor = conn.cursor()
+    cursor.execute(RIDES_BY_STATUS_SQL, (status,))
+    return cursor.fetchone()
+
+def get_count_of_rides(conn):
+    result = rides_totals(conn)['count'] or 0
     print(f"\nКоличество поездок: {result}")
     return result
 
 def get_count_of_complete_rides(conn):
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM rides WHERE status = 'completed'")
-    result = cursor.fetchone()[0]
+    row = rides_by_status(conn, 'completed')
+    result = row['count'] if row else 0
     print(f"\nКоличество завершенных поездок: {result}")
     return result
 
 def get_profit(conn):
-    cursor = conn.cursor()
-    cursor.execute('''
-    SELECT SUM(price)
-    FROM rides
-    WHERE status = 'completed'
-    ''')
-    result = cursor.fetchone()[0]
-    if result is None:
-        result = 0
+    row = rides_by_status(conn, 'completed')
+    result = row['sum'] if row and row['count'] else 0
     print(f"Общая выручка: {result} рублей")
     return result
 
 def get_arithmetic_mean_of_profit(conn):
-    cursor = conn.cursor()
-    cursor.execute('SELECT AVG(price) FROM rides')
-    result = cursor.fetchone()[0]
-    if result is None:
-        result = 0
+    row = rides_totals(conn)
+    result = row['sum'] / row['priced'] if row['priced'] else 0
     print(f"Средняя стоимость поездки: {result:.2f} рублей")
     return result
 
 def max_and_min_price(conn):
-    cursor = conn.cursor()
-    cursor.execute('''
-    SELECT
-        MIN(price) AS min_price,
-        MAX(price) AS max_price
-    FROM rides
-    ''')
-    result = cursor.fetchone()
+    result = rides_totals(conn)
     
     if result['min_price'] is None:
         print("Нет данных о поездках")
@@ -442,19 +547,34 @@ def max_and_min_price(conn):
         print(f"Максимальная стоимость: {result['max_price']} руб.")
     return result
 
-def price_for_passenger(conn):
+# список всех пассажиров, поэтому просмотр passengers здесь ожидаем;
+# унарный + снимает аффинность INTEGER, иначе индекс по key не используется
+PRICE_FOR_PASSENGER_SQL = register_query('price_for_passenger', '''
+SELECT
+    passengers.full_name,
+    (
+        SELECT ROUND(SUM(sum), 2)
+        FROM ride_rollups
+        WHERE dimension = 'passenger' AND key = +passengers.passenger_id
+    ) AS priceofride
+FROM passengers
+ORDER BY priceofride DESC
+''', allow_scan=('passengers',))
+
+def passenger_spending(conn):
+    snapshot = ride_snapshot.current(conn)
     cursor = conn.cursor()
-    cursor.execute('''
-    SELECT
-        passengers.full_name,
-        SUM(rides.price) AS priceofride
-    FROM passengers
-    LEFT JOIN rides ON passengers.passenger_id = rides.passenger_id
-    GROUP BY passengers.passenger_id
-    ORDER BY priceofride DESC
-    ''')
-    
-    results = cursor.fetchall()
+    if snapshot is None:
+        cursor.execute(PRICE_FOR_PASSENGER_SQL)
+        return cursor.fetchall()
+    spent = snapshot.spend_by('passenger_id')
+    cursor.execute("SELECT passenger_id, full_name FROM passengers")
+    results = [{'full_name': row[1], 'priceofride': spent.get(row[0])} for row in cursor]
+    results.sort(key=lambda row: row['priceofride'] or 0, reverse=True)
+    return results
+
+def price_for_passenger(conn):
+    results = passenger_spending(conn)
     
     if not results:
         print("\nНет данных")
@@ -467,19 +587,31 @@ def price_for_passenger(conn):
         else:
             print(f"{result['full_name']}: 0 рублей")
 
-def who_is_rich(conn):
+WHO_IS_RICH_SQL = register_query('who_is_rich', '''
+SELECT 
+    passengers.full_name,
+    ROUND(SUM(ride_rollups.sum), 2) AS priceofdrive
+FROM ride_rollups
+INNER JOIN passengers ON passengers.passenger_id = ride_rollups.key
+WHERE ride_rollups.dimension = 'passenger'
+GROUP BY ride_rollups.key
+HAVING SUM(ride_rollups.sum) > 1000
+''')
+
+def rich_passengers(conn, threshold=1000):
+    snapshot = ride_snapshot.current(conn)
+    if snapshot is None:
+        cursor = conn.cursor()
+        cursor.execute(WHO_IS_RICH_SQL)
+        return cursor.fetchall()
+    spent = snapshot.spend_by('passenger_id')
     cursor = conn.cursor()
-    cursor.execute('''
-    SELECT 
-        passengers.full_name,
-        SUM(rides.price) AS priceofdrive
-    FROM rides
-    INNER JOIN passengers ON passengers.passenger_id = rides.passenger_id
-    GROUP BY passengers.passenger_id
-    HAVING SUM(rides.price) > 1000
-    ''')
-    
-    results = cursor.fetchall()
+    cursor.execute("SELECT passenger_id, full_name FROM passengers")
+    return [{'full_name': row[1], 'priceofdrive': spent[row[0]]} for row in cursor
+            if spent.get(row[0], 0) > threshold]
+
+def who_is_rich(conn):
+    results = rich_passengers(conn)
     
     if not results:
         print("\nНет пассажиров с тратами более 1000 рублей")
@@ -489,21 +621,29 @@ def who_is_rich(conn):
     for result in results:
         print(f"Имя: {result['full_name']}, Потратил: {result['priceofdrive']} руб.")
 
-def tariff(conn):
+TARIFF_TOTALS_SQL = register_query('tariff', '''
+SELECT
+    key AS category,
+    SUM(count) AS count,
+    ROUND(SUM(sum), 2) AS sum,
+    MIN(min) AS min_price,
+    MAX(max) AS max_price
+FROM ride_rollups
+WHERE dimension = 'tariff'
+GROUP BY key
+HAVING SUM(count) > 0
+''')
+
+def tariff_totals(conn):
+    snapshot = ride_snapshot.current(conn)
+    if snapshot is not None:
+        return snapshot.tariffs()
     cursor = conn.cursor()
-    cursor.execute('''
-    SELECT
-        price,
-        ride_id,
-        CASE
-            WHEN price <= 400 THEN "Эконом"
-            WHEN price > 400 AND price <= 1000 THEN "Комфорт"
-            ELSE "Премиум"
-        END AS category
-    FROM rides
-    ''')
-    
-    results = cursor.fetchall()
+    cursor.execute(TARIFF_TOTALS_SQL)
+    return sorted(cursor.fetchall(), key=lambda row: rollups.TARIFF_NAMES.index(row['category']))
+
+def tariff(conn, per_ride=False):
+    results = tariff_totals(conn)
     
     if not results:
         print("\nНет данных о поездках")
@@ -511,7 +651,37 @@ def tariff(conn):
     
     print("\n========== ТАРИФЫ ==========")
     for result in results:
-        print(f"Поездка #{result['ride_id']}: {result['price']} руб. - {result['category']}")
+        line = f"{result['category']}: {result['count']} поездок на {result['sum']} руб."
+        if result['min_price'] is not None:
+            line += f" (от {result['min_price']} до {result['max_price']} руб.)"
+        print(line)
+
+    if per_ride:
+        cursor = conn.cursor()
+        cursor.execute(f'''
+        SELECT price, ride_id, {rollups.tariff_expr('price')} AS category
+        FROM rides
+        ''')
+        print()
+        for result in cursor:
+            print(f"Поездка #{result['ride_id']}: {result['price']} руб. - {result['category']}")
+    return results
+
+def revenue_by_time(conn, grain='day', since=None, until=None, window=1):
+    points = ride_series.series(conn, grain, since, until, window)
+
+    if not points:
+        print("\nНет данных о поездках")
+        return points
+
+    title = f"скользящее окно {window}" if window > 1 else "по интервалам"
+    print(f"\n========== ВЫРУЧКА И СПРОС ({title}) ==========")
+    for point in points:
+        rate = f"{point['cancel_rate']:.1%}" if point['cancel_rate'] is not None else "-"
+        duration = f"{point['avg_duration']} мин" if point['avg_duration'] is not None else "-"
+        print(f"{point['bucket']}: {point['rides']} поездок, выручка {point['revenue']} руб., "
+              f"отмен {rate}, в пути {duration}")
+    return points
 
 def show_menu():
     print("\n" + "="*50)
@@ -528,6 +698,8 @@ def show_menu():
     print("6. Добавить водителя")
     print("7. Изменить водителя")
     print("8. Удалить водителя")
+    print("29. Баланс водителя")
+    print("30. Выплата водителю")
     
     print("\n--- ПОЕЗДКИ ---")
     print("9. Показать поездки")
@@ -553,6 +725,7 @@ def show_menu():
     print("25. Траты пассажиров")
     print("26. Богатые пассажиры")
     print("27. Тарифы")
+    print("28. Выручка и спрос по времени")
     
     print("\n0. Выход")
     print("="*50)
@@ -560,6 +733,8 @@ def show_menu():
 def main():
     conn = create_connection()
     create_tables(conn)
+    if replica.REPLICA_PATH:
+        replica.enable()
     
     while True:
         show_menu()
@@ -597,6 +772,8 @@ def main():
                 delete_passenger(conn, passenger_id)
             except ValueError:
                 print("Неверный ID")
+            except sqlite3.IntegrityError:
+                print("Нельзя удалить: на запись ещё ссылаются поездки или обращения")
         
         elif choice == '5':
             get_drivers(conn)
@@ -630,6 +807,24 @@ def main():
                 delete_driver(conn, driver_id)
             except ValueError:
                 print("Неверный ID")
+            except sqlite3.IntegrityError:
+                print("Нельзя удалить: на запись ещё ссылаются поездки или обращения")
+        
+        elif choice == '29':
+            get_drivers(conn)
+            try:
+                driver_balance(conn, int(input("ID водителя: ")))
+            except ValueError:
+                print("Неверный ID")
+        
+        elif choice == '30':
+            get_drivers(conn)
+            try:
+                driver_id = int(input("ID водителя: "))
+                driver_balance(conn, driver_id)
+                pay_driver(conn, driver_id, float(input("Сумма выплаты: ")))
+            except ValueError as error:
+                print(f"Выплата не проведена: {error}")
         
         elif choice == '9':
             get_rides(conn)
@@ -649,20 +844,33 @@ def main():
                 driver_id = int(input("ID водителя: "))
                 pickup = input("Откуда: ")
                 dropoff = input("Куда: ")
-                price = float(input("Цена: "))
-                status = input("Статус (pending/active/completed/cancelled): ") or 'pending'
-                add_ride(conn, passenger_id, driver_id, pickup, dropoff, price, status)
+                price = input("Цена (Enter - рассчитать по тарифу): ")
+                if price:
+                    price = float(price)
+                else:
+                    distance, duration = geocache.get_cache().route(pickup, dropoff)
+                    print(f"Маршрут: {distance} км, около {duration} мин")
+                    fare = input(f"Тариф ({'/'.join(fares.FARES)}): ") or 'Эконом'
+                    price = fares.quote(distance, duration, fare)
+                    print(f"Стоимость по тарифу {fare}: {price} руб.")
+                add_ride(conn, passenger_id, driver_id, pickup, dropoff, price)
             except ValueError:
                 print("Неверный формат данных")
+            except sqlite3.IntegrityError:
+                print("Пассажир или водитель с таким ID не найден")
         
         elif choice == '12':
             get_rides(conn)
             try:
                 ride_id = int(input("ID поездки: "))
-                status = input("Новый статус (pending/active/completed/cancelled): ")
-                update_ride_status(conn, ride_id, status)
             except ValueError:
                 print("Неверный ID")
+            else:
+                status = input(f"Новый статус ({'/'.join(ride_states.TARGETS)}): ")
+                if status in ride_states.TARGETS:
+                    update_ride_status(conn, ride_id, status)
+                else:
+                    print(f"В статус {status!r} перевести нельзя")
         
         elif choice == '13':
             get_rides(conn)
@@ -671,6 +879,8 @@ def main():
                 delete_ride(conn, ride_id)
             except ValueError:
                 print("Неверный ID")
+            except sqlite3.IntegrityError:
+                print("Нельзя удалить: на запись ещё ссылаются поездки или обращения")
         
         elif choice == '14':
             print("\n--- СОЗДАНИЕ ОБРАЩЕНИЯ ---")
@@ -744,38 +954,60 @@ def main():
                 print("Неверный ID")
         
         elif choice == '19':
-            get_ticket_statistics(conn)
+            with report_connection(conn) as reader:
+                get_ticket_statistics(reader)
         
         elif choice == '20':
-            get_count_of_rides(conn)
+            with report_connection(conn) as reader:
+                get_count_of_rides(reader)
         
         elif choice == '21':
-            get_count_of_complete_rides(conn)
+            with report_connection(conn) as reader:
+                get_count_of_complete_rides(reader)
         
         elif choice == '22':
-            get_profit(conn)
+            with report_connection(conn) as reader:
+                get_profit(reader)
         
         elif choice == '23':
-            get_arithmetic_mean_of_profit(conn)
+            with report_connection(conn) as reader:
+                get_arithmetic_mean_of_profit(reader)
         
         elif choice == '24':
-            max_and_min_price(conn)
+            with report_connection(conn) as reader:
+                max_and_min_price(reader)
         
         elif choice == '25':
-            price_for_passenger(conn)
+            with report_connection(conn) as reader:
+                price_for_passenger(reader)
         
         elif choice == '26':
-            who_is_rich(conn)
+            with report_connection(conn) as reader:
+                who_is_rich(reader)
         
         elif choice == '27':
-            tariff(conn)
+            per_ride = input("Показать тариф каждой поездки? (да/нет): ")
+            with report_connection(conn) as reader:
+                tariff(reader, per_ride.lower() in ['да', 'yes', 'y'])
+        
+        elif choice == '28':
+            grain = input(f"Шаг ({'/'.join(ride_series.GRAIN_NAMES)}, по умолчанию day): ") or 'day'
+            since = input("С даты (ГГГГ-ММ-ДД, Enter - с начала): ") or None
+            until = input("По дату, не включая (Enter - до конца): ") or None
+            try:
+                window = int(input("Скользящее окно, интервалов (Enter - без окна): ") or 1)
+                with report_connection(conn) as reader:
+                    revenue_by_time(reader, grain, since, until, window)
+            except ValueError as error:
+                print(f"Неверный формат данных: {error}")
         
         else:
             print("Неверный выбор!")
         
         input("\nНажмите Enter...")
     
-    conn.close()
+    replica.disable()
+    release_connection(conn)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,265 @@
+import argparse
+import time
+
+from db import connect, transaction
+
+# схема базы - это список шагов по порядку; номер последнего применённого
+# шага хранится в schema_version. Шаги создают недостающие таблицы, добавляют
+# и переименовывают колонки, поэтому одинаково поднимают базу из
+# init_database.py, базу старого main.py и пустую базу
+
+BATCH_SIZE = 5000
+# пауза между пачками: без неё цикл сразу снова берёт блокировку записи,
+# и чужой писатель, спящий в busy_timeout, ждёт сотни миллисекунд
+PAUSE = 0.005
+
+BASE_DDL = (
+    '''
+    CREATE TABLE IF NOT EXISTS passengers (
+        passenger_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        full_name TEXT NOT NULL,
+        phone TEXT NOT NULL UNIQUE,
+        email TEXT UNIQUE,
+        rating REAL DEFAULT 5.0
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS drivers (
+        driver_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        full_name TEXT NOT NULL,
+        phone TEXT NOT NULL UNIQUE,
+        email TEXT UNIQUE,
+        rating REAL DEFAULT 5.0,
+        balance REAL NOT NULL DEFAULT 0,
+        status TEXT DEFAULT 'waiting' CHECK(status IN ('working', 'waiting', 'pending')),
+        car_model TEXT,
+        car_number TEXT
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS support (
+        support_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ticket TEXT,
+        passenger_id INTEGER NOT NULL,
+        driver_id INTEGER NOT NULL,
+        full_name TEXT NOT NULL,
+        phone TEXT NOT NULL UNIQUE,
+        email TEXT UNIQUE,
+        status TEXT DEFAULT 'waiting' CHECK(status IN ('working', 'waiting', 'pending')),
+        balance REAL NOT NULL,
+        FOREIGN KEY (driver_id) REFERENCES drivers(driver_id) ON DELETE CASCADE,
+        FOREIGN KEY (passenger_id) REFERENCES passengers(passenger_id) ON DELETE CASCADE
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS rides (
+        ride_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        passenger_id INTEGER NOT NULL,
+        driver_id INTEGER NOT NULL,
+        support_id INTEGER,
+        pickup_location TEXT NOT NULL,
+        dropoff_location TEXT NOT NULL,
+        price REAL NOT NULL,
+        created_at TEXT DEFAULT (datetime('now','localtime')),
+        completed_at TEXT,
+        status TEXT DEFAULT 'pending' CHECK(status IN ('pending', 'in_progress', 'completed', 'cancelled')),
+        version INTEGER NOT NULL DEFAULT 0,
+        FOREIGN KEY (driver_id) REFERENCES drivers(driver_id) ON DELETE CASCADE,
+        FOREIGN KEY (passenger_id) REFERENCES passengers(passenger_id) ON DELETE CASCADE,
+        FOREIGN KEY (support_id) REFERENCES support(support_id) ON DELETE CASCADE
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS support_tickets (
+        ticket_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        passenger_id INTEGER,
+        driver_id INTEGER,
+        ride_id INTEGER,
+        category TEXT NOT NULL,
+        description TEXT NOT NULL,
+        status TEXT DEFAULT 'open',
+        priority TEXT DEFAULT 'normal',
+        created_date DATETIME DEFAULT CURRENT_TIMESTAMP,
+        resolved_date DATETIME,
+        response TEXT,
+        FOREIGN KEY (passenger_id) REFERENCES passengers (passenger_id),
+        FOREIGN KEY (driver_id) REFERENCES drivers (driver_id),
+        FOREIGN KEY (ride_id) REFERENCES rides (ride_id)
+    )
+    ''',
+)
+
+# имена из init_database.py и старого main.py -> общее имя
+RENAMED_COLUMNS = (
+    ('rides', 'start_point', 'pickup_location'),
+    ('rides', 'end_point', 'dropoff_location'),
+    ('rides', 'ride_date', 'created_at'),
+)
+
+# колонки, которых не было в одной из схем
+ADDED_COLUMNS = (
+    ('drivers', 'balance', "REAL NOT NULL DEFAULT 0"),
+    ('drivers', 'status', "TEXT DEFAULT 'waiting' CHECK(status IN ('working', 'waiting', 'pending'))"),
+    ('rides', 'support_id', "INTEGER REFERENCES support(support_id) ON DELETE CASCADE"),
+    ('rides', 'completed_at', "TEXT"),
+    ('rides', 'version', "INTEGER NOT NULL DEFAULT 0"),
+)
+
+def _columns(cursor, table):
+    cursor.execute(f"PRAGMA table_info({table})")
+    return {row[1] for row in cursor.fetchall()}
+
+def create_base_tables(cursor):
+    for ddl in BASE_DDL:
+        cursor.execute(ddl)
+
+def rename_columns(cursor):
+    # RENAME COLUMN меняет только текст схемы (и триггеров с индексами),
+    # строки таблицы не переписываются, поэтому на любом размере мгновенно
+    for table, old, new in RENAMED_COLUMNS:
+        columns = _columns(cursor, table)
+        if old in columns and new not in columns:
+            cursor.execute(f"ALTER TABLE {table} RENAME COLUMN {old} TO {new}")
+
+def add_columns(cursor):
+    # ADD COLUMN с константным DEFAULT тоже не трогает существующие строки
+    for table, column, ddl in ADDED_COLUMNS:
+        if column not in _columns(cursor, table):
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+
+class Backfill:
+    # заполнение данных по диапазонам ключа: каждая пачка - своя короткая
+    # транзакция, между ними другие процессы успевают писать, а читатели в
+    # WAL не ждут вовсе. Позиция сохраняется в schema_backfill, прерванный
+    # шаг продолжается с неё. sql получает границы (после, до включительно)
+    def __init__(self, table, key, sql):
+        self.table = table
+        self.key = key
+        self.sql = sql
+
+    def run(self, conn, version, batch_size=BATCH_SIZE, pause=PAUSE, progress=False):
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT COALESCE(MAX({self.key}), 0) FROM {self.table}")
+        last_key = cursor.fetchone()[0]
+        cursor.execute("SELECT position FROM schema_backfill WHERE version = ?", (version,))
+        row = cursor.fetchone()
+        position = row[0] if row else 0
+        updated = 0
+        while position < last_key:
+            upper = min(position + batch_size, last_key)
+            with transaction(conn) as cursor:
+                cursor.execute(self.sql, (position, upper))
+                updated += cursor.rowcount
+                cursor.execute(
+                    "INSERT OR REPLACE INTO schema_backfill (version, position) VALUES (?, ?)", (version, upper)
+                )
+            position = upper
+            if progress:
+                print(f"  {self.table}: {position}/{last_key}, изменено {updated}", end='\r')
+            if pause:
+                time.sleep(pause)
+        if progress and last_key:
+            print()
+        return updated
+
+MIGRATIONS = (
+    (1, "базовые таблицы", create_base_tables),
+    (2, "общие имена колонок rides", rename_columns),
+    (3, "баланс и статус водителей, версия и завершение поездок", add_columns),
+    # в схеме старого main.py не было completed_at: время завершения
+    # известно только с точностью до начала поездки
+    (4, "completed_at завершённых поездок", Backfill('rides', 'ride_id', '''
+        UPDATE rides SET completed_at = created_at
+        WHERE ride_id > ? AND ride_id <= ? AND status = 'completed' AND completed_at IS NULL
+    ''')),
+    # колонка status добавлена со значением 'waiting' для всех водителей
+    (5, "статус водителей в поездке", Backfill('drivers', 'driver_id', '''
+        UPDATE drivers SET status = 'working'
+        WHERE driver_id > ? AND driver_id <= ? AND status = 'waiting'
+          AND EXISTS (SELECT 1 FROM rides r WHERE r.driver_id = drivers.driver_id AND r.status = 'in_progress')
+    ''')),
+)
+
+LATEST = MIGRATIONS[-1][0]
+
+def ensure_version_table(conn):
+    with transaction(conn) as cursor:
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_backfill (
+            version INTEGER PRIMARY KEY,
+            position INTEGER NOT NULL
+        )
+        ''')
+
+def _current(cursor):
+    cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    return cursor.fetchone()[0]
+
+def current_version(conn):
+    ensure_version_table(conn)
+    return _current(conn.cursor())
+
+def pending(conn):
+    version = current_version(conn)
+    return [(number, name) for number, name, _ in MIGRATIONS if number > version]
+
+def migrate(conn, target=None, batch_size=BATCH_SIZE, pause=PAUSE, progress=False):
+    # номер перепроверяется внутри BEGIN IMMEDIATE: два процесса, стартовавшие
+    # одновременно, не применят один шаг дважды
+    if current_version(conn) >= (target or LATEST):
+        return []
+    applied = []
+    for version, name, step in MIGRATIONS:
+        if target is not None and version > target:
+            break
+        if isinstance(step, Backfill):
+            if current_version(conn) >= version:
+                continue
+            if progress:
+                print(f"{version}. {name}")
+            step.run(conn, version, batch_size, pause, progress)
+        with transaction(conn) as cursor:
+            if _current(cursor) >= version:
+                continue
+            if not isinstance(step, Backfill):
+                if progress:
+                    print(f"{version}. {name}")
+                step(cursor)
+            cursor.execute("INSERT INTO schema_version (version, name) VALUES (?, ?)", (version, name))
+            cursor.execute("DELETE FROM schema_backfill WHERE version = ?", (version,))
+        applied.append(version)
+    return applied
+
+def main():
+    parser = argparse.ArgumentParser(description="Миграции схемы базы такси")
+    parser.add_argument('command', choices=('status', 'up'))
+    parser.add_argument('--db', help="путь к базе (по умолчанию FAKETAXI_DB или database.db)")
+    parser.add_argument('--target', type=int, help="до какой версии поднимать")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="строк в одной транзакции заполнения")
+    parser.add_argument('--pause', type=float, default=PAUSE, help="пауза между пачками, с")
+    args = parser.parse_args()
+
+    conn = connect(args.db)
+    if args.command == 'status':
+        print(f"Версия схемы: {current_version(conn)} из {LATEST}")
+        for version, name in pending(conn):
+            print(f"  не применена {version}. {name}")
+    else:
+        start = time.perf_counter()
+        applied = migrate(conn, args.target, args.batch_size, args.pause, progress=True)
+        if applied:
+            print(f"Применено миграций: {len(applied)} за {time.perf_counter() - start:.1f} с, "
+                  f"версия схемы {current_version(conn)}")
+        else:
+            print(f"Схема актуальна, версия {current_version(conn)}")
+    conn.close()
+
+if __name__ == "__main__":
+    main()
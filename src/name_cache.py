@@ -0,0 +1,82 @@
+import threading
+from collections import OrderedDict
+
+# таблица -> колонка первичного ключа
+KEYS = {
+    'passengers': 'passenger_id',
+    'drivers': 'driver_id',
+}
+
+class NameCache:
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._names = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, conn, table, ids):
+        key = KEYS[table]
+        result = {}
+        missing = []
+        with self._lock:
+            for item_id in set(ids):
+                if (table, item_id) in self._names:
+                    self._names.move_to_end((table, item_id))
+                    result[item_id] = self._names[(table, item_id)]
+                    self.hits += 1
+                else:
+                    missing.append(item_id)
+                    self.misses += 1
+        if missing:
+            # все промахи страницы одним запросом
+            cursor = conn.cursor()
+            cursor.execute(
+                f"SELECT {key}, full_name FROM {table} WHERE {key} IN ({', '.join('?' for _ in missing)})",
+                missing,
+            )
+            found = {row[0]: row[1] for row in cursor.fetchall()}
+            with self._lock:
+                for item_id, name in found.items():
+                    self._names[(table, item_id)] = name
+                    if len(self._names) > self.maxsize:
+                        self._names.popitem(last=False)
+            result.update(found)
+        return result
+
+    def invalidate(self, table, item_id):
+        with self._lock:
+            self._names.pop((table, item_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._names.clear()
+
+_cache = None
+
+def enable(maxsize=10000):
+    global _cache
+    _cache = NameCache(maxsize)
+    return _cache
+
+def disable():
+    global _cache
+    _cache = None
+
+def get_cache():
+    return _cache
+
+def invalidate(table, item_id):
+    if _cache is not None:
+        _cache.invalidate(table, item_id)
+
+def lookup(conn, table, ids):
+    if _cache is not None:
+        return _cache.get_many(conn, table, ids)
+    ids = list(set(ids))
+    if not ids:
+        return {}
+    key = KEYS[table]
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT {key}, full_name FROM {table} WHERE {key} IN ({', '.join('?' for _ in ids)})", ids)
+    return {row[0]: row[1] for row in cursor.fetchall()}
@@ -0,0 +1,170 @@
+import argparse
+import os
+import sqlite3
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from datetime import datetime
+
+from db import DB_PATH, connect
+
+# копия базы для отчётов и выгрузок: тяжёлые чтения идут по файлу-копии и не
+# держат рабочую базу. Без копии длинная выгрузка - это читатель, из-за
+# которого checkpoint не может перенести WAL в базу: WAL растёт, и записи
+# поездок замедляются. Путь копии - FAKETAXI_REPLICA, по умолчанию рядом с базой
+REPLICA_PATH = os.environ.get('FAKETAXI_REPLICA')
+REFRESH_INTERVAL = 60.0
+
+def default_path(source=None):
+    base, _ = os.path.splitext(source or DB_PATH)
+    return base + '.replica.db'
+
+class ReadReplica:
+    def __init__(self, source=None, path=None, interval=REFRESH_INTERVAL):
+        self.source = source or DB_PATH
+        self.path = path or REPLICA_PATH or default_path(self.source)
+        self.interval = interval
+        self.refreshes = 0
+        self.last_duration = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def refresh(self):
+        # online backup из соединения mode=ro целиком (pages=-1): это одна
+        # читающая транзакция, в WAL писатели её не ждут. Постраничная копия
+        # начинается заново после каждой чужой записи и под нагрузкой может
+        # не закончиться. Готовая копия подменяет старую через os.replace:
+        # открытые соединения дочитывают прежний файл, новые видят новый
+        with self._lock:
+            start = time.time()
+            tmp = self.path + '.tmp'
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            source = connect(self.source, readonly=True)
+            target = sqlite3.connect(tmp)
+            try:
+                source.backup(target)
+                target.execute("PRAGMA journal_mode = DELETE")
+            finally:
+                target.close()
+                source.close()
+            # время снимка хранится в mtime файла: его видят и другие процессы
+            os.utime(tmp, (start, start))
+            os.replace(tmp, self.path)
+            self.refreshes += 1
+            self.last_duration = time.time() - start
+            return self.last_duration
+
+    def taken_at(self):
+        try:
+            return os.path.getmtime(self.path)
+        except FileNotFoundError:
+            return None
+
+    def staleness(self):
+        # секунд с момента снимка; None - копии ещё нет
+        taken = self.taken_at()
+        return None if taken is None else max(0.0, time.time() - taken)
+
+    def ensure_fresh(self, max_staleness=None):
+        max_staleness = self.interval if max_staleness is None else max_staleness
+        staleness = self.staleness()
+        if staleness is None or staleness > max_staleness:
+            self.refresh()
+        return self
+
+    def status(self):
+        taken = self.taken_at()
+        return {
+            'path': self.path,
+            'taken_at': datetime.fromtimestamp(taken).isoformat(sep=' ', timespec='seconds') if taken else None,
+            'staleness': round(self.staleness(), 1) if taken else None,
+            'interval': self.interval,
+            'last_duration': round(self.last_duration, 3) if self.last_duration is not None else None,
+        }
+
+    def connect(self):
+        self.ensure_fresh(float('inf'))
+        return connect(self.path, readonly=True)
+
+    @contextmanager
+    def connection(self):
+        conn = self.connect()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def start(self):
+        # обновление по расписанию в фоновом потоке; первая копия снимается
+        # сразу: к запуску create_tables мог изменить схему рабочей базы
+        if self._thread is not None:
+            return self
+        self.refresh()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="replica", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(max(0.0, self.interval - (self.staleness() or 0))):
+            try:
+                self.refresh()
+            except Exception:
+                traceback.print_exc()
+
+_replica = None
+
+def enable(source=None, path=None, interval=REFRESH_INTERVAL):
+    global _replica
+    disable()
+    _replica = ReadReplica(source, path, interval).start()
+    return _replica
+
+def disable():
+    global _replica
+    if _replica is not None:
+        _replica.stop()
+        _replica = None
+
+def get_replica():
+    return _replica
+
+def main():
+    parser = argparse.ArgumentParser(description="Копия базы для отчётов и выгрузок")
+    parser.add_argument('command', choices=('status', 'refresh', 'watch'))
+    parser.add_argument('--db', help="рабочая база (по умолчанию FAKETAXI_DB или database.db)")
+    parser.add_argument('--path', help="файл копии (по умолчанию FAKETAXI_REPLICA или <база>.replica.db)")
+    parser.add_argument('--interval', type=float, default=REFRESH_INTERVAL, help="обновлять раз в столько секунд")
+    args = parser.parse_args()
+
+    replica = ReadReplica(args.db, args.path, args.interval)
+    if args.command == 'refresh':
+        print(f"Копия {replica.path} обновлена за {replica.refresh():.2f} с")
+    elif args.command == 'watch':
+        replica.start()
+        print(f"Копия {replica.path} обновляется раз в {args.interval:.0f} с, Ctrl+C - выход")
+        try:
+            while True:
+                time.sleep(args.interval)
+                print(f"{replica.status()}")
+        except KeyboardInterrupt:
+            replica.stop()
+    else:
+        status = replica.status()
+        if status['taken_at'] is None:
+            print(f"Копии {replica.path} ещё нет")
+        else:
+            print(f"Копия {replica.path} от {status['taken_at']}, отстаёт на {status['staleness']} с")
+
+if __name__ == "__main__":
+    main()
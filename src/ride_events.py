@@ -0,0 +1,149 @@
+import asyncio
+import json
+import sys
+
+from db import connect, transaction
+
+# журнал событий поездок пишут триггеры, поэтому в него попадает любое
+# изменение rides: из меню, сервиса, массовой загрузки или другого процесса
+EVENTS_DDL = (
+    '''
+    CREATE TABLE IF NOT EXISTS ride_events (
+        event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ride_id INTEGER NOT NULL,
+        type TEXT NOT NULL,
+        status TEXT,
+        price REAL,
+        version INTEGER,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_ride_events_ride ON ride_events (ride_id, event_id)",
+    '''
+    CREATE TRIGGER IF NOT EXISTS ride_events_insert AFTER INSERT ON rides
+    BEGIN
+        INSERT INTO ride_events (ride_id, type, status, price, version)
+        VALUES (NEW.ride_id, 'created', NEW.status, NEW.price, NEW.version);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS ride_events_update AFTER UPDATE OF status, price ON rides
+    WHEN OLD.status IS NOT NEW.status OR OLD.price IS NOT NEW.price
+    BEGIN
+        INSERT INTO ride_events (ride_id, type, status, price, version)
+        VALUES (NEW.ride_id, 'updated', NEW.status, NEW.price, NEW.version);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS ride_events_delete AFTER DELETE ON rides
+    BEGIN
+        INSERT INTO ride_events (ride_id, type, status, price, version)
+        VALUES (OLD.ride_id, 'deleted', OLD.status, OLD.price, OLD.version);
+    END
+    ''',
+)
+
+EVENT_COLUMNS = "event_id, ride_id, type, status, price, version, created_at"
+BATCH = 500
+
+def ensure_events(conn):
+    # триггеры ссылаются на rides.version, её добавляет миграция 3
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'rides'")
+    if cursor.fetchone() is None:
+        return
+    with transaction(conn) as cursor:
+        for ddl in EVENTS_DDL:
+            cursor.execute(ddl)
+
+def fetch_events(conn, after_id=0, ride_id=None, limit=BATCH):
+    cursor = conn.cursor()
+    if ride_id is None:
+        cursor.execute(
+            f"SELECT {EVENT_COLUMNS} FROM ride_events WHERE event_id > ? ORDER BY event_id LIMIT ?",
+            (after_id, limit),
+        )
+    else:
+        cursor.execute(
+            f"SELECT {EVENT_COLUMNS} FROM ride_events WHERE ride_id = ? AND event_id > ? ORDER BY event_id LIMIT ?",
+            (ride_id, after_id, limit),
+        )
+    return [dict(row) for row in cursor.fetchall()]
+
+def ride_state(conn, ride_id):
+    # текущее состояние и последний event_id поездки одним запросом, чтобы
+    # подписчик без Last-Event-ID продолжил ровно с этого события
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT (SELECT COALESCE(MAX(event_id), 0) FROM ride_events e WHERE e.ride_id = r.ride_id) AS event_id,
+               r.ride_id, 'state' AS type, r.status, r.price, r.version
+        FROM rides r WHERE r.ride_id = ?
+    ''', (ride_id,))
+    row = cursor.fetchone()
+    return dict(row) if row else None
+
+def last_event_id(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT COALESCE(MAX(event_id), 0) FROM ride_events")
+    return cursor.fetchone()[0]
+
+def prune_events(conn, keep_days=7):
+    with transaction(conn) as cursor:
+        cursor.execute("DELETE FROM ride_events WHERE created_at < datetime('now', ?)", (f"-{keep_days} days",))
+        return cursor.rowcount
+
+def topics(event):
+    return ('rides', f"ride:{event['ride_id']}")
+
+def sse(event):
+    data = json.dumps(event, ensure_ascii=False)
+    return f"id: {event['event_id']}\nevent: {event['type']}\ndata: {data}\n\n".encode()
+
+class EventBus:
+    # у каждого подписчика своя ограниченная очередь; кто не успевает читать,
+    # получает None и отключается, а при переподключении догоняет по журналу
+    def __init__(self, queue_size=256):
+        self.queue_size = queue_size
+        self._subscribers = {}
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self, topic):
+        queue = asyncio.Queue(self.queue_size)
+        self._subscribers.setdefault(topic, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, topic, queue):
+        subscribers = self._subscribers.get(topic)
+        if subscribers is not None:
+            subscribers.discard(queue)
+            if not subscribers:
+                del self._subscribers[topic]
+
+    def publish(self, event):
+        self.published += 1
+        for topic in topics(event):
+            for queue in list(self._subscribers.get(topic, ())):
+                try:
+                    queue.put_nowait(event)
+                except asyncio.QueueFull:
+                    self.dropped += 1
+                    self.unsubscribe(topic, queue)
+                    while not queue.empty():
+                        queue.get_nowait()
+                    queue.put_nowait(None)
+
+    def __len__(self):
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] == "prune":
+        conn = connect()
+        print(f"Удалено событий: {prune_events(conn, int(sys.argv[2]))}")
+        conn.close()
+    else:
+        print(f"Использование: python {sys.argv[0]} prune <дней хранить>")
+        sys.exit(2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+import argparse
+import math
+import sys
+from datetime import datetime, timedelta
+
+from db import connect, transaction
+from indexes import register_query
+
+# шаг ряда: (имя, формат начала интервала для strftime, длина в секундах);
+# формат общий у SQLite и Python, поэтому метки из базы и из кода совпадают
+GRAINS = (
+    ('minute', '%Y-%m-%d %H:%M', 60),
+    ('hour', '%Y-%m-%d %H:00', 3600),
+    ('day', '%Y-%m-%d', 86400),
+)
+
+GRAIN_NAMES = tuple(name for name, _, _ in GRAINS)
+
+TRIGGER_NAMES = ('ride_series_insert', 'ride_series_update', 'ride_series_delete')
+
+# интервалов в одном ответе: минуты за месяц - 43200
+MAX_BUCKETS = 100000
+
+def _grain(name):
+    for grain in GRAINS:
+        if grain[0] == name:
+            return grain
+    raise ValueError(f"Неизвестный шаг: {name} (можно {', '.join(GRAIN_NAMES)})")
+
+def _duration(r):
+    # длительность в секундах; у поездок из старых баз completed_at равен
+    # created_at (миграция 4), такие в среднее время не попадают
+    return (f"CASE WHEN {r}.completed_at > {r}.created_at "
+            f"THEN (julianday({r}.completed_at) - julianday({r}.created_at)) * 86400 END")
+
+def _add_sql(grain, fmt):
+    bucket = f"strftime('{fmt}', NEW.created_at)"
+    return f'''
+        INSERT INTO ride_buckets (grain, bucket, status, count, revenue, timed, duration)
+        SELECT '{grain}', {bucket}, IFNULL(NEW.status, ''), 1, IFNULL(NEW.price, 0),
+               {_duration('NEW')} IS NOT NULL, IFNULL({_duration('NEW')}, 0)
+        WHERE {bucket} IS NOT NULL
+        ON CONFLICT (grain, bucket, status) DO UPDATE SET
+            count = count + 1,
+            revenue = revenue + excluded.revenue,
+            timed = timed + excluded.timed,
+            duration = duration + excluded.duration;'''
+
+def _remove_sql(grain, fmt):
+    return f'''
+        UPDATE ride_buckets SET
+            count = count - 1,
+            revenue = revenue - IFNULL(OLD.price, 0),
+            timed = timed - ({_duration('OLD')} IS NOT NULL),
+            duration = duration - IFNULL({_duration('OLD')}, 0)
+        WHERE grain = '{grain}' AND bucket = strftime('{fmt}', OLD.created_at) AND status = IFNULL(OLD.status, '');'''
+
+def series_ddl():
+    add = "".join(_add_sql(grain, fmt) for grain, fmt, _ in GRAINS)
+    remove = "".join(_remove_sql(grain, fmt) for grain, fmt, _ in GRAINS)
+    return (
+        '''
+        CREATE TABLE IF NOT EXISTS ride_buckets (
+            grain TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            status TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            revenue REAL NOT NULL DEFAULT 0,
+            timed INTEGER NOT NULL DEFAULT 0,
+            duration REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (grain, bucket, status)
+        ) WITHOUT ROWID
+        ''',
+        # пересчёт и выборки по сырым поездкам за период
+        "CREATE INDEX IF NOT EXISTS idx_rides_created_at ON rides (created_at)",
+        f"CREATE TRIGGER IF NOT EXISTS ride_series_insert AFTER INSERT ON rides BEGIN{add}\n        END",
+        f'''CREATE TRIGGER IF NOT EXISTS ride_series_update
+        AFTER UPDATE OF status, price, created_at, completed_at ON rides
+        WHEN OLD.status IS NOT NEW.status OR OLD.price IS NOT NEW.price
+          OR OLD.created_at IS NOT NEW.created_at OR OLD.completed_at IS NOT NEW.completed_at
+        BEGIN{remove}{add}
+        END''',
+        f"CREATE TRIGGER IF NOT EXISTS ride_series_delete AFTER DELETE ON rides BEGIN{remove}\n        END",
+    )
+
+def series_enabled(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ride_buckets'")
+    return cursor.fetchone() is not None
+
+def _aggregate_sql():
+    return " UNION ALL".join(f'''
+        SELECT '{grain}', strftime('{fmt}', created_at) AS bucket, IFNULL(status, ''), COUNT(*), TOTAL(price),
+               COUNT({_duration('rides')}), TOTAL({_duration('rides')})
+        FROM rides
+        WHERE bucket IS NOT NULL
+        GROUP BY 2, 3''' for grain, fmt, _ in GRAINS)
+
+def rebuild_series(conn):
+    with transaction(conn) as cursor:
+        cursor.execute("DELETE FROM ride_buckets")
+        cursor.execute(
+            "INSERT INTO ride_buckets (grain, bucket, status, count, revenue, timed, duration)" + _aggregate_sql()
+        )
+
+def ensure_series(conn):
+    if series_enabled(conn):
+        return
+    with transaction(conn) as cursor:
+        for ddl in series_ddl():
+            cursor.execute(ddl)
+        rebuild_series(conn)
+
+def drop_series(conn):
+    with transaction(conn) as cursor:
+        for name in TRIGGER_NAMES:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute("DROP TABLE IF EXISTS ride_buckets")
+
+def _by_bucket(rows):
+    # суммы с точностью до копейки и секунды: инкрементальный REAL копит погрешность
+    return {tuple(row[:3]): (row[3], round(row[4], 2), row[5], round(row[6])) for row in rows}
+
+def check_series(conn, repair=True):
+    with transaction(conn) as cursor:
+        cursor.execute(
+            "SELECT grain, bucket, status, count, revenue, timed, duration FROM ride_buckets WHERE count <> 0"
+        )
+        stored = _by_bucket(cursor.fetchall())
+        cursor.execute(_aggregate_sql())
+        actual = _by_bucket(cursor.fetchall())
+        mismatches = {
+            key: (stored.get(key), actual.get(key))
+            for key in stored.keys() | actual.keys()
+            if stored.get(key) != actual.get(key)
+        }
+        if mismatches and repair:
+            rebuild_series(conn)
+    return mismatches
+
+# месяц по часам - до 720 * 4 строк из диапазона первичного ключа
+SERIES_SQL = register_query('ride_series', '''
+SELECT bucket, status, count, revenue, timed, duration
+FROM ride_buckets
+WHERE grain = ? AND bucket >= ? AND bucket < ?
+''', ('hour', '2025-01-01', '2025-02-01'))
+
+# MIN/MAX по префиксу первичного ключа - два поиска в индексе
+RANGE_SQL = '''
+SELECT MIN(bucket), MAX(bucket)
+FROM ride_buckets
+WHERE grain = ?
+'''
+
+def _moment(value):
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
+def _floor(moment, step):
+    if step == 60:
+        return moment.replace(second=0, microsecond=0)
+    if step == 3600:
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def series(conn, grain='hour', since=None, until=None, window=1):
+    # ряд по интервалам [since, until): каждая точка - поездки, созданные в
+    # интервале, а при window > 1 - в нём и window - 1 предыдущих
+    # (скользящее окно). Пустые интервалы идут с нулями, чтобы ряд был
+    # непрерывным для графика
+    name, fmt, step = _grain(grain)
+    if window < 1:
+        raise ValueError("Окно должно быть не меньше одного интервала")
+    since, until = _moment(since), _moment(until)
+    cursor = conn.cursor()
+    if since is None or until is None:
+        cursor.execute(RANGE_SQL, (name,))
+        first, last = cursor.fetchone()
+        if first is None:
+            return []
+        since = since or datetime.fromisoformat(first)
+        until = until or datetime.fromisoformat(last) + timedelta(seconds=step)
+    start = _floor(since, step)
+    if until <= start:
+        return []
+    count = math.ceil((until - start).total_seconds() / step)
+    total = count + window - 1
+    if total > MAX_BUCKETS:
+        raise ValueError(f"Слишком много интервалов ({total}), возьмите шаг крупнее или период короче")
+    first = start - timedelta(seconds=step * (window - 1))
+    labels = [(first + timedelta(seconds=step * i)).strftime(fmt) for i in range(total)]
+
+    # rides, completed, cancelled, revenue, timed, duration по интервалам
+    sums = {label: [0, 0, 0, 0.0, 0, 0.0] for label in labels}
+    # метки одного формата сравниваются как строки в том же порядке, что и время
+    cursor.execute(SERIES_SQL, (name, labels[0], (first + timedelta(seconds=step * total)).strftime(fmt)))
+    for bucket, status, rides, revenue, timed, duration in cursor:
+        point = sums.get(bucket)
+        if point is None:
+            continue
+        point[0] += rides
+        if status == 'completed':
+            point[1] += rides
+            point[3] += revenue
+        elif status == 'cancelled':
+            point[2] += rides
+        point[4] += timed
+        point[5] += duration
+
+    # скользящее окно: к сумме добавляется новый интервал и вычитается
+    # выпавший, поэтому окно любой длины считается за один проход
+    window_sums = [0, 0, 0, 0.0, 0, 0.0]
+    result = []
+    for i, label in enumerate(labels):
+        point = sums[label]
+        if window > 1:
+            dropped = sums[labels[i - window]] if i >= window else (0, 0, 0, 0.0, 0, 0.0)
+            window_sums = [total + new - old for total, new, old in zip(window_sums, point, dropped)]
+            if i < window - 1:
+                continue
+            point = window_sums
+        rides, completed, cancelled, revenue, timed, duration = point
+        result.append({
+            'bucket': label,
+            'rides': rides,
+            'completed': completed,
+            'cancelled': cancelled,
+            'revenue': round(revenue, 2),
+            'cancel_rate': round(cancelled / rides, 4) if rides else None,
+            'avg_duration': round(duration / timed / 60, 1) if timed else None,
+        })
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Выручка и спрос по интервалам времени")
+    parser.add_argument('command', nargs='?', default='show', choices=('show', 'rebuild', 'check', 'drop'))
+    parser.add_argument('--grain', default='hour', choices=GRAIN_NAMES)
+    parser.add_argument('--from', dest='since', help="с момента (включительно), например 2025-03-01")
+    parser.add_argument('--to', dest='until', help="до момента (не включая)")
+    parser.add_argument('--window', type=int, default=1, help="скользящее окно, интервалов")
+    args = parser.parse_args()
+
+    conn = connect()
+    if args.command == 'drop':
+        drop_series(conn)
+        print("Агрегаты по времени удалены")
+    elif args.command == 'rebuild':
+        ensure_series(conn)
+        rebuild_series(conn)
+        print("Агрегаты по времени пересчитаны")
+    elif args.command == 'check':
+        ensure_series(conn)
+        mismatches = check_series(conn)
+        for (grain, bucket, status), (stored, actual) in sorted(mismatches.items(), key=str):
+            print(f"{grain}/{bucket}/{status}: было {stored}, должно быть {actual}")
+        if mismatches:
+            print("Агрегаты пересчитаны")
+            sys.exit(1)
+        print("Агрегаты совпадают с таблицей rides")
+    else:
+        ensure_series(conn)
+        try:
+            points = series(conn, args.grain, args.since, args.until, args.window)
+        except ValueError as error:
+            print(error)
+            sys.exit(2)
+        for point in points:
+            rate = f"{point['cancel_rate']:.1%}" if point['cancel_rate'] is not None else "-"
+            duration = f"{point['avg_duration']} мин" if point['avg_duration'] is not None else "-"
+            print(f"{point['bucket']}: {point['rides']} поездок, выручка {point['revenue']} руб., "
+                  f"отмен {rate}, в пути {duration}")
+    conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import group_commit
+
+# статус -> куда из него можно перейти
+TRANSITIONS = {
+    'pending': ('in_progress', 'cancelled'),
+    'in_progress': ('completed', 'cancelled'),
+    'completed': (),
+    'cancelled': (),
+}
+
+STATUSES = tuple(TRANSITIONS)
+
+# из этих статусов переходов нет: поездка больше не занимает водителя
+FINAL = tuple(status for status, targets in TRANSITIONS.items() if not targets)
+
+# новая поездка всегда начинается отсюда, дальше - только через transition()
+INITIAL = 'pending'
+
+def allowed_from(status):
+    return tuple(source for source, targets in TRANSITIONS.items() if status in targets)
+
+# статусы, в которые можно перейти из какого-нибудь другого
+TARGETS = tuple(status for status in STATUSES if allowed_from(status))
+
+def _transition_sql(sources, check_version):
+    # один UPDATE по первичному ключу: переход проходит, только если поездка
+    # всё ещё в допустимом статусе (и в ожидаемой версии)
+    condition = f"status IN ({', '.join('?' for _ in sources)})"
+    if check_version:
+        condition += " AND version = ?"
+    return f'''
+        UPDATE rides
+        SET status = ?,
+            version = version + 1,
+            completed_at = CASE WHEN ? = 'completed' THEN datetime('now', 'localtime') ELSE completed_at END
+        WHERE ride_id = ? AND {condition}
+        RETURNING status, version, driver_id'''
+
+RELEASE_DRIVER_SQL = f'''
+UPDATE drivers SET status = 'waiting'
+WHERE driver_id = ? AND status = 'working'
+  AND NOT EXISTS (
+      SELECT 1 FROM rides
+      WHERE driver_id = ? AND status NOT IN ({', '.join(repr(status) for status in FINAL)})
+  )
+'''
+
+def _apply(cursor, ride_id, status, expected_version):
+    sources = allowed_from(status)
+    params = [status, status, ride_id, *sources]
+    if expected_version is not None:
+        params.append(expected_version)
+    cursor.execute(_transition_sql(sources, expected_version is not None), params)
+    rows = cursor.fetchall()
+    if rows:
+        if status in FINAL and rows[0][2] is not None:
+            # водитель, занятый при назначении (dispatch.create_ride), свободен в той
+            # же транзакции, что и завершение, если у него нет других активных поездок
+            cursor.execute(RELEASE_DRIVER_SQL, (rows[0][2], rows[0][2]))
+        return True, rows[0][0], rows[0][1]
+    # конфликт: возвращаем текущее состояние, чтобы клиент решил, что делать дальше
+    cursor.execute("SELECT status, version FROM rides WHERE ride_id = ?", (ride_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return False, None, None
+    return False, row[0], row[1]
+
+def transition(conn, ride_id, status, expected_version=None):
+    # -> (успех, статус, версия); при неудаче статус и версия текущие,
+    # (False, None, None) - поездки нет
+    if status not in TRANSITIONS:
+        raise ValueError(f"Неизвестный статус: {status}")
+    if not allowed_from(status):
+        raise ValueError(f"В статус {status} перейти нельзя")
+    return group_commit.run(conn, _apply, ride_id, status, expected_version)
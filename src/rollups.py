@@ -0,0 +1,200 @@
+import sys
+
+from db import connect, transaction
+
+# границы тарифов те же, что в tariff(): (название, от, до включительно)
+TARIFFS = (
+    ('Эконом', None, 400),
+    ('Комфорт', 400, 1000),
+    ('Премиум', 1000, None),
+)
+
+TARIFF_NAMES = tuple(name for name, _, _ in TARIFFS)
+
+TRIGGER_NAMES = ('ride_rollups_insert', 'ride_rollups_update', 'ride_rollups_delete')
+
+def tariff_expr(price):
+    cases = " ".join(f"WHEN {price} <= {hi} THEN '{name}'" for name, _, hi in TARIFFS if hi is not None)
+    return f"CASE {cases} ELSE '{TARIFFS[-1][0]}' END"
+
+def _tariff_bound(key, index, default):
+    cases = " ".join(
+        f"WHEN '{tariff[0]}' THEN {tariff[index]}" for tariff in TARIFFS if tariff[index] is not None
+    )
+    return f"(CASE {key} {cases} ELSE {default} END)"
+
+def ride_time_column(conn):
+    # до миграции 2 в базах старого main.py время поездки лежит в ride_date
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA table_info(rides)")
+    columns = {row[1] for row in cursor.fetchall()}
+    if not columns:
+        return None
+    return 'created_at' if 'created_at' in columns else 'ride_date'
+
+def dimensions(time_column):
+    # имя -> (ключ по строке r, условие отбора поездок группы по ключу k)
+    return {
+        'all': (
+            lambda r: "''",
+            lambda k: "1",
+        ),
+        'day': (
+            lambda r: f"IFNULL(date({r}.{time_column}), '')",
+            lambda k: f"{time_column} >= {k} AND {time_column} < date({k}, '+1 day')",
+        ),
+        'passenger': (
+            lambda r: f"IFNULL({r}.passenger_id, '')",
+            lambda k: f"passenger_id = {k}",
+        ),
+        'driver': (
+            lambda r: f"IFNULL({r}.driver_id, '')",
+            lambda k: f"driver_id = {k}",
+        ),
+        'tariff': (
+            lambda r: tariff_expr(f"{r}.price"),
+            lambda k: f"price > {_tariff_bound(k, 1, '-1e308')} AND price <= {_tariff_bound(k, 2, '1e308')}",
+        ),
+    }
+
+def _add_sql(name, key):
+    return f'''
+        INSERT INTO ride_rollups (dimension, key, status, count, priced, sum, min, max)
+        VALUES ('{name}', {key}, IFNULL(NEW.status, ''), 1, NEW.price IS NOT NULL, IFNULL(NEW.price, 0), NEW.price, NEW.price)
+        ON CONFLICT (dimension, key, status) DO UPDATE SET
+            count = count + 1,
+            priced = priced + excluded.priced,
+            sum = sum + excluded.sum,
+            min = CASE WHEN min IS NULL OR excluded.min < min THEN IFNULL(excluded.min, min) ELSE min END,
+            max = CASE WHEN max IS NULL OR excluded.max > max THEN IFNULL(excluded.max, max) ELSE max END;'''
+
+def _remove_sql(name, key, condition):
+    # min/max пересчитываются по индексу только если уходит крайнее значение
+    group = f"status = OLD.status AND {condition}"
+    return f'''
+        UPDATE ride_rollups SET
+            count = count - 1,
+            priced = priced - (OLD.price IS NOT NULL),
+            sum = sum - IFNULL(OLD.price, 0),
+            min = CASE WHEN OLD.price IS NULL OR OLD.price > min THEN min
+                  ELSE (SELECT MIN(price) FROM rides WHERE {group}) END,
+            max = CASE WHEN OLD.price IS NULL OR OLD.price < max THEN max
+                  ELSE (SELECT MAX(price) FROM rides WHERE {group}) END
+        WHERE dimension = '{name}' AND key = {key} AND status = IFNULL(OLD.status, '');'''
+
+def rollup_ddl(time_column):
+    dims = dimensions(time_column)
+    add = "".join(_add_sql(name, key('NEW')) for name, (key, _) in dims.items())
+    remove = "".join(_remove_sql(name, key('OLD'), condition(key('OLD'))) for name, (key, condition) in dims.items())
+    return (
+        '''
+        CREATE TABLE IF NOT EXISTS ride_rollups (
+            dimension TEXT NOT NULL,
+            key NOT NULL,
+            status TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            priced INTEGER NOT NULL DEFAULT 0,
+            sum REAL NOT NULL DEFAULT 0,
+            min REAL,
+            max REAL,
+            PRIMARY KEY (dimension, key, status)
+        ) WITHOUT ROWID
+        ''',
+        # для пересчёта min/max по дню
+        f"CREATE INDEX IF NOT EXISTS idx_rides_{time_column} ON rides ({time_column})",
+        f"CREATE TRIGGER IF NOT EXISTS ride_rollups_insert AFTER INSERT ON rides BEGIN{add}\n        END",
+        f'''CREATE TRIGGER IF NOT EXISTS ride_rollups_update
+        AFTER UPDATE OF status, price, passenger_id, driver_id, {time_column} ON rides
+        BEGIN{remove}{add}
+        END''',
+        f"CREATE TRIGGER IF NOT EXISTS ride_rollups_delete AFTER DELETE ON rides BEGIN{remove}\n        END",
+    )
+
+def rollups_enabled(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ride_rollups'")
+    return cursor.fetchone() is not None
+
+def _aggregate_sql(time_column):
+    return " UNION ALL".join(f'''
+        SELECT '{name}', {key('rides')}, IFNULL(status, ''), COUNT(*), COUNT(price), TOTAL(price), MIN(price), MAX(price)
+        FROM rides
+        GROUP BY 2, 3''' for name, (key, _) in dimensions(time_column).items())
+
+def rebuild_rollups(conn):
+    time_column = ride_time_column(conn)
+    with transaction(conn) as cursor:
+        cursor.execute("DELETE FROM ride_rollups")
+        cursor.execute(
+            "INSERT INTO ride_rollups (dimension, key, status, count, priced, sum, min, max)"
+            + _aggregate_sql(time_column)
+        )
+
+def ensure_rollups(conn):
+    if rollups_enabled(conn):
+        return
+    time_column = ride_time_column(conn)
+    with transaction(conn) as cursor:
+        for ddl in rollup_ddl(time_column):
+            cursor.execute(ddl)
+        rebuild_rollups(conn)
+
+def drop_rollups(conn):
+    with transaction(conn) as cursor:
+        for name in TRIGGER_NAMES:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute("DROP TABLE IF EXISTS ride_rollups")
+
+def _by_group(rows):
+    # суммы сравниваются с точностью до копейки: инкрементальная сумма REAL копит погрешность
+    return {tuple(row[:3]): (row[3], row[4], round(row[5], 2), row[6], row[7]) for row in rows}
+
+def check_rollups(conn, repair=True):
+    time_column = ride_time_column(conn)
+    with transaction(conn) as cursor:
+        cursor.execute(
+            "SELECT dimension, key, status, count, priced, sum, min, max FROM ride_rollups WHERE count <> 0"
+        )
+        stored = _by_group(cursor.fetchall())
+        cursor.execute(_aggregate_sql(time_column))
+        actual = _by_group(cursor.fetchall())
+        mismatches = {
+            key: (stored.get(key), actual.get(key))
+            for key in stored.keys() | actual.keys()
+            if stored.get(key) != actual.get(key)
+        }
+        if mismatches and repair:
+            rebuild_rollups(conn)
+    return mismatches
+
+def main():
+    commands = ("rebuild", "check", "drop")
+    if len(sys.argv) != 2 or sys.argv[1] not in commands:
+        print(f"Использование: python {sys.argv[0]} {'|'.join(commands)}")
+        sys.exit(2)
+
+    conn = connect()
+    if ride_time_column(conn) is None:
+        print("В базе нет таблицы rides")
+        sys.exit(1)
+    command = sys.argv[1]
+    if command == "drop":
+        drop_rollups(conn)
+        print("Агрегаты поездок удалены")
+    elif command == "rebuild":
+        ensure_rollups(conn)
+        rebuild_rollups(conn)
+        print("Агрегаты поездок пересчитаны")
+    else:
+        ensure_rollups(conn)
+        mismatches = check_rollups(conn)
+        for (dimension, key, status), (stored, actual) in sorted(mismatches.items(), key=str):
+            print(f"{dimension}/{key}/{status}: было {stored}, должно быть {actual}")
+        if mismatches:
+            print("Агрегаты пересчитаны")
+            sys.exit(1)
+        print("Агрегаты совпадают с таблицей rides")
+    conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,512 @@
+import argparse
+import asyncio
+import json
+import re
+import sqlite3
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+from db import ConnectionPool
+import group_commit
+import ledger
+import main as app
+import ride_events
+import replica
+import ride_series
+import ride_states
+import ticket_stats
+
+MAX_BODY = 1024 * 1024
+MAX_PAGE = 500
+
+REASONS = {
+    200: 'OK', 201: 'Created', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+    409: 'Conflict', 413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable',
+}
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def _int(value, name):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise HttpError(400, f"{name}: ожидалось целое число") from None
+
+def _price(value):
+    try:
+        price = float(value)
+    except (TypeError, ValueError):
+        raise HttpError(400, "price: ожидалось число") from None
+    if not 0 < price < float('inf'):
+        raise HttpError(400, "price: цена должна быть больше нуля")
+    return price
+
+def _fields(body, *names, optional=()):
+    missing = [name for name in names if body.get(name) in (None, '')]
+    if missing:
+        raise HttpError(400, f"Не заполнены поля: {', '.join(missing)}")
+    return [body.get(name) for name in names + tuple(optional)]
+
+def _page(pages, key):
+    items = next(pages, [])
+    pages.close()
+    return {"items": items, "next": items[-1][key] if items else None}
+
+def _limit(query):
+    return min(_int(query.get('limit', 50), 'limit'), MAX_PAGE)
+
+def _found(rowcount, message):
+    if not rowcount:
+        raise HttpError(404, message)
+    return {"updated": rowcount}
+
+# обработчики выполняются в потоках БД: handler(conn, params, query, body)
+def list_passengers(conn, params, query, body):
+    return _page(app.iter_passenger_pages(conn, after_id=_int(query.get('after', 0), 'after'),
+                                          page_size=_limit(query)), 'passenger_id')
+
+def add_passenger(conn, params, query, body):
+    full_name, phone, email = _fields(body, 'full_name', 'phone', optional=('email',))
+    return 201, {"passenger_id": app.add_passenger(conn, full_name, phone, email)}
+
+# rating без значения в теле запроса остаётся прежним (COALESCE в main.py)
+def update_passenger(conn, params, query, body):
+    values = _fields(body, 'full_name', 'phone', optional=('email', 'rating'))
+    return _found(app.update_passenger(conn, params['id'], *values), "Пассажир не найден")
+
+def delete_passenger(conn, params, query, body):
+    return _found(app.delete_passenger(conn, params['id']), "Пассажир не найден")
+
+def list_drivers(conn, params, query, body):
+    return _page(app.iter_driver_pages(conn, after_id=_int(query.get('after', 0), 'after'),
+                                       page_size=_limit(query)), 'driver_id')
+
+def add_driver(conn, params, query, body):
+    values = _fields(body, 'full_name', 'phone', optional=('email', 'car_model', 'car_number'))
+    return 201, {"driver_id": app.add_driver(conn, *values)}
+
+def update_driver(conn, params, query, body):
+    values = _fields(body, 'full_name', 'phone', optional=('email', 'rating', 'car_model', 'car_number'))
+    return _found(app.update_driver(conn, params['id'], *values), "Водитель не найден")
+
+def delete_driver(conn, params, query, body):
+    return _found(app.delete_driver(conn, params['id']), "Водитель не найден")
+
+def _driver_exists(conn, driver_id):
+    if conn.execute("SELECT 1 FROM drivers WHERE driver_id = ?", (driver_id,)).fetchone() is None:
+        raise HttpError(404, "Водитель не найден")
+
+def driver_balance(conn, params, query, body):
+    _driver_exists(conn, params['id'])
+    return {"driver_id": params['id'], "balance": ledger.balance(conn, params['id'])}
+
+def pay_driver(conn, params, query, body):
+    amount, = _fields(body, 'amount')
+    _driver_exists(conn, params['id'])
+    try:
+        amount = float(amount)
+    except (TypeError, ValueError):
+        raise HttpError(400, "amount: ожидалось число") from None
+    return 201, {"driver_id": params['id'], "balance": ledger.withdraw(conn, params['id'], amount)}
+
+def list_rides(conn, params, query, body):
+    driver_id = query.get('driver_id')
+    return _page(app.iter_ride_pages(
+        conn,
+        status=query.get('status'),
+        driver_id=_int(driver_id, 'driver_id') if driver_id else None,
+        date_from=query.get('from'),
+        date_to=query.get('to'),
+        after_id=_int(query.get('after', 0), 'after'),
+        page_size=_limit(query),
+    ), 'ride_id')
+
+def get_ride(conn, params, query, body):
+    page = next(app.iter_ride_pages(conn, after_id=params['id'] - 1, page_size=1), [])
+    if not page or page[0]['ride_id'] != params['id']:
+        raise HttpError(404, "Поездка не найдена")
+    return page[0]
+
+def add_ride(conn, params, query, body):
+    passenger_id, driver_id, pickup, dropoff, price, status = _fields(
+        body, 'passenger_id', 'driver_id', 'pickup_location', 'dropoff_location', 'price', optional=('status',)
+    )
+    # статус при создании только начальный, остальные - через PUT /rides/<id>/status
+    ride_id = app.add_ride(conn, passenger_id, driver_id, pickup, dropoff, _price(price),
+                           status or ride_states.INITIAL)
+    return 201, {"ride_id": ride_id}
+
+def update_ride_status(conn, params, query, body):
+    status, version = _fields(body, 'status', optional=('version',))
+    ok, current, version = app.update_ride_status(conn, params['id'], status,
+                                                  _int(version, 'version') if version is not None else None)
+    if current is None:
+        raise HttpError(404, "Поездка не найдена")
+    if not ok:
+        return 409, {"error": "Конфликт статуса", "status": current, "version": version}
+    return {"status": current, "version": version}
+
+def delete_ride(conn, params, query, body):
+    return _found(app.delete_ride(conn, params['id']), "Поездка не найдена")
+
+def list_tickets(conn, params, query, body):
+    before = query.get('before')
+    pages = app.iter_ticket_pages(conn, query.get('status'), _int(before, 'before') if before else None,
+                                  page_size=_limit(query))
+    return _page(pages, 'ticket_id')
+
+def add_ticket(conn, params, query, body):
+    category, description, passenger_id, driver_id, ride_id, priority = _fields(
+        body, 'category', 'description', optional=('passenger_id', 'driver_id', 'ride_id', 'priority')
+    )
+    ticket_id = app.create_support_ticket(conn, passenger_id, driver_id, ride_id, category, description,
+                                          priority or 'normal')
+    return 201, {"ticket_id": ticket_id}
+
+def respond_to_ticket(conn, params, query, body):
+    response, = _fields(body, 'response')
+    return _found(app.respond_to_ticket(conn, params['id'], response), "Тикет не найден")
+
+def close_ticket(conn, params, query, body):
+    return _found(app.close_ticket(conn, params['id']), "Тикет не найден")
+
+# статистика читает копию базы, если сервис запущен с --replica
+def ticket_statistics(conn, params, query, body):
+    with app.report_connection(conn) as reader:
+        stats = ticket_stats.get_stats(reader)
+    stats['categories'] = dict(stats['categories'])
+    return stats
+
+def ride_statistics(conn, params, query, body):
+    with app.report_connection(conn) as reader:
+        stats = dict(app.rides_totals(reader))
+        row = app.rides_by_status(reader, 'completed')
+    stats['completed'] = row['count'] if row else 0
+    stats['profit'] = row['sum'] if row else 0
+    return stats
+
+def series_statistics(conn, params, query, body):
+    window = _int(query.get('window', 1), 'window')
+    with app.report_connection(conn) as reader:
+        points = ride_series.series(reader, query.get('grain', 'hour'), query.get('from'), query.get('to'), window)
+    return {"points": points}
+
+def replica_status(conn, params, query, body):
+    source = replica.get_replica()
+    if source is None:
+        raise HttpError(404, "Копия базы для отчётов не включена")
+    return source.status()
+
+ROUTES = [
+    ('GET', r'/passengers', list_passengers),
+    ('POST', r'/passengers', add_passenger),
+    ('PUT', r'/passengers/(?P<id>\d+)', update_passenger),
+    ('DELETE', r'/passengers/(?P<id>\d+)', delete_passenger),
+    ('GET', r'/drivers', list_drivers),
+    ('POST', r'/drivers', add_driver),
+    ('PUT', r'/drivers/(?P<id>\d+)', update_driver),
+    ('DELETE', r'/drivers/(?P<id>\d+)', delete_driver),
+    ('GET', r'/drivers/(?P<id>\d+)/balance', driver_balance),
+    ('POST', r'/drivers/(?P<id>\d+)/payouts', pay_driver),
+    ('GET', r'/rides', list_rides),
+    ('POST', r'/rides', add_ride),
+    ('GET', r'/rides/(?P<id>\d+)', get_ride),
+    ('PUT', r'/rides/(?P<id>\d+)/status', update_ride_status),
+    ('DELETE', r'/rides/(?P<id>\d+)', delete_ride),
+    ('GET', r'/tickets', list_tickets),
+    ('POST', r'/tickets', add_ticket),
+    ('POST', r'/tickets/(?P<id>\d+)/response', respond_to_ticket),
+    ('POST', r'/tickets/(?P<id>\d+)/close', close_ticket),
+    ('GET', r'/stats/rides', ride_statistics),
+    ('GET', r'/stats/tickets', ticket_statistics),
+    ('GET', r'/stats/series', series_statistics),
+    ('GET', r'/stats/replica', replica_status),
+]
+
+ROUTES = [(method, re.compile(pattern + '$'), handler) for method, pattern, handler in ROUTES]
+
+def route(method, path):
+    allowed = False
+    for route_method, pattern, handler in ROUTES:
+        match = pattern.match(path)
+        if match:
+            if route_method == method:
+                return handler, {key: int(value) for key, value in match.groupdict().items()}
+            allowed = True
+    raise HttpError(405 if allowed else 404, "Метод не поддерживается" if allowed else "Не найдено")
+
+# потоки событий (Server-Sent Events): все поездки или одна
+STREAM = re.compile(r'/(?:rides/(?P<id>\d+)/)?events$')
+
+def response_head(status, content_type, keep_alive, length=None, extra=''):
+    head = f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\nContent-Type: {content_type}\r\n"
+    if length is not None:
+        head += f"Content-Length: {length}\r\n"
+    return (head + extra + f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n").encode()
+
+def json_response(status, payload, keep_alive=False):
+    data = json.dumps(payload, ensure_ascii=False, default=str).encode()
+    return response_head(status, 'application/json; charset=utf-8', keep_alive, len(data)) + data
+
+class TaxiService:
+    # event loop только разбирает HTTP; все обращения к SQLite идут в отдельный
+    # пул потоков, у каждого потока своё соединение из ConnectionPool
+    def __init__(self, db_path=None, db_workers=8, max_concurrency=64, queue_timeout=1.0,
+                 max_subscribers=1000, event_queue=256, poll_interval=0.5, heartbeat=15.0,
+                 snapshot_interval=60.0, replica_interval=None):
+        self.pool = ConnectionPool(db_path, size=db_workers)
+        self.executor = ThreadPoolExecutor(max_workers=db_workers, thread_name_prefix='db')
+        self.limit = asyncio.Semaphore(max_concurrency)
+        self.queue_timeout = queue_timeout
+        self.rejected = 0
+        # журнал ride_events читает одна задача на всех подписчиков; после
+        # записей через сервис она будится сразу, чужие записи ловит по таймеру
+        self.bus = ride_events.EventBus(event_queue)
+        self.max_subscribers = max_subscribers
+        self.poll_interval = poll_interval
+        self.heartbeat = heartbeat
+        self.last_event = 0
+        self._wake = asyncio.Event()
+        self._tailer = None
+        # хвосты журнала баланса периодически сворачиваются в снимки
+        self.snapshot_interval = snapshot_interval
+        self._snapshots = None
+        # отчёты по копии базы, обновляемой раз в replica_interval секунд
+        self.replica_interval = replica_interval
+
+    def _call(self, handler, params, query, body):
+        with self.pool.connection() as conn:
+            return handler(conn, params, query, body)
+
+    async def run_db(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, fn, *args)
+
+    def _events(self, after_id, ride_id=None):
+        with self.pool.connection() as conn:
+            return ride_events.fetch_events(conn, after_id, ride_id)
+
+    def _ride_state(self, ride_id):
+        with self.pool.connection() as conn:
+            return ride_events.ride_state(conn, ride_id)
+
+    async def tail_events(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                events = await self.run_db(self._events, self.last_event)
+            except Exception:
+                traceback.print_exc()
+                continue
+            for event in events:
+                self.bus.publish(event)
+                self.last_event = event['event_id']
+            if len(events) == ride_events.BATCH:
+                self._wake.set()
+
+    async def snapshot_balances(self):
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            try:
+                await self.run_db(self._call, lambda conn, *_: ledger.snapshot_balances(conn), {}, {}, {})
+            except Exception:
+                traceback.print_exc()
+
+    async def stream_events(self, writer, ride_id, target, headers):
+        # без Last-Event-ID (или ?since=) поток поездки начинается с её текущего
+        # состояния, общий поток - с новых событий; с ним - догоняет по журналу
+        query = {key: values[-1] for key, values in parse_qs(urlsplit(target).query).items()}
+        since = headers.get('last-event-id') or query.get('since')
+        try:
+            since = _int(since, 'since') if since else None
+            if len(self.bus) >= self.max_subscribers:
+                raise HttpError(503, "Слишком много подписчиков")
+        except HttpError as error:
+            writer.write(json_response(error.status, {"error": str(error)}))
+            await writer.drain()
+            return
+
+        topic = 'rides' if ride_id is None else f"ride:{ride_id}"
+        queue = self.bus.subscribe(topic)
+        try:
+            first = []
+            if since is None:
+                if ride_id is None:
+                    since = self.last_event
+                else:
+                    state = await self.run_db(self._ride_state, ride_id)
+                    if state is None:
+                        writer.write(json_response(404, {"error": "Поездка не найдена"}))
+                        await writer.drain()
+                        return
+                    first, since = [state], state['event_id']
+            writer.write(response_head(200, 'text/event-stream; charset=utf-8', False,
+                                       extra="Cache-Control: no-cache\r\n") + b"retry: 1000\n\n")
+            for event in first:
+                writer.write(ride_events.sse(event))
+            while True:
+                events = await self.run_db(self._events, since, ride_id)
+                for event in events:
+                    writer.write(ride_events.sse(event))
+                    since = event['event_id']
+                await writer.drain()
+                if len(events) < ride_events.BATCH:
+                    break
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    writer.write(b": ping\n\n")
+                    await writer.drain()
+                    continue
+                if event is None:
+                    # клиент не успевал читать: закрываем, он вернётся с Last-Event-ID
+                    break
+                if event['event_id'] <= since:
+                    continue
+                writer.write(ride_events.sse(event))
+                since = event['event_id']
+                await writer.drain()
+                if ride_id is not None and event['type'] == 'deleted':
+                    break
+        finally:
+            self.bus.unsubscribe(topic, queue)
+
+    async def dispatch(self, method, target, body):
+        url = urlsplit(target)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            handler, params = route(method, url.path.rstrip('/') or '/')
+            data = json.loads(body) if body else {}
+            if not isinstance(data, dict):
+                raise HttpError(400, "Ожидался JSON-объект")
+            # лишние запросы ждут не дольше queue_timeout, дальше - 503
+            try:
+                await asyncio.wait_for(self.limit.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise HttpError(503, "Сервис перегружен") from None
+            try:
+                result = await self.run_db(self._call, handler, params, query, data)
+            finally:
+                self.limit.release()
+                if method != 'GET':
+                    self._wake.set()
+        except HttpError as error:
+            return error.status, {"error": str(error)}
+        except json.JSONDecodeError:
+            return 400, {"error": "Некорректный JSON"}
+        except (ValueError, sqlite3.IntegrityError) as error:
+            return (409 if isinstance(error, sqlite3.IntegrityError) else 400), {"error": str(error)}
+        except TimeoutError:
+            return 503, {"error": "Нет свободных соединений с базой"}
+        except Exception:
+            traceback.print_exc()
+            return 500, {"error": "Внутренняя ошибка"}
+        if isinstance(result, tuple):
+            return result
+        return 200, result
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                stream = STREAM.match(urlsplit(target).path.rstrip('/')) if method == 'GET' else None
+                if stream:
+                    ride_id = stream.group('id')
+                    await self.stream_events(writer, int(ride_id) if ride_id else None, target, headers)
+                    break
+
+                length = int(headers.get('content-length') or 0)
+                if length > MAX_BODY:
+                    status, payload = 413, {"error": "Слишком большой запрос"}
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length) if length else b''
+                    status, payload = await self.dispatch(method, target, body)
+                    connection = headers.get('connection', '').lower()
+                    keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+
+                writer.write(json_response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host='127.0.0.1', port=8080):
+        await self.run_db(self._call, lambda conn, *_: app.create_tables(conn), {}, {}, {})
+        self.last_event = await self.run_db(self._call, lambda conn, *_: ride_events.last_event_id(conn), {}, {}, {})
+        self._tailer = asyncio.create_task(self.tail_events())
+        self._snapshots = asyncio.create_task(self.snapshot_balances())
+        if self.replica_interval:
+            await self.run_db(replica.enable, self.pool.path, None, self.replica_interval)
+        return await asyncio.start_server(self.handle, host, port)
+
+    def close(self):
+        if self._tailer is not None:
+            self._tailer.cancel()
+        if self._snapshots is not None:
+            self._snapshots.cancel()
+        replica.disable()
+        self.executor.shutdown(wait=True)
+        self.pool.close()
+
+async def serve(host, port, **options):
+    service = TaxiService(**options)
+    server = await service.start(host, port)
+    print(f"Сервис такси слушает http://{host}:{server.sockets[0].getsockname()[1]}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP JSON сервис такси")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--db-workers', type=int, default=8, help="потоков и соединений для SQLite")
+    parser.add_argument('--max-concurrency', type=int, default=64, help="одновременных запросов к базе")
+    parser.add_argument('--group-commit', action='store_true', help="записи через group_commit")
+    parser.add_argument('--replica', type=float, metavar='SECONDS',
+                        help="статистика по копии базы, обновляемой раз в SECONDS секунд")
+    args = parser.parse_args()
+
+    app.set_verbose(False)
+    if args.group_commit:
+        group_commit.enable()
+    try:
+        asyncio.run(serve(args.host, args.port, db_workers=args.db_workers, max_concurrency=args.max_concurrency,
+                          replica_interval=args.replica))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        group_commit.disable()
+
+if __name__ == "__main__":
+    main()
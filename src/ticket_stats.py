@@ -0,0 +1,150 @@
+import sys
+
+from db import connect, transaction
+
+# один проход по таблице вместо отдельного COUNT на каждый статус
+ONE_PASS_SQL = '''
+SELECT category, IFNULL(status, '') AS status, COUNT(*) AS count
+FROM support_tickets
+GROUP BY category, status
+'''
+
+COUNTERS_SQL = '''
+SELECT category, status, count
+FROM support_ticket_counters
+WHERE count <> 0
+'''
+
+COUNTERS_DDL = (
+    '''
+    CREATE TABLE IF NOT EXISTS support_ticket_counters (
+        category TEXT NOT NULL,
+        status TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (category, status)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS support_ticket_counters_insert
+    AFTER INSERT ON support_tickets
+    BEGIN
+        INSERT INTO support_ticket_counters (category, status, count)
+        VALUES (NEW.category, IFNULL(NEW.status, ''), 1)
+        ON CONFLICT (category, status) DO UPDATE SET count = count + 1;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS support_ticket_counters_update
+    AFTER UPDATE OF category, status ON support_tickets
+    WHEN OLD.category IS NOT NEW.category OR OLD.status IS NOT NEW.status
+    BEGIN
+        UPDATE support_ticket_counters SET count = count - 1
+        WHERE category = OLD.category AND status = IFNULL(OLD.status, '');
+        INSERT INTO support_ticket_counters (category, status, count)
+        VALUES (NEW.category, IFNULL(NEW.status, ''), 1)
+        ON CONFLICT (category, status) DO UPDATE SET count = count + 1;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS support_ticket_counters_delete
+    AFTER DELETE ON support_tickets
+    BEGIN
+        UPDATE support_ticket_counters SET count = count - 1
+        WHERE category = OLD.category AND status = IFNULL(OLD.status, '');
+    END
+    ''',
+)
+
+def counters_enabled(conn):
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'support_ticket_counters'"
+    )
+    return cursor.fetchone() is not None
+
+def _summarize(rows):
+    stats = {"total": 0, "open": 0, "in_progress": 0, "closed": 0, "categories": {}}
+    for category, status, count in rows:
+        stats["total"] += count
+        if status in ("open", "in_progress", "closed"):
+            stats[status] += count
+        stats["categories"][category] = stats["categories"].get(category, 0) + count
+    stats["categories"] = sorted(stats["categories"].items(), key=lambda item: -item[1])
+    return stats
+
+def compute_stats(conn):
+    cursor = conn.cursor()
+    cursor.execute(ONE_PASS_SQL)
+    return _summarize(cursor.fetchall())
+
+def get_stats(conn):
+    if not counters_enabled(conn):
+        return compute_stats(conn)
+    cursor = conn.cursor()
+    cursor.execute(COUNTERS_SQL)
+    return _summarize(cursor.fetchall())
+
+def rebuild_counters(conn):
+    with transaction(conn) as cursor:
+        cursor.execute("DELETE FROM support_ticket_counters")
+        cursor.execute(
+            "INSERT INTO support_ticket_counters (category, status, count) " + ONE_PASS_SQL
+        )
+
+def enable_counters(conn):
+    with transaction(conn) as cursor:
+        for ddl in COUNTERS_DDL:
+            cursor.execute(ddl)
+        rebuild_counters(conn)
+
+def disable_counters(conn):
+    with transaction(conn) as cursor:
+        for name in ("insert", "update", "delete"):
+            cursor.execute(f"DROP TRIGGER IF EXISTS support_ticket_counters_{name}")
+        cursor.execute("DROP TABLE IF EXISTS support_ticket_counters")
+
+def check_counters(conn, repair=True):
+    # счётчики сверяются с полным пересчётом в одной транзакции
+    with transaction(conn) as cursor:
+        cursor.execute(ONE_PASS_SQL)
+        actual = {(row[0], row[1]): row[2] for row in cursor.fetchall()}
+        cursor.execute(COUNTERS_SQL)
+        stored = {(row[0], row[1]): row[2] for row in cursor.fetchall()}
+        mismatches = {
+            key: (stored.get(key, 0), actual.get(key, 0))
+            for key in actual.keys() | stored.keys()
+            if stored.get(key, 0) != actual.get(key, 0)
+        }
+        if mismatches and repair:
+            rebuild_counters(conn)
+    return mismatches
+
+def main():
+    commands = ("enable", "disable", "check")
+    if len(sys.argv) != 2 or sys.argv[1] not in commands:
+        print(f"Использование: python {sys.argv[0]} {'|'.join(commands)}")
+        sys.exit(2)
+
+    conn = connect()
+    command = sys.argv[1]
+    if command == "enable":
+        enable_counters(conn)
+        print("Счётчики обращений включены")
+    elif command == "disable":
+        disable_counters(conn)
+        print("Счётчики обращений отключены")
+    else:
+        if not counters_enabled(conn):
+            print("Счётчики обращений не включены")
+            sys.exit(1)
+        mismatches = check_counters(conn)
+        for (category, status), (stored, actual) in sorted(mismatches.items()):
+            print(f"{category}/{status or '-'}: было {stored}, должно быть {actual}")
+        if mismatches:
+            print("Счётчики пересчитаны")
+            sys.exit(1)
+        print("Счётчики совпадают с таблицей support_tickets")
+    conn.close()
+
+if __name__ == "__main__":
+    main()